@@ -0,0 +1,112 @@
+"""Module containing a structured access log, written in the background."""
+from json import dumps
+from queue import Empty, Full, Queue
+from random import random
+from threading import Lock, Thread
+from time import gmtime, strftime
+import sys
+from .Metrics import Metrics
+
+
+class AccessLog:
+    """Class to log a sample of requests as JSON lines, off the hot path.
+
+    Used as a Metrics hook, so it is called with the timing of every
+    request, of which a fraction sample_rate are logged (server errors are
+    always logged). Entries are queued, and a writer thread formats and
+    writes everything queued in one go, so serving a request never waits
+    for the output. When the queue is full, entries are dropped and
+    counted.
+    """
+
+    QUEUE_SIZE = 10000  # entries waiting to be written
+
+    def __init__(self, stream=None, sample_rate=1.0, queue_size=None):
+        """Initialise an access log.
+
+        Args:
+            stream (file): The stream to write to. Default is None, which
+                writes to whatever sys.stdout is when an entry is written.
+            sample_rate (float): The fraction of requests logged, from 0 to
+                1. Default is 1.0, logging every request.
+            queue_size (int): The number of entries allowed to wait to be
+                written. Default is AccessLog.QUEUE_SIZE.
+        """
+        self.stream = stream
+        self.sample_rate = sample_rate
+        self.queue = Queue(self.QUEUE_SIZE if queue_size is None
+                           else queue_size)
+        self.dropped = 0
+        self.writer = None
+        self.writer_lock = Lock()
+
+    def __call__(self, timing):
+        """Log a request, if it is sampled.
+
+        Args:
+            timing (Metrics.RequestTiming): The request's timing.
+        """
+        if timing.status_code is not None and timing.status_code < 500 and \
+                (self.sample_rate <= 0 or
+                 (self.sample_rate < 1 and random() >= self.sample_rate)):
+            return
+        self.log({
+            "time": timing.started_at,
+            "client": "{}:{}".format(*timing.address[:2]),
+            "method": timing.method,
+            "uri": timing.uri,
+            "status": timing.status_code,
+            "bytes": timing.bytes_sent,
+            "ms": round(timing.duration() * 1000, 3),
+            "phases_ms": {phase: round(getattr(timing, phase) * 1000, 3)
+                          for phase in Metrics.PHASES}
+        })
+
+    def log(self, entry):
+        """Queue an entry to be written.
+
+        Args:
+            entry (dict): The JSON serialisable entry. A "time" field, in
+                seconds since the epoch, is written in ISO 8601 format.
+        """
+        # the writer is started by the process which serves, e.g. after
+        # forking
+        if self.writer is None:
+            with self.writer_lock:
+                if self.writer is None:
+                    self.writer = Thread(target=self._write, daemon=True)
+                    self.writer.start()
+        try:
+            self.queue.put_nowait(entry)
+        except Full:
+            self.dropped += 1
+
+    @staticmethod
+    def _format(entry):
+        """Format an entry as a JSON line.
+
+        Returns:
+            string: The line, without a newline.
+        """
+        if "time" in entry:
+            entry["time"] = strftime("%Y-%m-%dT%H:%M:%S", gmtime(
+                entry["time"])) + ".{:03d}Z".format(
+                    int(entry["time"] % 1 * 1000))
+        return dumps(entry)
+
+    def _write(self):
+        """Continually write queued entries, in batches."""
+        while True:
+            entries = [self.queue.get()]
+            try:
+                while True:
+                    entries.append(self.queue.get_nowait())
+            except Empty:
+                pass
+            stream = sys.stdout if self.stream is None else self.stream
+            try:
+                stream.write("".join(self._format(entry) + "\n"
+                                     for entry in entries))
+                stream.flush()
+            except (OSError, ValueError):
+                self.dropped += len(entries)
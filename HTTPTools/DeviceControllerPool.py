@@ -0,0 +1,230 @@
+"""Module containing a pool which runs commands on smart device controllers."""
+from collections import OrderedDict
+from importlib import import_module
+from queue import Queue
+from threading import Lock, Thread
+from time import sleep
+
+
+class DeviceControllerPool:
+    """Class to run the setters of device controllers on worker threads.
+
+    Each property of a device's state file may declare a controller: "eval"
+    constructs it, e.g. "AutoBlind.BlindController(...,{})", with "params"
+    in place of "{}", and "setter" sets the property, e.g.
+    "set_percentage({})", with the property's new value in place of "{}".
+
+    The controller is constructed once and reused for every later command,
+    and the setter is compiled once. Commands to a device are queued in
+    order and run one at a time, while different devices run concurrently.
+    A queued command for a property is replaced by any newer command for the
+    same property, so a slow device is only ever sent the latest setpoint.
+    """
+
+    WORKERS = 4  # threads running controller commands
+
+    class FakeController:
+        """Class standing in for a real controller, for use without hardware.
+
+        Any method called on it is recorded, after sleeping for DELAY
+        seconds to simulate the time taken to reach the device.
+        """
+
+        DELAY = 0.0  # seconds taken by each call
+
+        def __init__(self, spec=None, delay=None):
+            """Initialise a FakeController.
+
+            Args:
+                spec (dict): The controller spec it stands in for.
+                delay (float): The seconds taken by each call.
+                    Default is FakeController.DELAY.
+            """
+            self.spec = spec
+            self.delay = self.DELAY if delay is None else delay
+            self.calls = []
+
+        def __getattr__(self, name):
+            """Find a method which records its calls.
+
+            Args:
+                name (string): The name of the method.
+
+            Returns:
+                function: The recording method.
+            """
+            if name.startswith("__"):
+                raise AttributeError(name)
+
+            def record(*args):
+                if self.delay:
+                    sleep(self.delay)
+                self.calls.append((name,) + args)
+            return record
+
+    class Controller:
+        """Class to store a constructed controller and its compiled setter."""
+
+        def __init__(self, spec, controller):
+            """Initialise a Controller.
+
+            Args:
+                spec (dict): The controller spec it was constructed from.
+                controller: The constructed controller.
+            """
+            self.spec = spec
+            self.controller = controller
+            setter = spec["setter"]
+            if spec.get("setter_needs_state", True):
+                setter = setter.format("value")
+            self.setter = compile("controller." + setter, "<setter>", "eval")
+
+        def set(self, value):
+            """Call the setter of the controller.
+
+            Args:
+                value: The new value of the property.
+            """
+            eval(self.setter, {"__builtins__": {}},
+                 {"controller": self.controller, "value": value})
+
+    class Device:
+        """Class to store the queued commands of a device."""
+
+        def __init__(self):
+            """Initialise a Device with no queued commands."""
+            self.pending = OrderedDict()  # instance -> (spec, value)
+            self.scheduled = False  # queued for, or held by, a worker
+
+    def __init__(self, workers=None, controller_factory=None):
+        """Initialise a DeviceControllerPool.
+
+        The worker threads are started when the first command is submitted.
+
+        Args:
+            workers (int): The number of worker threads.
+                Default is DeviceControllerPool.WORKERS.
+            controller_factory (function): Called with a controller spec
+                (dict) to construct a controller. Default is
+                DeviceControllerPool.build_controller.
+        """
+        self.workers = self.WORKERS if workers is None else workers
+        self.controller_factory = (self.build_controller
+                                   if controller_factory is None
+                                   else controller_factory)
+        self.lock = Lock()
+        self.ready = Queue()  # endpointIds with commands to run
+        self.devices = {}  # endpointId -> Device
+        self.controllers = {}  # (endpointId, instance) -> Controller
+        self.started = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.executed = 0
+        self.failed = 0
+
+    @staticmethod
+    def build_controller(spec):
+        """Construct a controller from its spec.
+
+        Args:
+            spec (dict): The controller spec, from a device's state file.
+
+        Returns:
+            The constructed controller.
+        """
+        expression = spec["eval"].format("params")
+        module_name = expression.split(".", 1)[0].split("(", 1)[0].strip()
+        namespace = {module_name: import_module(module_name),
+                     "params": spec.get("params", {})}
+        return eval(expression, {"__builtins__": {}}, namespace)
+
+    def submit(self, endpoint_id, instance, spec, value):
+        """Queue a command setting a property of a device.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+            instance (string): The instance of the property being set.
+            spec (dict): The controller spec of the property.
+            value: The new value of the property.
+        """
+        with self.lock:
+            if not self.started:
+                for _ in range(self.workers):
+                    Thread(target=self._work, daemon=True).start()
+                self.started = True
+
+            device = self.devices.setdefault(endpoint_id, self.Device())
+            self.submitted += 1
+            if instance in device.pending:
+                self.coalesced += 1
+            device.pending[instance] = (spec, value)
+            if device.scheduled:
+                return
+            device.scheduled = True
+        self.ready.put(endpoint_id)
+
+    def _get_controller(self, endpoint_id, instance, spec):
+        """Find the controller of a property, constructing it if needed.
+
+        Only called by the worker running the device's commands.
+
+        Returns:
+            DeviceControllerPool.Controller: The controller.
+        """
+        key = (endpoint_id, instance)
+        controller = self.controllers.get(key)
+        if controller is None or controller.spec != spec:
+            controller = self.Controller(spec, self.controller_factory(spec))
+            self.controllers[key] = controller
+        return controller
+
+    def _work(self):
+        """Run queued commands, one device at a time, forever."""
+        while True:
+            endpoint_id = self.ready.get()
+            with self.lock:
+                device = self.devices[endpoint_id]
+                instance, (spec, value) = device.pending.popitem(last=False)
+
+            try:
+                self._get_controller(endpoint_id, instance, spec).set(value)
+                succeeded = True
+            except Exception as msg:
+                print("Controller of {} failed: {}".format(endpoint_id, msg))
+                succeeded = False
+
+            with self.lock:
+                if succeeded:
+                    self.executed += 1
+                else:
+                    self.failed += 1
+                # let other devices run before this one's next command
+                device.scheduled = bool(device.pending)
+            if device.scheduled:
+                self.ready.put(endpoint_id)
+
+    def wait(self):
+        """Wait until every queued command has been run."""
+        while True:
+            with self.lock:
+                if not any(device.scheduled
+                           for device in self.devices.values()):
+                    return
+            sleep(0.001)
+
+    def stats(self):
+        """Take a snapshot of the pool's statistics.
+
+        Returns:
+            dict: Counts of submitted, coalesced, executed and failed
+                commands, and of the devices with queued commands.
+        """
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "executed": self.executed,
+                "failed": self.failed,
+                "queued_devices": sum(device.scheduled for device
+                                      in self.devices.values())
+            }
@@ -0,0 +1,213 @@
+"""Module containing a hub which fans out device state changes."""
+from collections import deque
+from itertools import islice
+from json import dumps
+from threading import Condition
+from time import monotonic
+
+
+class DeviceEventHub:
+    """Class to pass changes of device state to any number of subscribers.
+
+    Each change is serialised once, when it is published, and the same
+    bytes are sent to every subscriber. The last HISTORY_SIZE changes are
+    kept, so that a subscriber which reconnects can catch up on the changes
+    it missed.
+
+    When several processes serve subscribers, each hub is given a relay,
+    which passes published changes to one process to be numbered and sent
+    back to every hub (see receive()), so that every process streams the
+    same changes with the same IDs.
+    """
+
+    HISTORY_SIZE = 1024  # changes kept for subscribers to catch up on
+    HEARTBEAT_INTERVAL = 15  # seconds between messages to idle subscribers
+    MAX_SUBSCRIBERS = 256  # streams and long polls open at once
+    RETRY = 1000  # milliseconds an EventSource waits to reconnect
+
+    class Event:
+        """Class to store a single change of device state."""
+
+        def __init__(self, event_id, endpoint_id, data):
+            """Initialise an Event, serialising it as a server-sent event.
+
+            Args:
+                event_id (int): The sequence number of the change.
+                endpoint_id (string): The endpointId of the changed device.
+                data (dict): The changed properties of the device.
+            """
+            self.id = event_id
+            self.endpoint_id = endpoint_id
+            self.data = data
+            self.frame = "id: {}\nevent: change\ndata: {}\n\n".format(
+                event_id, dumps(data)).encode("utf-8")
+
+    def __init__(self, history_size=None, heartbeat_interval=None):
+        """Initialise a hub with no changes or subscribers.
+
+        Args:
+            history_size (int): The number of changes kept.
+                Default is DeviceEventHub.HISTORY_SIZE.
+            heartbeat_interval (float): The seconds between messages to idle
+                subscribers. Default is DeviceEventHub.HEARTBEAT_INTERVAL.
+        """
+        self.events = deque(maxlen=self.HISTORY_SIZE if history_size is None
+                            else history_size)
+        self.heartbeat_interval = (self.HEARTBEAT_INTERVAL
+                                   if heartbeat_interval is None
+                                   else heartbeat_interval)
+        self.condition = Condition()
+        self.last_id = 0
+        self.subscribers = 0
+        self.relay = None  # function passing changes to other processes
+
+    def publish(self, endpoint_id, properties):
+        """Pass a change of a device's properties to every subscriber.
+
+        Args:
+            endpoint_id (string): The endpointId of the changed device.
+            properties (list(dict)): The changed properties, each with a
+                name, instance and value.
+
+        Returns:
+            DeviceEventHub.Event: The published change, or None if it was
+                passed to the relay, to be received later.
+        """
+        data = {"endpointId": endpoint_id, "properties": properties}
+        if self.relay is not None:
+            self.relay(data)
+            return None
+        with self.condition:
+            return self._add(self.last_id + 1, data)
+
+    def receive(self, event_id, data):
+        """Pass a change numbered by another process to every subscriber.
+
+        Args:
+            event_id (int): The sequence number of the change.
+            data (dict): The change, as passed to the relay.
+
+        Returns:
+            DeviceEventHub.Event: The published change.
+        """
+        with self.condition:
+            if event_id != self.last_id + 1:
+                # kept changes must be numbered consecutively
+                self.events.clear()
+            return self._add(event_id, data)
+
+    def _add(self, event_id, data):
+        """Keep a change and wake every subscriber.
+
+        Must be called while holding the condition.
+
+        Returns:
+            DeviceEventHub.Event: The change.
+        """
+        self.last_id = event_id
+        event = self.Event(event_id, data["endpointId"], data)
+        self.events.append(event)
+        self.condition.notify_all()
+        return event
+
+    def _events_after(self, last_id, endpoint_ids):
+        """Find the kept changes published after a given change.
+
+        Must be called while holding the condition.
+
+        Returns:
+            list(DeviceEventHub.Event): The changes, oldest first.
+        """
+        start = max(0, len(self.events) - (self.last_id - last_id))
+        return [event for event in islice(self.events, start, None)
+                if endpoint_ids is None or event.endpoint_id in endpoint_ids]
+
+    def resume_id(self, last_event_id=None):
+        """Find where a subscriber should start receiving changes.
+
+        Args:
+            last_event_id (int): The last change the subscriber received,
+                or None to only receive future changes.
+
+        Returns:
+            int: The ID of the last change the subscriber has seen.
+        """
+        with self.condition:
+            if last_event_id is None or not 0 <= last_event_id <= \
+                    self.last_id:
+                return self.last_id
+            return last_event_id
+
+    def wait(self, last_id, endpoint_ids=None, timeout=None):
+        """Wait for changes published after a given change.
+
+        Args:
+            last_id (int): The ID of the last change already seen.
+            endpoint_ids (set(string)): The devices of interest, or None for
+                every device.
+            timeout (float): The most seconds to wait, or None to wait
+                until a change is published.
+
+        Returns:
+            tuple: The changes (list(DeviceEventHub.Event)), which is empty
+                if none were published within the timeout, and the ID of the
+                last change seen (int).
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self.condition:
+            while True:
+                if last_id < self.last_id:
+                    events = self._events_after(last_id, endpoint_ids)
+                    last_id = self.last_id
+                    if events:
+                        return events, last_id
+                remaining = None if deadline is None \
+                    else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return [], last_id
+                self.condition.wait(remaining)
+
+    def try_subscribe(self):
+        """Reserve a place for a subscriber, if the hub has room.
+
+        Streams and long polls both hold a place while they are open, and
+        each place reserved must be given back with release().
+
+        Returns:
+            bool: True if a place was reserved, False if the hub is full.
+        """
+        with self.condition:
+            if self.subscribers >= self.MAX_SUBSCRIBERS:
+                return False
+            self.subscribers += 1
+            return True
+
+    def release(self):
+        """Give back a place reserved by try_subscribe()."""
+        with self.condition:
+            self.subscribers -= 1
+
+    def subscribe(self, last_id, endpoint_ids=None):
+        """Stream changes as server-sent events, until closed.
+
+        Idle subscribers are sent a comment every heartbeat_interval, so
+        that closed connections are noticed. The subscriber's place must
+        already be reserved with try_subscribe().
+
+        Args:
+            last_id (int): The ID of the last change already seen, see
+                resume_id().
+            endpoint_ids (set(string)): The devices of interest, or None for
+                every device.
+
+        Yields:
+            byte string: The next part of the event stream.
+        """
+        yield "retry: {}\n\n".format(self.RETRY).encode("utf-8")
+        while True:
+            events, last_id = self.wait(last_id, endpoint_ids,
+                                        self.heartbeat_interval)
+            if events:
+                yield b"".join(event.frame for event in events)
+            else:
+                yield b": keep-alive\n\n"
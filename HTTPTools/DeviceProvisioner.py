@@ -0,0 +1,311 @@
+"""Module containing a tool to provision smart devices from a template.
+
+Usage: python -m HTTPTools.DeviceProvisioner PARAMETERS [--template FILE]
+           [--devices-file FILE] [--state-dir DIR] [--replace] [--dry-run]
+"""
+from argparse import ArgumentParser
+from csv import DictReader
+from json import dumps, loads
+from os import path
+from time import perf_counter
+import re
+import sys
+from .DeviceStateStore import DeviceStateStore
+from .DirectiveSchema import DirectiveSchema
+
+
+class DeviceProvisioner:
+    """Class to stamp out devices from a template and add them to the registry.
+
+    A template holds an "endpoint", as listed in the devices file, and the
+    "properties" of the device's state file, with PLACEHOLDER in place of
+    each value which differs between devices. Each row of a parameter table
+    fills in one device: columns named after endpoint fields (e.g.
+    friendlyName) set those fields, and any other column sets the controller
+    parameter of the same name (e.g. mac_address) of every property.
+
+    New devices are validated, then their state files and the updated
+    devices file are written atomically, so a running server either sees
+    all of them or none.
+    """
+
+    PLACEHOLDER = "INVALID"
+    TEMPLATE = "Smart_Devices/templates/smart_blind.json"
+    DEVICES_FILE = "Smart_Devices/Smart_Devices.json"
+    STATE_DIRECTORY = "Smart_Devices"
+    ENDPOINT_FIELDS = ("endpointId", "friendlyName", "description",
+                       "manufacturerName")
+    MAC_ADDRESS = re.compile(r"^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$")
+
+    class ProvisioningError(Exception):
+        """Exception raised when devices cannot be provisioned."""
+
+        def __init__(self, problems):
+            """Initialise a ProvisioningError.
+
+            Args:
+                problems (list(string)): A description of each problem.
+            """
+            Exception.__init__(self, "{} problem(s) found:\n{}".format(
+                len(problems), "\n".join(problems)))
+            self.problems = problems
+
+    def __init__(self, template_file=None):
+        """Initialise a DeviceProvisioner from a template file.
+
+        Args:
+            template_file (string): The path to the device template.
+                Default is DeviceProvisioner.TEMPLATE.
+        """
+        with open(self.TEMPLATE if template_file is None
+                  else template_file, "r") as input_file:
+            template = loads(input_file.read())
+
+        # parsing the serialised template is faster than deep-copying it
+        self.template = dumps(template)
+        self.parameter_types = {}  # controller parameter -> type
+        for device_property in template.get("properties", []):
+            params = device_property.get("controller", {}).get("params", {})
+            for name, value in params.items():
+                self.parameter_types[name] = type(value)
+
+    @staticmethod
+    def read_parameters(parameters_file):
+        """Read a parameter table, from a CSV or JSON lines file.
+
+        Args:
+            parameters_file (string): The path to the table. Files ending in
+                ".csv" are read as CSV with a header row, other files as one
+                JSON object per line.
+
+        Returns:
+            list(dict): The parameters of each device.
+        """
+        with open(parameters_file, "r", newline="") as input_file:
+            if parameters_file.lower().endswith(".csv"):
+                return [dict(row) for row in DictReader(input_file)]
+            return [loads(line) for line in input_file if line.strip()]
+
+    def _coerce(self, name, value):
+        """Convert a parameter from the table to the template's type.
+
+        Returns:
+            The converted value.
+        """
+        parameter_type = self.parameter_types.get(name, str)
+        if isinstance(value, parameter_type) or not isinstance(value, str):
+            return value
+        if parameter_type is bool:
+            return value.strip().lower() in ("1", "true", "yes")
+        return parameter_type(value)
+
+    def stamp(self, parameters):
+        """Make a device from the template and one row of parameters.
+
+        Args:
+            parameters (dict): The device's parameters. Empty values are
+                ignored.
+
+        Returns:
+            dict: The device, with its "endpoint" and "properties".
+
+        Raises:
+            DeviceProvisioner.ProvisioningError: If a parameter is unknown
+                or has the wrong type.
+        """
+        device = loads(self.template)
+        endpoint = device["endpoint"]
+        for name, value in parameters.items():
+            if value is None or value == "":
+                continue
+            if name in self.ENDPOINT_FIELDS:
+                endpoint[name] = value
+                continue
+            if name not in self.parameter_types:
+                raise self.ProvisioningError(
+                    ["unknown parameter: {}".format(name)])
+            try:
+                value = self._coerce(name, value)
+            except ValueError:
+                raise self.ProvisioningError(
+                    ["invalid {}: {}".format(name, value)])
+            for device_property in device.get("properties", []):
+                params = device_property.get("controller", {}) \
+                    .get("params", {})
+                if name in params:
+                    params[name] = value
+        return device
+
+    def _find_placeholders(self, value, location):
+        """Find the locations of placeholders left in part of a device.
+
+        Returns:
+            list(string): The locations, e.g. "endpoint.friendlyName".
+        """
+        if value == self.PLACEHOLDER:
+            return [location]
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, list):
+            items = enumerate(value)
+        else:
+            return []
+        return [found for key, item in items for found
+                in self._find_placeholders(item,
+                                           "{}.{}".format(location, key))]
+
+    def validate(self, device):
+        """Check a stamped device against the capability schema.
+
+        Args:
+            device (dict): The device, with its "endpoint" and "properties".
+
+        Returns:
+            list(string): The problems found, if any.
+        """
+        endpoint = device["endpoint"]
+        problems = ["{} is not set".format(location) for location
+                    in self._find_placeholders(device, "device")]
+        if not DeviceStateStore.is_valid_endpoint_id(
+                endpoint.get("endpointId")):
+            problems.append("endpointId must be a plain file name")
+
+        instances = {}
+        for capability in endpoint.get("capabilities", []):
+            problems += DirectiveSchema.check_capability(capability)
+            if isinstance(capability, dict) and "instance" in capability:
+                instances[capability["instance"]] = capability
+
+        for device_property in device.get("properties", []):
+            instance = device_property.get("instance")
+            if instance is not None and instance not in instances:
+                problems.append("property {} has no capability".format(
+                    instance))
+            value = device_property.get("value", {})
+            if not value.get("min", 0) <= value.get("current", 0) <= \
+                    value.get("max", 0):
+                problems.append("property {} is out of range".format(
+                    instance))
+            params = device_property.get("controller", {}).get("params", {})
+            mac_address = params.get("mac_address")
+            if mac_address is not None and \
+                    not self.MAC_ADDRESS.match(str(mac_address)):
+                problems.append("invalid mac_address: {}".format(
+                    mac_address))
+        return problems
+
+    def provision(self, rows, devices_file=None, state_directory=None,
+                  replace=False, dry_run=False):
+        """Stamp, validate and add devices to the registry.
+
+        Nothing is written unless every device is valid.
+
+        Args:
+            rows (list(dict)): The parameters of each device.
+            devices_file (string): The devices file to add the devices to.
+                Default is DeviceProvisioner.DEVICES_FILE.
+            state_directory (string): The directory of the state files.
+                Default is DeviceProvisioner.STATE_DIRECTORY.
+            replace (bool): Whether to replace existing devices with the
+                same endpointId, rather than rejecting them.
+            dry_run (bool): Whether to only validate the devices.
+
+        Returns:
+            dict: The number of devices added and replaced.
+
+        Raises:
+            DeviceProvisioner.ProvisioningError: If any device is invalid.
+        """
+        devices_file = self.DEVICES_FILE if devices_file is None \
+            else devices_file
+        state_directory = self.STATE_DIRECTORY if state_directory is None \
+            else state_directory
+
+        try:
+            with open(devices_file, "r") as input_file:
+                registry = loads(input_file.read())
+        except FileNotFoundError:
+            registry = {"endpoints": []}
+        positions = {endpoint["endpointId"]: position for position, endpoint
+                     in enumerate(registry["endpoints"])}
+
+        problems = []
+        devices = []
+        new_ids = set()
+        for number, row in enumerate(rows, 1):
+            try:
+                device = self.stamp(row)
+            except self.ProvisioningError as error:
+                problems += ["row {}: {}".format(number, problem)
+                             for problem in error.problems]
+                continue
+            endpoint_id = device["endpoint"]["endpointId"]
+            device_problems = self.validate(device)
+            if endpoint_id in new_ids:
+                device_problems.append("duplicate endpointId")
+            elif endpoint_id in positions and not replace:
+                device_problems.append("endpointId already registered")
+            elif path.abspath(path.join(state_directory, "{}.json".format(
+                    endpoint_id))) == path.abspath(devices_file):
+                device_problems.append("endpointId names the devices file")
+            new_ids.add(endpoint_id)
+            problems += ["row {} ({}): {}".format(number, endpoint_id,
+                                                  problem)
+                         for problem in device_problems]
+            devices.append(device)
+        if problems:
+            raise self.ProvisioningError(problems)
+
+        replaced = sum(device["endpoint"]["endpointId"] in positions
+                       for device in devices)
+        if dry_run:
+            return {"added": len(devices) - replaced, "replaced": replaced}
+
+        for device in devices:
+            endpoint = device["endpoint"]
+            position = positions.get(endpoint["endpointId"])
+            if position is None:
+                registry["endpoints"].append(endpoint)
+            else:
+                registry["endpoints"][position] = endpoint
+
+        # state files first, so the registry never lists a device without
+        # its state
+        DeviceStateStore.write_many_atomically([
+            (path.join(state_directory,
+                       device["endpoint"]["endpointId"] + ".json"),
+             {"properties": device.get("properties", [])})
+            for device in devices
+        ])
+        DeviceStateStore.write_atomically(devices_file, registry)
+        return {"added": len(devices) - replaced, "replaced": replaced}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Provision smart devices from a template.")
+    parser.add_argument("parameters",
+                        help="CSV or JSON lines table of device parameters")
+    parser.add_argument("--template", default=DeviceProvisioner.TEMPLATE)
+    parser.add_argument("--devices-file",
+                        default=DeviceProvisioner.DEVICES_FILE)
+    parser.add_argument("--state-dir",
+                        default=DeviceProvisioner.STATE_DIRECTORY)
+    parser.add_argument("--replace", action="store_true",
+                        help="replace devices which are already registered")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="validate the devices without writing them")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    provisioner = DeviceProvisioner(args.template)
+    try:
+        summary = provisioner.provision(
+            provisioner.read_parameters(args.parameters), args.devices_file,
+            args.state_dir, args.replace, args.dry_run)
+    except DeviceProvisioner.ProvisioningError as error:
+        print(error)
+        sys.exit(1)
+    print("{} added, {} replaced in {:.2f}s{}".format(
+        summary["added"], summary["replaced"], perf_counter() - start,
+        " (dry run)" if args.dry_run else ""))
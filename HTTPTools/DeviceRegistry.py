@@ -0,0 +1,210 @@
+"""Module containing an indexed, in-memory registry of smart devices."""
+from hashlib import blake2b
+from json import dumps, loads
+from os import stat
+from threading import Lock
+from time import monotonic
+from .DirectiveSchema import DirectiveSchema
+
+
+class DeviceRegistry:
+    """Class to hold the smart devices file in memory, indexed for lookups.
+
+    The file is loaded once and only reloaded when its modification time or
+    size changes, which is checked at most once every CHECK_INTERVAL
+    seconds. Lookups never touch the disk otherwise.
+
+    Directive validators are compiled from the capabilities of the devices
+    each time the file is loaded. The discovery response is serialised once
+    per load of the file. Each endpoint is serialised separately, so after a
+    reload only the endpoints which changed are serialised again.
+    """
+
+    CHECK_INTERVAL = 1  # seconds between checks of the file for changes
+
+    class Index:
+        """Class to store the parsed devices file and its lookup tables."""
+
+        def __init__(self, devices, previous=None):
+            """Index the endpoints and capabilities of the devices.
+
+            Args:
+                devices (dict): The parsed devices file.
+                previous (DeviceRegistry.Index): The index of the previous
+                    load of the file, whose serialised endpoints are reused
+                    where unchanged.
+            """
+            self.devices = devices
+            # only an index with serialised endpoints is worth keeping, so
+            # reloads without discovery in between do not chain indexes
+            if previous is not None and previous.fragments is None:
+                previous = previous.previous
+            self.previous = previous
+            self.fragments = None  # endpointId -> (endpoint, bytes)
+            self.discovery = None  # (payload, etag), built on first use
+            self.endpoints = {}  # endpointId -> endpoint
+            self.capabilities = {}  # (endpointId, interface, instance) -> cap
+            self.interfaces = set()  # (endpointId, interface)
+            self.validators = {}  # (endpointId, interface, instance) -> fn
+            for endpoint in devices["endpoints"]:
+                endpoint_id = endpoint["endpointId"]
+                self.endpoints[endpoint_id] = endpoint
+                for capability in endpoint["capabilities"]:
+                    interface = capability["interface"]
+                    key = (endpoint_id, interface, capability.get("instance"))
+                    self.capabilities[key] = capability
+                    self.interfaces.add((endpoint_id, interface))
+                    validator = DirectiveSchema.compile(capability)
+                    if validator is not None:
+                        self.validators[key] = validator
+
+        def get_discovery(self):
+            """Find the serialised discovery response, building it if needed.
+
+            Concurrent first calls may both build it, with identical results.
+
+            Returns:
+                tuple: The payload (byte string) and its quoted entity tag.
+            """
+            discovery = self.discovery
+            if discovery is not None:
+                return discovery
+
+            previous = {} if self.previous is None or \
+                self.previous.fragments is None else self.previous.fragments
+            fragments = {}
+            for endpoint in self.devices["endpoints"]:
+                endpoint_id = endpoint["endpointId"]
+                reused = previous.get(endpoint_id)
+                if reused is None or reused[0] != endpoint:
+                    reused = (endpoint, dumps(endpoint).encode("utf-8"))
+                fragments[endpoint_id] = reused
+
+            # splice the serialised endpoints into the rest of the file
+            others = {key: value for key, value in self.devices.items()
+                      if key != "endpoints"}
+            prefix = dumps(others)[:-1] + (", " if others else "")
+            payload = b"".join([
+                prefix.encode("utf-8"), b'"endpoints": [',
+                b", ".join(fragment for _, fragment in fragments.values()),
+                b"]}"
+            ])
+            etag = '"' + blake2b(payload, digest_size=8).hexdigest() + '"'
+
+            self.fragments = fragments
+            self.previous = None
+            self.discovery = (payload, etag)
+            return self.discovery
+
+    def __init__(self, devices_file, check_interval=None):
+        """Initialise a registry of the devices in a file.
+
+        The file is loaded on first use.
+
+        Args:
+            devices_file (string): The path to the devices file.
+            check_interval (float): The seconds between checks of the file
+                for changes. Default is DeviceRegistry.CHECK_INTERVAL.
+        """
+        self.devices_file = devices_file
+        self.check_interval = (self.CHECK_INTERVAL if check_interval is None
+                               else check_interval)
+        self.lock = Lock()
+        self.index = None
+        self.file_key = None  # modification time and size of the file
+        self.checked_at = None
+        self.version = 0  # incremented whenever the file is reloaded
+
+    def _refresh(self):
+        """Reload the devices file, if it may have changed.
+
+        Returns:
+            DeviceRegistry.Index: The current index.
+        """
+        checked_at = self.checked_at
+        if (checked_at is not None
+                and monotonic() - checked_at < self.check_interval):
+            return self.index
+
+        with self.lock:
+            # another thread may have refreshed the index meanwhile
+            if self.checked_at != checked_at:
+                return self.index
+            try:
+                status = stat(self.devices_file)
+            except OSError:
+                if self.index is None:
+                    raise
+                self.checked_at = monotonic()
+                return self.index
+
+            file_key = (status.st_mtime_ns, status.st_size)
+            if file_key != self.file_key:
+                with open(self.devices_file, "r") as input_file:
+                    devices = loads(input_file.read())
+                self.index = self.Index(devices, self.index)
+                self.file_key = file_key
+                self.version += 1
+            self.checked_at = monotonic()
+            return self.index
+
+    def get_index(self):
+        """Find the current index, so that many lookups can use one version.
+
+        Returns:
+            DeviceRegistry.Index: The current index.
+        """
+        return self._refresh()
+
+    def get_devices(self):
+        """Find the contents of the devices file.
+
+        Returns:
+            dict: The parsed devices file.
+        """
+        return self._refresh().devices
+
+    def get_discovery(self):
+        """Find the serialised discovery response.
+
+        Returns:
+            tuple: The payload (byte string) and its quoted entity tag.
+        """
+        return self._refresh().get_discovery()
+
+    def find_endpoint(self, endpoint_id):
+        """Find an endpoint by its ID.
+
+        Args:
+            endpoint_id (string): The endpointId of the endpoint.
+
+        Returns:
+            dict: The endpoint, or None if it was not found.
+        """
+        return self._refresh().endpoints.get(endpoint_id)
+
+    def find_capability(self, endpoint_id, interface, instance=None):
+        """Find a capability of an endpoint.
+
+        Args:
+            endpoint_id (string): The endpointId of the endpoint.
+            interface (string): The interface of the capability.
+            instance (string): The instance of the capability, if it has one.
+
+        Returns:
+            dict: The capability, or None if it was not found.
+        """
+        return self._refresh().capabilities.get(
+            (endpoint_id, interface, instance))
+
+    def has_interface(self, endpoint_id, interface):
+        """Check whether an endpoint has a capability with an interface.
+
+        Args:
+            endpoint_id (string): The endpointId of the endpoint.
+            interface (string): The interface to check for.
+
+        Returns:
+            bool: True if the endpoint has the interface.
+        """
+        return (endpoint_id, interface) in self._refresh().interfaces
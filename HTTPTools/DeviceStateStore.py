@@ -0,0 +1,348 @@
+"""Module containing a store of the state of each smart device."""
+from contextlib import contextmanager
+from copy import deepcopy
+from json import dumps, loads
+from os import (O_CREAT, O_RDONLY, O_RDWR, chmod, close, fdopen, fstat, fsync,
+                open as open_fd, path, remove, replace, stat)
+from tempfile import mkstemp
+from threading import Lock
+try:
+    from fcntl import LOCK_EX, flock
+except ImportError:
+    flock = None
+from .ReadWriteLock import ReadWriteLock
+
+
+class DeviceStateStore:
+    """Class to read and atomically update the state files of smart devices.
+
+    The state of each device is kept in "<directory>/<endpointId>.json". It
+    is loaded once, then served from memory: many threads may read a
+    device's state at once, while updates to a device are serialised.
+    Updates to different devices never block each other.
+
+    Each update is written to a temporary file, which then replaces the
+    state file, so a crash never leaves a partially written state file.
+    Readers are only blocked while the state file is replaced, not while
+    the update is flushed to disk.
+
+    A state file never replaces a reserved file, such as the devices file
+    when it shares the directory of the state files.
+
+    A shared store may have its state files updated by other processes, such
+    as the other workers of a pre-forked server. Every read then checks
+    whether the device's state file has been replaced since it was loaded,
+    and updates to a device hold a lock on "<directory>/.<endpointId>.lock"
+    while they read, modify and write its state.
+    """
+
+    class DeviceState:
+        """Class to store the state of a single device."""
+
+        def __init__(self, state, file_key):
+            """Initialise a DeviceState.
+
+            Args:
+                state (dict): The parsed state file of the device.
+                file_key (tuple): The inode and modification time of the
+                    state file, which change whenever it is replaced.
+            """
+            self.state = state
+            self.file_key = file_key
+            self.lock = ReadWriteLock()  # held to read or replace the state
+            self.update_lock = Lock()  # held for the whole of an update
+
+    def __init__(self, directory, shared=False, reserved_files=()):
+        """Initialise a store of the device states in a directory.
+
+        Args:
+            directory (string): The directory containing the state files.
+            shared (bool): Whether other processes may update the state
+                files too. Default is False.
+            reserved_files (iterable(string)): The paths of files in the
+                directory which are not state files. Default is none.
+        """
+        if shared and flock is None:
+            raise Exception("Sharing device state needs file locking!")
+        self.directory = directory
+        self.shared = shared
+        self.reserved_files = {path.abspath(reserved_file)
+                               for reserved_file in reserved_files}
+        self.lock = Lock()  # held while loading a device's state
+        self.devices = {}
+
+    @staticmethod
+    def write_atomically(file_path, data):
+        """Replace a JSON file, so that it is never partially written.
+
+        Args:
+            file_path (string): The path of the file to write.
+            data: The JSON serialisable data to write.
+        """
+        DeviceStateStore.write_many_atomically([(file_path, data)])
+
+    @staticmethod
+    def write_many_atomically(files):
+        """Replace several JSON files, so that none is partially written.
+
+        Every file is written to a temporary file and flushed to disk before
+        any replaces its original, then each directory is synced once, so
+        writing many files costs little more than writing one per file.
+
+        Args:
+            files (list(tuple)): The path of each file to write (string)
+                and the JSON serialisable data to write to it.
+        """
+        written = []
+        try:
+            for file_path, data in files:
+                written.append((DeviceStateStore._write_temporary(
+                    file_path, data), file_path))
+            for temp_path, file_path in written:
+                replace(temp_path, file_path)
+        except BaseException:
+            for temp_path, _ in written:
+                if path.exists(temp_path):
+                    remove(temp_path)
+            raise
+        DeviceStateStore._sync_directories(
+            [file_path for _, file_path in written])
+
+    @staticmethod
+    def _write_temporary(file_path, data):
+        """Write a JSON file's replacement beside it, and flush it to disk.
+
+        Args:
+            file_path (string): The path of the file to be replaced.
+            data: The JSON serialisable data to write.
+
+        Returns:
+            string: The path of the temporary file.
+        """
+        directory = path.dirname(file_path) or "."
+        handle, temp_path = mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with fdopen(handle, "w") as output_file:
+                output_file.write(dumps(data, indent=4))
+                output_file.flush()
+                fsync(output_file.fileno())
+            try:
+                chmod(temp_path, stat(file_path).st_mode)
+            except FileNotFoundError:
+                pass
+        except BaseException:
+            remove(temp_path)
+            raise
+        return temp_path
+
+    @staticmethod
+    def _sync_directories(file_paths):
+        """Flush the directories of replaced files, so the renames persist.
+
+        Args:
+            file_paths (list(string)): The paths of the replaced files.
+        """
+        for directory in {path.dirname(file_path) or "."
+                          for file_path in file_paths}:
+            try:
+                directory_handle = open_fd(directory, O_RDONLY)
+            except OSError:
+                continue
+            try:
+                fsync(directory_handle)
+            except OSError:
+                pass
+            finally:
+                close(directory_handle)
+
+    @staticmethod
+    def is_valid_endpoint_id(endpoint_id):
+        """Check whether an endpointId can name a state file.
+
+        Args:
+            endpoint_id (string): The endpointId of a device.
+
+        Returns:
+            bool: True if the ID is a plain file name.
+        """
+        return (isinstance(endpoint_id, str) and endpoint_id != ""
+                and path.basename(endpoint_id) == endpoint_id
+                and not endpoint_id.startswith("."))
+
+    def _state_file(self, endpoint_id):
+        """Find the path to the state file of a device.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+
+        Returns:
+            string: The path to the state file.
+        """
+        if not self.is_valid_endpoint_id(endpoint_id):
+            raise Exception("Invalid endpoint ID!")
+        state_file = path.join(self.directory, endpoint_id + ".json")
+        if path.abspath(state_file) in self.reserved_files:
+            raise Exception("Invalid endpoint ID!")
+        return state_file
+
+    @staticmethod
+    def _file_key(status):
+        """Find the key identifying a version of a state file.
+
+        Args:
+            status (os.stat_result): The status of the state file.
+
+        Returns:
+            tuple: The inode and modification time of the file.
+        """
+        return status.st_ino, status.st_mtime_ns
+
+    def _read_state_file(self, endpoint_id):
+        """Read and parse the state file of a device.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+
+        Returns:
+            tuple: The parsed state (dict) and its file key (tuple), or None
+                if the device has no state file.
+        """
+        try:
+            with open(self._state_file(endpoint_id), "r") as input_file:
+                file_key = self._file_key(fstat(input_file.fileno()))
+                return loads(input_file.read()), file_key
+        except FileNotFoundError:
+            return None
+
+    def _is_replaced(self, endpoint_id, device):
+        """Check whether a device's state file was replaced since it loaded.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+            device (DeviceStateStore.DeviceState): The device's state.
+
+        Returns:
+            bool: True if the state file has changed.
+        """
+        try:
+            status = stat(self._state_file(endpoint_id))
+        except FileNotFoundError:
+            return False
+        return self._file_key(status) != device.file_key
+
+    def _reload_if_replaced(self, endpoint_id, device):
+        """Reload a device's state if another process replaced its file.
+
+        Must be called while holding the device's write lock.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+            device (DeviceStateStore.DeviceState): The device's state.
+        """
+        if self._is_replaced(endpoint_id, device):
+            loaded = self._read_state_file(endpoint_id)
+            if loaded is not None:
+                device.state, device.file_key = loaded
+
+    @contextmanager
+    def _locked_file(self, endpoint_id):
+        """Hold the lock file of a device, if the store is shared.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+        """
+        if not self.shared:
+            yield
+            return
+        lock_file = path.join(self.directory, "." + endpoint_id + ".lock")
+        handle = open_fd(lock_file, O_RDWR | O_CREAT, 0o644)
+        try:
+            flock(handle, LOCK_EX)
+            yield
+        finally:
+            # closing the file releases the lock
+            close(handle)
+
+    def _get_device(self, endpoint_id):
+        """Find the state of a device, loading it if necessary.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+
+        Returns:
+            DeviceStateStore.DeviceState: The device's state, or None if the
+                device has no state file.
+        """
+        device = self.devices.get(endpoint_id)
+        if device is not None:
+            return device
+
+        with self.lock:
+            device = self.devices.get(endpoint_id)
+            if device is None:
+                loaded = self._read_state_file(endpoint_id)
+                if loaded is None:
+                    return None
+                device = self.DeviceState(*loaded)
+                self.devices[endpoint_id] = device
+            return device
+
+    def get_state(self, endpoint_id):
+        """Read the state of a device.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+
+        Returns:
+            dict: A copy of the device's state, or None if the device has no
+                state file.
+        """
+        device = self._get_device(endpoint_id)
+        if device is None:
+            return None
+        # one stat finds whether another process changed the state
+        if self.shared and self._is_replaced(endpoint_id, device):
+            with device.lock.writing():
+                self._reload_if_replaced(endpoint_id, device)
+        with device.lock.reading():
+            return deepcopy(device.state)
+
+    def update(self, endpoint_id, update):
+        """Update the state of a device and persist it.
+
+        Args:
+            endpoint_id (string): The endpointId of the device.
+            update (function): Called with a copy of the device's state
+                (dict), which it modifies in place.
+
+        Returns:
+            dict: A copy of the updated state, or None if the device has no
+                state file.
+        """
+        device = self._get_device(endpoint_id)
+        if device is None:
+            return None
+        with device.update_lock, self._locked_file(endpoint_id):
+            if self.shared:
+                with device.lock.writing():
+                    self._reload_if_replaced(endpoint_id, device)
+            with device.lock.reading():
+                state = deepcopy(device.state)
+            update(state)
+
+            # readers see the old state until the new one is on disk, and
+            # are only blocked while it replaces the state file
+            state_file = self._state_file(endpoint_id)
+            temp_path = self._write_temporary(state_file, state)
+            try:
+                with device.lock.writing():
+                    replace(temp_path, state_file)
+                    device.state = state
+                    if self.shared:
+                        device.file_key = self._file_key(stat(state_file))
+            except BaseException:
+                if path.exists(temp_path):
+                    remove(temp_path)
+                raise
+            self._sync_directories([state_file])
+            return deepcopy(state)
@@ -0,0 +1,195 @@
+"""Module containing validators compiled from device capabilities."""
+from math import isfinite
+
+
+class DirectiveSchema:
+    """Class to compile the capabilities of devices into validators.
+
+    A validator is compiled once for each capability, when the devices
+    file is loaded, with the capability's limits (e.g. the supported range
+    of a RangeController) bound in. Validating a directive then only checks
+    its payload against those limits.
+
+    Each validator is called with the header and payload of a directive,
+    and returns None if the directive is valid, or a tuple of the HTTP
+    status code and message to reject it with.
+    """
+
+    class RangeValidator:
+        """Class to validate directives to an Alexa.RangeController."""
+
+        DIRECTIVES = ("SetRangeValue", "AdjustRangeValue")
+
+        def __init__(self, capability):
+            """Compile the supported range of a RangeController capability.
+
+            Args:
+                capability (dict): The capability, from the devices file.
+            """
+            supported_range = capability.get("configuration", {}) \
+                .get("supportedRange", {})
+            self.minimum = supported_range.get("minimumValue")
+            self.maximum = supported_range.get("maximumValue")
+            self.precision = supported_range.get("precision")
+
+        @staticmethod
+        def check_capability(capability):
+            """Find problems with the definition of a RangeController.
+
+            Args:
+                capability (dict): The capability, from the devices file.
+
+            Returns:
+                list(string): The problems found, if any.
+            """
+            problems = []
+            if not isinstance(capability.get("instance"), str):
+                problems.append("RangeController has no instance")
+            supported_range = capability.get("configuration", {}) \
+                .get("supportedRange")
+            if not isinstance(supported_range, dict):
+                return problems + ["RangeController has no supportedRange"]
+
+            limits = [supported_range.get(name) for name
+                      in ("minimumValue", "maximumValue", "precision")]
+            if any(isinstance(limit, bool) or
+                   not isinstance(limit, (int, float)) for limit in limits):
+                return problems + ["supportedRange must have numeric "
+                                   "minimumValue, maximumValue and precision"]
+            minimum, maximum, precision = limits
+            if minimum > maximum:
+                problems.append("supportedRange minimumValue exceeds "
+                                "maximumValue")
+            if precision <= 0:
+                problems.append("supportedRange precision must be positive")
+            return problems
+
+        def _check_number(self, value, name):
+            """Check that a payload value is a finite number.
+
+            JSON parsing accepts NaN and Infinity, which would otherwise
+            pass the range checks and be saved as the device's state.
+
+            Returns:
+                tuple: The status code and message, or None if it is valid.
+            """
+            if isinstance(value, bool) or \
+                    not isinstance(value, (int, float)) or \
+                    not isfinite(value):
+                return 400, "{} must be a finite number!".format(name)
+            return None
+
+        def _is_step(self, amount):
+            """Check that an amount is a whole number of precision steps.
+
+            Returns:
+                bool: True if it is, or if the range has no precision.
+            """
+            if not self.precision:
+                return True
+            steps = amount / self.precision
+            return abs(steps - round(steps)) <= 1e-9
+
+        def __call__(self, header, payload):
+            """Validate a directive to the capability.
+
+            Args:
+                header (dict): The header of the directive.
+                payload (dict): The payload of the directive.
+
+            Returns:
+                tuple: The status code and message, or None if it is valid.
+            """
+            name = header.get("name")
+            if name not in self.DIRECTIVES:
+                return 422, "unsupported directive: {}!".format(name)
+
+            if name == "AdjustRangeValue":
+                delta = payload.get("rangeValueDelta")
+                error = self._check_number(delta, "rangeValueDelta")
+                if error is not None:
+                    return error
+                if self.minimum is not None and self.maximum is not None \
+                        and abs(delta) > self.maximum - self.minimum:
+                    return 422, "rangeValueDelta out of range!"
+                # the current value is a whole number of steps, so this
+                # keeps the adjusted value one too
+                if not self._is_step(delta):
+                    return 422, "rangeValueDelta does not match precision!"
+                return None
+
+            value = payload.get("rangeValue")
+            error = self._check_number(value, "rangeValue")
+            if error is not None:
+                return error
+            if (self.minimum is not None and value < self.minimum) or \
+                    (self.maximum is not None and value > self.maximum):
+                return 422, "rangeValue out of range!"
+            if not self._is_step(value - (self.minimum or 0)):
+                return 422, "rangeValue does not match precision!"
+            return None
+
+    # validators of each interface, interfaces not listed are not checked
+    VALIDATORS = {
+        "Alexa.RangeController": RangeValidator
+    }
+
+    @classmethod
+    def compile(cls, capability):
+        """Compile a validator for a capability.
+
+        Args:
+            capability (dict): The capability, from the devices file.
+
+        Returns:
+            function: The validator, or None if directives to the
+                capability's interface are not checked.
+        """
+        validator = cls.VALIDATORS.get(capability["interface"])
+        if validator is None:
+            return None
+        return validator(capability)
+
+    @classmethod
+    def check_capability(cls, capability):
+        """Find problems with the definition of a capability.
+
+        Args:
+            capability (dict): The capability, from the devices file.
+
+        Returns:
+            list(string): The problems found, if any.
+        """
+        if not isinstance(capability, dict):
+            return ["capability must be an object"]
+        problems = ["capability has no {}".format(field)
+                    for field in ("type", "interface", "version")
+                    if not isinstance(capability.get(field), str)]
+        validator = cls.VALIDATORS.get(capability.get("interface"))
+        if validator is not None:
+            problems += validator.check_capability(capability)
+        return problems
+
+    @staticmethod
+    def check_structure(directive_json):
+        """Check that a directive has the fields needed to route it.
+
+        Args:
+            directive_json (dict): The directive.
+
+        Returns:
+            tuple: The status code and message, or None if it is valid.
+        """
+        if not isinstance(directive_json, dict):
+            return 400, "malformed directive!"
+        header = directive_json.get("header")
+        endpoint = directive_json.get("endpoint")
+        payload = directive_json.get("payload", {})
+        if not isinstance(header, dict) or not isinstance(endpoint, dict) \
+                or not isinstance(payload, dict):
+            return 400, "malformed directive!"
+        if not isinstance(header.get("namespace"), str) or \
+                not isinstance(header.get("name"), str) or \
+                not isinstance(endpoint.get("endpointId"), str):
+            return 400, "malformed directive!"
+        return None
@@ -1,5 +1,7 @@
 """Module containing a class to parse and store HTTP request data."""
 from enum import Enum
+from urllib.parse import unquote
+import re
 
 
 class HTTPRequest:
@@ -20,64 +22,166 @@ class HTTPRequest:
 
     HTTP_METHOD_STRINGS = set(item.value for item in HTTPMethod)
 
+    # the methods, by the raw bytes of their names
+    METHODS = {item.value.encode("ascii"): item for item in HTTPMethod}
+
+    # starts with the newline ending the last header line, as patterns
+    # starting with a literal are searched for much faster
+    END_OF_HEADERS = re.compile(b"\n\r?\n")
+
+    # a line of the header section which is not a field-value pair
+    INVALID_HEADER_LINE = re.compile(b"\n[^:\n]*\n")
+
     def _parse_request_line(self, request_line):
-        """Parse a request_line string into individual variables.
+        """Parse a request_line into individual variables.
 
         Args:
-            request_line (string): The raw request_line string, recieved from
+            request_line (byte string): The raw request_line, recieved from
                 a client.
         """
         # attempt to separate request line into 3 strings.
-        request = request_line.strip().split(" ")
+        request = request_line.strip().split(b" ")
         if len(request) != 3:
             raise Exception("Invalid HTTP Request-Line!")
-        method, self.request_uri, self.http_version = request
+        method, request_uri, http_version = request
 
         # attempt to parse HTTP method.
-        if method not in self.HTTP_METHOD_STRINGS:
+        self.method = self.METHODS.get(method)
+        if self.method is None:
             raise Exception("Unrecognised HTTP method!")
-        self.method = self.HTTPMethod(method)
+        self.request_uri = request_uri.decode("utf-8")
+        self.http_version = http_version.decode("utf-8")
+        self.path, self.query = self._normalise_uri(self.request_uri)
 
-    def _parse_header(self, header_text):
-        """Parse the header section of a HTML request into field-value pairs.
+    @staticmethod
+    def _normalise_uri(request_uri):
+        """Find the normalised path and the query of a Request-URI.
+
+        The path is percent-decoded, and "." and ".." segments and repeated
+        slashes are resolved, so each resource has one path. A path which
+        leaves the root is invalid.
 
         Args:
-            header_text (list(string)): A list of strings, each of which is a
-                raw line from the header section of the request.
-        """
-        # attempt to slit header into a field-value pair.
-        header = header_text.split(":", 1)
-        if len(header) != 2:
-            raise Exception("Invalid Header-Line!")
+            request_uri (string): The Request-URI, as sent by the client.
+
+        Returns:
+            tuple: The path and the query string (both strings), e.g.
+                ("/smarthome/poll", "after=3") for
+                "/smarthome/%70oll?after=3".
 
-        # add header to headers
-        field, value = header
-        self.headers[field] = value.strip()
+        Raises:
+            Exception: If the Request-URI is invalid.
+        """
+        # absolute-form is sent to proxies, but must be accepted
+        if request_uri.startswith(("http://", "https://")):
+            path_start = request_uri.find("/", request_uri.find("//") + 2)
+            request_uri = "/" if path_start == -1 else request_uri[path_start:]
+        uri_path, _, query = request_uri.partition("?")
+        if uri_path == "*":
+            return uri_path, query
+        if not uri_path.startswith("/"):
+            raise Exception("Invalid Request-URI!")
+
+        if "%" in uri_path:
+            try:
+                uri_path = unquote(uri_path, errors="strict")
+            except UnicodeDecodeError:
+                raise Exception("Invalid Request-URI!")
+            if "\0" in uri_path:
+                raise Exception("Invalid Request-URI!")
+        if "/." in uri_path or "//" in uri_path:
+            segments = []
+            for segment in uri_path.split("/"):
+                if segment == "..":
+                    if not segments:
+                        raise Exception("Request-URI outside of the root!")
+                    segments.pop()
+                elif segment and segment != ".":
+                    segments.append(segment)
+            # a trailing slash names a directory
+            trailing_slash = segments and (
+                uri_path.endswith(("/", "/.", "/..")))
+            uri_path = "/" + "/".join(segments) + \
+                ("/" if trailing_slash else "")
+        return uri_path, query
 
     def __init__(self, request_data):
         """Initialise a HTTPRequest object from a raw HTTP request.
 
+        Only the request line is parsed straight away. The header section is
+        checked, but its fields are only found, and their values decoded,
+        when they are asked for.
+
         args:
             request_data (byte string): The raw byte string of a HTTP request.
         """
-        lines = [line.decode("utf-8") for line in request_data.splitlines()]
-        self._parse_request_line(lines.pop(0))
-
-        self.headers = {}
-        self.body = ""
-        end_of_headers = False
-        for line in lines:
-            if end_of_headers:
-                self.body += line + "\n"
-                continue
-            if not line:
-                end_of_headers = True
-                continue
-            self._parse_header(line)
-
-        # check for correct header format
-        if not end_of_headers:
+        end_of_headers = self.END_OF_HEADERS.search(request_data)
+        if end_of_headers is None:
             raise Exception("No end-of-header line found!")
+        head_end = end_of_headers.start()
+        self.body = request_data[end_of_headers.end():]
+
+        # the header lines start from the newline ending the request line
+        line_end = request_data.find(b"\n", 0, head_end)
+        if line_end == -1:
+            line_end = head_end
+        self._parse_request_line(request_data[:line_end])
+        if self.INVALID_HEADER_LINE.search(request_data, line_end,
+                                           head_end + 1) is not None:
+            raise Exception("Invalid Header-Line!")
+
+        self._data = request_data
+        self._head_start = line_end
+        self._head_end = head_end
+        self._lower_head = None  # lower-cased header lines, for lookups
+        self._values = {}  # values found so far, by lower-cased field name
+        self._headers = None
+
+    @property
+    def headers(self):
+        """dict: The value of each header field, by the field's name."""
+        if self._headers is None:
+            self._headers = {}
+            head = self._data[self._head_start:self._head_end]
+            for line in head.split(b"\n")[1:]:
+                field, _, value = line.partition(b":")
+                self._headers[field.decode("utf-8", "replace")] = \
+                    value.strip().decode("utf-8", "replace")
+        return self._headers
+
+    def get_header(self, field, default=None):
+        """Find the value of a header field, ignoring the case of its name.
+
+        Args:
+            field (string): The name of the header field.
+            default: The value returned if the field is not present.
+
+        Returns:
+            string: The value of the field, or default if not present.
+        """
+        field = field.lower()
+        value = self._values.get(field)
+        if value is not None:
+            return value
+
+        head = self._lower_head
+        if head is None:
+            head = self._lower_head = \
+                self._data[self._head_start:self._head_end].lower()
+        key = b"\n" + field.encode("utf-8") + b":"
+        start = head.find(key)
+        if start == -1:
+            return default
+        start += len(key)
+        end = head.find(b"\n", start)
+        if end == -1:
+            end = len(head)
+
+        # the lower-cased lines line up with the raw ones
+        offset = self._head_start
+        value = self._values[field] = self._data[offset + start:offset + end] \
+            .strip().decode("utf-8", "replace")
+        return value
 
     def __str__(self):
         """Create a string representation of the HTTPRequest object.
@@ -97,7 +201,8 @@ class HTTPRequest:
 
         # convert body:
         if self.body is not None:
-            string += "Body:\n{0}".format(self.body)
+            string += "Body:\n{0}".format(
+                self.body.decode("utf-8", "replace"))
 
         return string
 
@@ -1,4 +1,5 @@
 """Module containing a class used to generate a valid HTTP response."""
+from time import monotonic
 from .HTTP_STATUS_CODES import HTTP_STATUS_CODES
 
 
@@ -6,13 +7,83 @@ class HTTPResponse:
     """Class to generate a valid HTTP response."""
 
     HTTP_VERSION = "HTTP/1.1"
+    FILE_CHUNK_SIZE = 1048576  # bytes of a file sent between deadline checks
+
+    # the status line of each status code, encoded once
+    STATUS_LINES = {}
+    for code, phrase in HTTP_STATUS_CODES.items():
+        STATUS_LINES[code] = "{0} {1} {2}\r\n".format(
+            HTTP_VERSION, code, phrase).encode("utf-8")
+    del code, phrase
+
+    # the status line and Content-Type header, by status code and content
+    # type, encoded when first used
+    HEADER_PREFIXES = {}
+
+    class FileContent:
+        """Class representing a body which is sent straight from a file."""
+
+        def __init__(self, path, size):
+            """Initialise a FileContent object.
+
+            Args:
+                path (string): The path to the file.
+                size (int): The number of bytes of the file to send.
+            """
+            self.path = path
+            self.size = size
+
+        def __len__(self):
+            """Find the size of the body.
+
+            Returns:
+                int: The number of bytes to send.
+            """
+            return self.size
+
+        def read(self):
+            """Read the body into memory.
+
+            Returns:
+                byte string: The contents of the file.
+            """
+            with open(self.path, "rb") as input_file:
+                return input_file.read(self.size)
+
+    class StreamContent:
+        """Class representing a body which is produced while it is sent.
+
+        The body has no length, so it ends when the connection is closed.
+        """
+
+        def __init__(self, chunks, on_close=None):
+            """Initialise a StreamContent object.
+
+            Args:
+                chunks (iterable(byte string)): The parts of the body, in
+                    order. A generator may block until each is ready.
+                on_close (function): Called once the body is closed, even if
+                    it was never sent. Default is None.
+            """
+            self.chunks = chunks
+            self.on_close = on_close
+
+        def close(self):
+            """Stop producing the body, if it is produced by a generator."""
+            close = getattr(self.chunks, "close", None)
+            if close is not None:
+                close()
+            if self.on_close is not None:
+                on_close, self.on_close = self.on_close, None
+                on_close()
 
     def __init__(self, status_code, content, content_type="text/html"):
         """Initialise a HTTPResponse object.
 
         Args:
             status_code (int): The HTTP status code of the response.
-            content (string or byte string): The body of the HTTP response.
+            content (string, byte string, HTTPResponse.FileContent or
+                HTTPResponse.StreamContent): The body of the HTTP response.
             content_type (string): The MIME type of the content.
                 Default is "text/html".
         """
@@ -28,10 +99,9 @@ class HTTPResponse:
             self.content = content
 
         # populate default headers.
-        self.headers = {
-            "Content-Type": content_type,
-            "Content-Length": str(len(content))
-        }
+        self.headers = {"Content-Type": content_type}
+        if not self.is_stream():
+            self.headers["Content-Length"] = str(len(self.content))
 
     def add_header(self, field, value):
         """Add a header field to the header of the HTTPResponse.
@@ -42,29 +112,181 @@ class HTTPResponse:
         """
         self.headers[field] = value
 
+    def remove_header(self, field):
+        """Remove a header field from the header of the HTTPResponse.
+
+        Args:
+            field (string): The field name.
+        """
+        self.headers.pop(field, None)
+
+    def remove_content(self):
+        """Remove the body of the HTTPResponse, keeping its headers.
+
+        Used to respond to HEAD requests, which are sent the headers of the
+        equivalent GET response.
+        """
+        self.content = None
+
+    def is_file(self):
+        """Check whether the body is sent straight from a file.
+
+        Returns:
+            bool: True if the content is a HTTPResponse.FileContent.
+        """
+        return isinstance(self.content, self.FileContent)
+
+    def is_stream(self):
+        """Check whether the body is produced while it is sent.
+
+        Returns:
+            bool: True if the content is a HTTPResponse.StreamContent.
+        """
+        return isinstance(self.content, self.StreamContent)
+
+    def create_http_header(self):
+        """Generate the status line and headers of the HTTP response.
+
+        Returns:
+            byte string: The response, up to and including the end-of-header
+                line.
+        """
+        # the status line and Content-Type are taken from the cache
+        content_type = self.headers.get("Content-Type")
+        if content_type is None:
+            prefix = self.STATUS_LINES[self.status_code]
+        else:
+            key = (self.status_code, content_type)
+            prefix = self.HEADER_PREFIXES.get(key)
+            if prefix is None:
+                prefix = self.HEADER_PREFIXES[key] = \
+                    self.STATUS_LINES[self.status_code] + \
+                    "Content-Type: {0}\r\n".format(content_type) \
+                    .encode("utf-8")
+
+        # add the other headers and the end-of-header line
+        lines = []
+        for header_field, header_value in self.headers.items():
+            if header_field != "Content-Type":
+                lines += (header_field, ": ", header_value, "\r\n")
+        lines.append("\r\n")
+        return prefix + "".join(lines).encode("utf-8")
+
     def create_http_response(self):
         """Generate a valid HTTP response from a HTTPResponse object.
 
         Returns:
             byte string: A valid HTTP response.
         """
-        # create response line
-        response = "{0} {1} {2}\r\n"
-        response = response.format(self.HTTP_VERSION,
-                                   self.status_code,
-                                   HTTP_STATUS_CODES[self.status_code])
+        buffers = self.create_http_buffers()
 
-        # add headers
-        for header_field, header_value in self.headers.items():
-            response += "{0}: {1}\r\n".format(header_field, header_value)
+        # add content, if there is any
+        if self.is_file():
+            buffers.append(self.content.read())
+        elif self.is_stream():
+            buffers += self.content.chunks
+        return b"".join(buffers)
 
-        # add end-of-header line and encode to utf-8
-        response += "\r\n"
-        response = response.encode("utf-8")
+    def create_http_buffers(self):
+        """Generate the HTTP response as a list of byte strings to send.
 
-        # add content, if there is any
-        if self.content is not None:
-            response += self.content
+        The body is left as a separate buffer, so it is never copied. File
+        and stream content is not included.
+
+        Returns:
+            list(byte string): The buffers of the response, in order.
+        """
+        header = self.create_http_header()
+        if self.is_file() or self.is_stream() or not self.content:
+            return [header]
+        return [header, self.content]
+
+    @staticmethod
+    def send_buffers(client, buffers):
+        """Send as much of a list of buffers as the socket will accept.
+
+        The buffers are gathered into one call to socket.sendmsg, where it is
+        available, and the bytes sent are removed from the list.
+
+        Args:
+            client (socket): The socket to send the buffers on.
+            buffers (list(byte string)): The buffers to send, in order.
+
+        Returns:
+            int: The number of bytes sent.
+        """
+        if hasattr(client, "sendmsg"):
+            sent = client.sendmsg(buffers)
+        else:
+            sent = client.send(buffers[0])
+
+        remaining = sent
+        while buffers and remaining >= len(buffers[0]):
+            remaining -= len(buffers.pop(0))
+        if remaining:
+            buffers[0] = memoryview(buffers[0])[remaining:]
+        return sent
+
+    @staticmethod
+    def _wait_until(client, deadline):
+        """Limit the socket's next blocking call to the time left.
+
+        Args:
+            client (socket): The socket about to be sent on.
+            deadline (float): The monotonic() time by which the response
+                must be sent, or None for no deadline.
+
+        Raises:
+            TimeoutError: If the deadline has passed.
+        """
+        if deadline is None:
+            return
+        time_left = deadline - monotonic()
+        if time_left <= 0:
+            raise TimeoutError("Timed out sending response!")
+        client.settimeout(time_left)
+
+    def send(self, client, buffers=None, deadline=None):
+        """Send the HTTP response over a blocking socket.
+
+        The header and body are sent together by socket.sendmsg, and file
+        content is sent with socket.sendfile, so the body is never copied.
+        Stream content is sent as each part is produced.
+
+        Args:
+            client (socket): The socket to send the response on.
+            buffers (list(byte string)): The response's buffers, if already
+                created by create_http_buffers.
+            deadline (float): The monotonic() time by which the header and
+                any file content must be sent. Default is None, for no
+                deadline. It is checked before each call which may block,
+                and between each FILE_CHUNK_SIZE bytes of a file.
+
+        Raises:
+            TimeoutError: If the deadline passes.
+        """
+        if buffers is None:
+            buffers = self.create_http_buffers()
+        while buffers:
+            self._wait_until(client, deadline)
+            self.send_buffers(client, buffers)
+
+        if self.is_file():
+            with open(self.content.path, "rb") as input_file:
+                offset = 0
+                while offset < self.content.size:
+                    self._wait_until(client, deadline)
+                    sent = client.sendfile(
+                        input_file, offset,
+                        min(self.content.size - offset,
+                            self.FILE_CHUNK_SIZE))
+                    if not sent:
+                        raise OSError("File changed while being sent!")
+                    offset += sent
 
-        # encode and return
-        return response
+        if self.is_stream():
+            try:
+                for chunk in self.content.chunks:
+                    client.sendall(chunk)
+            finally:
+                self.content.close()
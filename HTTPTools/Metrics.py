@@ -0,0 +1,222 @@
+"""Module containing low-overhead counters and histograms of requests."""
+from bisect import bisect_left
+from threading import Lock
+from time import time
+
+
+class Metrics:
+    """Class to count requests and time each phase of serving them.
+
+    Each request is timed by a RequestTiming in five phases: receive (from
+    its first byte to its last), parse, handle, serialize and send. A
+    finished timing is recorded in one short critical section, counting the
+    request by method, URI class and status code, and adding each phase's
+    duration to a histogram for the request's URI class. render() exports
+    everything in the Prometheus text format.
+
+    Hooks are called with every recorded timing, e.g. to write an access
+    log. Counters and gauges kept elsewhere, e.g. the access log's dropped
+    lines or the worker pool's queue depth, can be added to the export.
+    """
+
+    PHASES = ("receive", "parse", "handle", "serialize", "send")
+
+    # upper bounds of the histogram buckets, in seconds
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    SMART_HOME_KEY = "/smarthome/"
+    SMART_HOME_COMMANDS = {"discover", "status", "directive", "status_batch",
+                           "directive_batch", "subscribe", "poll"}
+    METRICS_URI = "/metrics"
+
+    class RequestTiming:
+        """Class to store the timing of each phase of a single request."""
+
+        def __init__(self, address):
+            """Initialise the timing of a request, with no phases timed.
+
+            Args:
+                address (tuple): A tuple containing the IP and port of the
+                    client.
+            """
+            self.address = address
+            self.started_at = time()
+            self.method = None  # None if the request could not be parsed
+            self.uri = None  # the normalised path
+            self.status_code = None
+            self.bytes_sent = 0
+            self.receive = 0.0
+            self.parse = 0.0
+            self.handle = 0.0
+            self.serialize = 0.0
+            self.send = 0.0
+
+        def duration(self):
+            """Find the total time spent serving the request.
+
+            Returns:
+                float: The sum of the phases, in seconds.
+            """
+            return (self.receive + self.parse + self.handle +
+                    self.serialize + self.send)
+
+    class Histogram:
+        """Class to count observed durations in buckets."""
+
+        def __init__(self, buckets):
+            """Initialise an empty histogram.
+
+            Args:
+                buckets (tuple(float)): The upper bound of each bucket, in
+                    ascending order.
+            """
+            self.buckets = buckets
+            self.counts = [0] * (len(buckets) + 1)  # last is above all
+            self.sum = 0.0
+
+        def observe(self, value):
+            """Count a duration in the first bucket which can hold it.
+
+            Args:
+                value (float): The duration, in seconds.
+            """
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def __init__(self, buckets=None):
+        """Initialise metrics with no requests recorded.
+
+        Args:
+            buckets (tuple(float)): The upper bounds of the histogram
+                buckets. Default is Metrics.BUCKETS.
+        """
+        self.buckets = self.BUCKETS if buckets is None else buckets
+        self.lock = Lock()
+        self.requests = {}  # count, by (method, URI class, status code)
+        self.histograms = {}  # Histogram, by (phase, URI class)
+        self.hooks = []
+        self.values = {}  # (type, description, read), by metric name
+
+    def add_hook(self, hook):
+        """Call a function with the timing of every request recorded.
+
+        Hooks are called on the thread which served the request, so should
+        return quickly.
+
+        Args:
+            hook (function): Called with each Metrics.RequestTiming.
+        """
+        self.hooks.append(hook)
+
+    def add_counter(self, name, description, read):
+        """Export a counter kept elsewhere, replacing any of the same name.
+
+        Args:
+            name (string): The metric's name, e.g. "..._total".
+            description (string): The metric's help text.
+            read (function): Called whenever the metrics are rendered, to
+                find the counter's value.
+        """
+        self.values[name] = ("counter", description, read)
+
+    def add_gauge(self, name, description, read):
+        """Export a gauge kept elsewhere, replacing any of the same name.
+
+        Args:
+            name (string): The metric's name.
+            description (string): The metric's help text.
+            read (function): Called whenever the metrics are rendered, to
+                find the gauge's value.
+        """
+        self.values[name] = ("gauge", description, read)
+
+    def classify(self, uri):
+        """Find the class of a request path, used to break down the metrics.
+
+        Args:
+            uri (string): The normalised request path, or None if the request
+                was not parsed.
+
+        Returns:
+            string: "smarthome/<command>" for smart home requests, "metrics"
+                for this endpoint, "static" for files or "invalid".
+        """
+        if uri is None:
+            return "invalid"
+        if uri.startswith(self.SMART_HOME_KEY):
+            command = uri[len(self.SMART_HOME_KEY):]
+            if command not in self.SMART_HOME_COMMANDS:
+                command = "other"
+            return "smarthome/" + command
+        if uri == self.METRICS_URI:
+            return "metrics"
+        return "static"
+
+    def record(self, timing):
+        """Record the timing of a served request.
+
+        Args:
+            timing (Metrics.RequestTiming): The request's timing.
+        """
+        uri_class = self.classify(timing.uri)
+        key = (timing.method or "invalid", uri_class, timing.status_code)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for phase in self.PHASES:
+                histogram = self.histograms.get((phase, uri_class))
+                if histogram is None:
+                    histogram = self.Histogram(self.buckets)
+                    self.histograms[(phase, uri_class)] = histogram
+                histogram.observe(getattr(timing, phase))
+
+        for hook in self.hooks:
+            hook(timing)
+
+    def render(self):
+        """Export the metrics in the Prometheus text format.
+
+        Returns:
+            string: The metrics, one sample per line.
+        """
+        with self.lock:
+            requests = sorted(self.requests.items())
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.sum)
+                for key, histogram in self.histograms.items())
+
+        lines = [
+            "# HELP http_requests_total Requests served, by method, URI "
+            "class and status code.",
+            "# TYPE http_requests_total counter"
+        ]
+        for (method, uri_class, status_code), count in requests:
+            lines.append('http_requests_total{{method="{}",uri_class="{}",'
+                         'status="{}"}} {}'.format(method, uri_class,
+                                                   status_code, count))
+
+        lines += [
+            "# HELP http_request_phase_seconds Time spent in each phase of "
+            "serving requests.",
+            "# TYPE http_request_phase_seconds histogram"
+        ]
+        bounds = ["{:g}".format(bound) for bound in self.buckets] + ["+Inf"]
+        for (phase, uri_class), counts, total in histograms:
+            labels = 'phase="{}",uri_class="{}"'.format(phase, uri_class)
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append('http_request_phase_seconds_bucket{{{},le="{}"}}'
+                             ' {}'.format(labels, bound, cumulative))
+            lines.append("http_request_phase_seconds_sum{{{}}} {!r}".format(
+                labels, total))
+            lines.append("http_request_phase_seconds_count{{{}}} {}".format(
+                labels, cumulative))
+
+        for name, (kind, description, read) in list(self.values.items()):
+            lines += [
+                "# HELP {} {}".format(name, description),
+                "# TYPE {} {}".format(name, kind),
+                "{} {}".format(name, read())
+            ]
+        return "\n".join(lines) + "\n"
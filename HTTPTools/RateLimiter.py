@@ -0,0 +1,145 @@
+"""Module containing per-client rate limiting by token bucket."""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class RateLimiter:
+    """Class to limit the rate of each client's requests to URI prefixes.
+
+    Each Rule gives the clients a budget for requests whose path starts
+    with its prefix: a bucket of burst tokens, refilled at rate tokens a
+    second, one of which is taken by each request. Requests are matched to
+    the rule with the longest matching prefix of their normalised path, the
+    same path they are routed by, so a differently spelt URI cannot escape
+    its rule. Requests matching no rule are not limited.
+
+    Buckets are kept in order of last use. A bucket left unused for long
+    enough to refill is the same as a new one, so such buckets are dropped
+    from the front as requests are checked, and only clients seen recently
+    take up memory.
+    """
+
+    class Rule:
+        """Class to store the request budget of a URI prefix."""
+
+        def __init__(self, prefix, rate, burst=None):
+            """Initialise a Rule.
+
+            Args:
+                prefix (string): The start of the normalised paths
+                    limited.
+                rate (float): The requests a second allowed per client.
+                burst (float): The requests a client may make at once.
+                    Default is None, which allows rate requests at once
+                    (at least 1).
+
+            Raises:
+                Exception: If the rate or burst is not positive.
+            """
+            if rate <= 0 or (burst is not None and burst < 1):
+                raise Exception("Invalid rate limit for {}: {} per second, "
+                                "bursts of {}".format(prefix, rate, burst))
+            self.prefix = prefix
+            self.rate = rate
+            self.burst = max(rate, 1) if burst is None else burst
+            self.refill_time = self.burst / rate  # seconds to fill a bucket
+
+        @classmethod
+        def parse(cls, spec):
+            """Create a Rule from a string "PREFIX=RATE[/BURST]".
+
+            Args:
+                spec (string): The rule, e.g. "/smarthome/=10/20".
+
+            Returns:
+                RateLimiter.Rule: The rule.
+
+            Raises:
+                Exception: If the rule is not valid.
+            """
+            prefix, _, limit = spec.rpartition("=")
+            rate, _, burst = limit.partition("/")
+            try:
+                return cls(prefix, float(rate),
+                           float(burst) if burst else None)
+            except ValueError:
+                raise Exception("Invalid rate limit: {}".format(spec))
+
+    def __init__(self, rules=()):
+        """Initialise a RateLimiter, with every bucket full.
+
+        Args:
+            rules (list(RateLimiter.Rule)): The budget of each URI prefix.
+                Default is no rules, limiting nothing.
+        """
+        self.rules = sorted(rules, key=lambda rule: len(rule.prefix),
+                            reverse=True)
+        self.buckets = OrderedDict()  # (tokens, time), by (IP, Rule)
+        self.lock = Lock()
+        self.limited = 0  # requests refused
+
+    def find_rule(self, path):
+        """Find the rule limiting a request, from its path.
+
+        Args:
+            path (string): The normalised request path.
+
+        Returns:
+            RateLimiter.Rule: The rule with the longest prefix matching the
+                path, or None if no rule matches.
+        """
+        for rule in self.rules:
+            if path.startswith(rule.prefix):
+                return rule
+        return None
+
+    def check(self, ip, path):
+        """Take a token for a request from the client's bucket.
+
+        Args:
+            ip (string): The IP address of the client.
+            path (string): The normalised request path.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise the seconds until
+                the client's bucket has a token again.
+        """
+        rule = self.find_rule(path)
+        if rule is None:
+            return 0.0
+        now = monotonic()
+        key = (ip, rule)
+        with self.lock:
+            bucket = self.buckets.pop(key, None)
+            if bucket is None:
+                tokens = rule.burst
+            else:
+                tokens = min(rule.burst,
+                             bucket[0] + (now - bucket[1]) * rule.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rule.rate
+                self.limited += 1
+            self.buckets[key] = (tokens, now)
+            self._expire(now)
+        return wait
+
+    def _expire(self, now):
+        """Drop the least recently used buckets which have refilled.
+
+        Dropping stops at the first bucket which has not refilled, so a
+        bucket of a rule with a short refill time may outlive its expiry
+        until the buckets used before it are dropped.
+
+        Args:
+            now (float): The current monotonic() time.
+        """
+        buckets = self.buckets
+        while buckets:
+            (_, rule), (_, updated_at) = next(iter(buckets.items()))
+            if now - updated_at < rule.refill_time:
+                break
+            buckets.popitem(last=False)
@@ -0,0 +1,49 @@
+"""Module containing a lock allowing many readers or a single writer."""
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+
+class ReadWriteLock:
+    """Class to allow many concurrent readers or a single writer.
+
+    Waiting writers take priority over new readers, so a steady stream of
+    readers cannot starve writers.
+    """
+
+    def __init__(self):
+        """Initialise an unlocked ReadWriteLock."""
+        self.condition = Condition(Lock())
+        self.readers = 0
+        self.writer_active = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def reading(self):
+        """Hold the lock for reading, alongside any other readers."""
+        with self.condition:
+            while self.writer_active or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock for writing, excluding readers and other writers."""
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer_active or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer_active = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer_active = False
+                self.condition.notify_all()
@@ -1,14 +1,29 @@
 """Module used to handle and respond to HTTP requests."""
+from .AccessLog import AccessLog
 from .HTTPResponse import HTTPResponse
 from .HTTPRequest import HTTPRequest
+from .Metrics import Metrics
+from .RateLimiter import RateLimiter
+from .Router import Router
 from .SmartDeviceHandler import SmartDeviceHandler
-from os import getcwd, path
+from .StaticFileCache import StaticFileCache
+from email.utils import parsedate_to_datetime
+from os import path
 
 
 class RequestHandler:
     """Class used to create a HTTPResponse for a HTTPRequest object."""
 
     smart_device_handler = SmartDeviceHandler()
+    static_files = StaticFileCache("www_root")
+    metrics = Metrics()
+    access_log = AccessLog()
+    metrics.add_hook(access_log)
+    metrics.add_counter("access_log_dropped_total",
+                        "Access log lines dropped, because the queue was "
+                        "full or writing failed.",
+                        lambda: RequestHandler.access_log.dropped)
+    rate_limiter = RateLimiter()  # limits nothing until given rules
 
     def generate_response(self, request):
         """Generate a HTTPResponse object in response to a HTTPRequest.
@@ -20,102 +35,222 @@ class RequestHandler:
         Returns:
             HTTPResponse: A valid response to the request.
         """
-        # call appropriate method
-        return self.METHODS[request.method](self, request)
+        function = self.ROUTES.find(request.method, request.path)
+        if function is not None:
+            return function(self, request)
+
+        if request.method not in self.ROUTES.methods:
+            return HTTPResponse(501, "Not implemented.")
+        allowed = self.ROUTES.allowed_methods(request.path)
+        if not allowed:
+            return HTTPResponse(404,
+                                "Failed to find {}".format(request.path))
+        return self._method_not_allowed(allowed)
 
-    def _handle_file(self, full_path, content_type, extension):
-        """Create a response from a file.
+    @staticmethod
+    def _method_not_allowed(allowed):
+        """Create a response refusing a request's method.
 
         Args:
-            full_path (string): The full path to the file.
-            extension (string): The extension of the file.
+            allowed (iterable(HTTPRequest.HTTPMethod)): The methods which
+                are allowed.
 
         Returns:
-            HTTPResponse: A HTTP response containing the file contents.
+            HTTPResponse: A 405 response, listing the allowed methods.
         """
-        with open(full_path, "rb") as input_file:
-            data = input_file.read()
-        return HTTPResponse(200, data, content_type+"/"+extension[1:])
+        response = HTTPResponse(405, "Method not allowed.")
+        response.add_header("Allow", ", ".join(
+            sorted(method.value for method in allowed)))
+        return response
 
-    def _find_content_path(self, uri):
-        """Attempt to find a relevant file for a given URI.
+    def _choose_encoding(self, request, encodings):
+        """Choose the compressed variant of a file to send to a client.
 
         Args:
-            uri (string): The URI of the file to search for.
+            request (HTTPRequest): The request, whose Accept-Encoding header
+                lists the content-codings the client accepts.
+            encodings (dict): The compressed variants of the file, keyed by
+                content-coding.
 
         Returns:
-            string: A path to the file, if one was found.
-                Otherwise, returns None.
+            string: The preferred content-coding accepted by the client, or
+                None if the file should be sent uncompressed.
         """
-        full_path = getcwd() + "/www_root/" + uri
+        accept_encoding = request.get_header("Accept-Encoding")
+        if not accept_encoding or not encodings:
+            return None
+
+        # parse the quality given to each content-coding
+        qualities = {}
+        for coding in accept_encoding.split(","):
+            name, *parameters = coding.split(";")
+            quality = 1.0
+            for parameter in parameters:
+                parameter = parameter.strip()
+                if parameter.startswith("q="):
+                    try:
+                        quality = float(parameter[2:])
+                    except ValueError:
+                        quality = 0.0
+            qualities[name.strip().lower()] = quality
+
+        best_coding, best_quality = None, 0.0
+        for coding in self.ENCODING_PREFERENCE:
+            if coding not in encodings:
+                continue
+            quality = qualities.get(coding, qualities.get("*", 0.0))
+            if quality > best_quality:
+                best_coding, best_quality = coding, quality
+        return best_coding
+
+    def _accepts_encoding(self, request):
+        """Check whether a client accepts any compressed variant of a file.
 
-        # check if it is a folder containing index.html
-        index_path = path.join(full_path, 'index.html')
-        if path.isdir(full_path) and path.isfile(index_path):
-            return index_path
-
-        # check if it is a file
-        if path.isfile(full_path):
-            return full_path
+        Args:
+            request (HTTPRequest): The request.
 
-        # otherwise, return None
-        return None
+        Returns:
+            bool: True if a variant would be chosen, were it made.
+        """
+        return self._choose_encoding(
+            request, dict.fromkeys(self.ENCODING_PREFERENCE)) is not None
 
-    def _do_GET(self, request):
-        """Attempt to respond to a HTTP GET request.
+    def _handle_file(self, entry, content_type, encoding=None):
+        """Create a response from a file.
 
         Args:
-            request (HTTPRequest): The request to respond to.
+            entry (StaticFileCache.Entry): The cached file.
+            content_type (string): The MIME type of the file's content.
+            encoding (string): The content-coding of the compressed variant
+                to send, or None to send the file uncompressed.
 
         Returns:
-            HTTPResponse: A valid HTTP response to the request.
+            HTTPResponse: A HTTP response containing the file contents.
         """
-        # attempt to find path to requested content
-        full_path = self._find_content_path(request.request_uri)
+        if encoding is not None:
+            data = entry.encodings[encoding]
+        elif entry.data is not None:
+            data = entry.data
+        else:
+            # too large to be cached, so sent straight from the file
+            data = HTTPResponse.FileContent(entry.path, entry.size)
+
+        response = HTTPResponse(200, data, content_type)
+        if encoding is not None:
+            response.add_header("Content-Encoding", encoding)
+        return response
+
+    def _is_not_modified(self, request, entry):
+        """Check whether the client's copy of a file is still current.
+
+        If-None-Match is used in preference to If-Modified-Since. Any entity
+        tag of the file's current contents, compressed or not, matches. The
+        validators come from the file's metadata, so its contents need not
+        have been read.
 
-        # if no content found
-        if full_path is None:
-            return HTTPResponse(404,
-                                "Failed to find {}".format(request.request_uri)
-                                )
+        Args:
+            request (HTTPRequest): The (conditional) request.
+            entry (StaticFileCache.Entry): The cached file.
 
-        # check if content-type is known
-        file_extension = path.splitext(full_path)[1]
-        if file_extension not in self.FILE_TYPES:
-            response = "Unknown content-type: {}".format(file_extension)
-            return HTTPResponse(501, response)
+        Returns:
+            tuple: Whether a 304 response should be sent (bool), and the
+                content-coding of the matching entity tag (string), or None
+                if it is of the uncompressed file or no tag matched.
+        """
+        if_none_match = request.get_header("If-None-Match")
+        if if_none_match is not None:
+            current = {entry.get_etag(encoding): encoding for encoding
+                       in (None,) + self.ENCODING_PREFERENCE}
+            for etag in if_none_match.split(","):
+                etag = etag.strip()
+                if etag.startswith("W/"):
+                    etag = etag[2:]
+                if etag == "*":
+                    return True, None
+                if etag in current:
+                    return True, current[etag]
+            return False, None
+
+        if_modified_since = request.get_header("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False, None
+            return entry.modified_at <= since, None
+        return False, None
+
+    def _add_cache_headers(self, response, entry, extension, encoding):
+        """Add the validators and caching policy of a file to a response.
 
-        return self._handle_file(full_path,
-                                 self.FILE_TYPES[file_extension],
-                                 file_extension
-                                 )
+        Args:
+            response (HTTPResponse): The response to a request for the file.
+            entry (StaticFileCache.Entry): The cached file.
+            extension (string): The extension of the file.
+            encoding (string): The content-coding of the variant sent, or
+                None if the file is sent uncompressed.
+        """
+        response.add_header("ETag", entry.get_etag(encoding))
+        response.add_header("Last-Modified", entry.last_modified)
+        if extension in self.CACHE_CONTROL:
+            response.add_header("Cache-Control",
+                                self.CACHE_CONTROL[extension])
+        if entry.compressible:
+            response.add_header("Vary", "Accept-Encoding")
 
-    def _do_HEAD(self, request):
-        """Attempt to respond to a HTTP GET request.
+    def _serve_static(self, request, read_content=True):
+        """Respond to a request for a static file.
 
         Args:
             request (HTTPRequest): The request to respond to.
+            read_content (bool): Whether the file's contents are needed, or
+                only its metadata.
 
         Returns:
             HTTPResponse: A valid HTTP response to the request.
         """
-        return self._NOT_IMPLEMENTED()
+        # attempt to find the requested content, reading it only once it
+        # is known to be sent
+        entry = self.static_files.get(request.path, False)
 
-    def _do_POST(self, request):
-        """Attempt to respond to a HTTP POST request.
+        # if no content found
+        if entry is None:
+            return HTTPResponse(404,
+                                "Failed to find {}".format(request.path))
 
-        Args:
-            request (HTTPRequest): The request to respond to.
+        # check if content-type is known
+        file_extension = path.splitext(entry.path)[1]
+        if file_extension not in self.FILE_TYPES:
+            response = "Unknown content-type: {}".format(file_extension)
+            return HTTPResponse(501, response)
 
-        Returns:
-            HTTPResponse: A valid HTTP response to the request.
-        """
-        if request.request_uri.startswith(
-                self.smart_device_handler.SMART_HOME_KEY):
-            return self.smart_device_handler.handle_request(request)
+        not_modified, encoding = self._is_not_modified(request, entry)
+        if not_modified:
+            # the client's copy is current, so send no content
+            if encoding is None:
+                encoding = self._choose_encoding(request, entry.encodings)
+            response = HTTPResponse(304, b"")
+            response.remove_header("Content-Type")
+            response.remove_header("Content-Length")
+        else:
+            if entry.metadata_only and (read_content or (
+                    entry.compressible and self._accepts_encoding(request))):
+                # the compressed variants are made when the file is read,
+                # and a response without content still needs their sizes
+                entry = self.static_files.get(request.path)
+                if entry is None:
+                    return HTTPResponse(
+                        404, "Failed to find {}".format(request.path))
+            encoding = self._choose_encoding(request, entry.encodings)
+            response = self._handle_file(entry,
+                                         self.FILE_TYPES[file_extension],
+                                         encoding
+                                         )
+        self._add_cache_headers(response, entry, file_extension, encoding)
+        return response
 
-    def _do_PUT(self, request):
-        """Attempt to respond to a HTTP PUT request.
+    def _do_GET(self, request):
+        """Attempt to respond to a HTTP GET request for a static file.
 
         Args:
             request (HTTPRequest): The request to respond to.
@@ -123,10 +258,14 @@ class RequestHandler:
         Returns:
             HTTPResponse: A valid HTTP response to the request.
         """
-        return self._NOT_IMPLEMENTED()
+        return self._serve_static(request)
+
+    def _do_HEAD(self, request):
+        """Attempt to respond to a HTTP HEAD request.
 
-    def _do_DELETE(self, request):
-        """Attempt to respond to a HTTP DELETE request.
+        The response has the headers of the equivalent GET response, found
+        from the file's cached metadata without reading its contents, unless
+        the client accepts a compressed variant which has not been made.
 
         Args:
             request (HTTPRequest): The request to respond to.
@@ -134,10 +273,15 @@ class RequestHandler:
         Returns:
             HTTPResponse: A valid HTTP response to the request.
         """
-        return self._NOT_IMPLEMENTED()
+        response = self._serve_static(request, read_content=False)
+        response.remove_content()
+        return response
 
-    def _do_CONNECT(self, request):
-        """Attempt to respond to a HTTP CONNECT request.
+    def _do_smart_home(self, request):
+        """Respond to a smart home request.
+
+        Change streams are requested with GET, e.g. by an EventSource, and
+        everything else with POST.
 
         Args:
             request (HTTPRequest): The request to respond to.
@@ -145,64 +289,89 @@ class RequestHandler:
         Returns:
             HTTPResponse: A valid HTTP response to the request.
         """
-        return self._NOT_IMPLEMENTED()
+        return self.smart_device_handler.handle_request(request)
+
+    def _do_HEAD_smart_home(self, request):
+        """Refuse a HEAD request for a smart home path.
 
-    def _do_OPTIONS(self, request):
-        """Attempt to respond to a HTTP OPTIONS request.
+        The smart home GET responses are change streams and long polls,
+        which would be opened only to be discarded.
 
         Args:
             request (HTTPRequest): The request to respond to.
 
         Returns:
-            HTTPResponse: A valid HTTP response to the request.
+            HTTPResponse: The headers of a 405 response.
         """
-        return self._NOT_IMPLEMENTED()
+        response = self._method_not_allowed(
+            method for method in self.ROUTES.allowed_methods(request.path)
+            if method != HTTPRequest.HTTPMethod.HEAD)
+        response.remove_content()
+        return response
 
-    def _do_TRACE(self, request):
-        """Attempt to respond to a HTTP TRACE request.
+    def _do_metrics(self, request):
+        """Respond to a request for the server's metrics.
 
         Args:
             request (HTTPRequest): The request to respond to.
 
         Returns:
-            HTTPResponse: A valid HTTP response to the request.
+            HTTPResponse: The metrics, in the Prometheus text format.
         """
-        return self._NOT_IMPLEMENTED()
+        response = HTTPResponse(200, self.metrics.render(),
+                                self.METRICS_CONTENT_TYPE)
+        response.add_header("Cache-Control", "no-store")
+        return response
 
-    def _do_PATCH(self, request):
-        """Attempt to respond to a HTTP PATCH request.
+    def _do_HEAD_metrics(self, request):
+        """Respond to a HEAD request for the server's metrics.
 
         Args:
             request (HTTPRequest): The request to respond to.
 
         Returns:
-            HTTPResponse: A valid HTTP response to the request.
-        """
-        return self._NOT_IMPLEMENTED()
-
-    def _NOT_IMPLEMENTED(self):
-        """Generate a "not implemented" response.
-
-        Returns:
-            HTTPResponse: A "not implemented" HTTP response.
+            HTTPResponse: The headers of the metrics response.
         """
-        return HTTPResponse(501, "Not implemented.")
-
-    METHODS = {
-        HTTPRequest.HTTPMethod.GET: _do_GET,
-        HTTPRequest.HTTPMethod.HEAD: _do_HEAD,
-        HTTPRequest.HTTPMethod.POST: _do_POST,
-        HTTPRequest.HTTPMethod.PUT: _do_PUT,
-        HTTPRequest.HTTPMethod.DELETE: _do_DELETE,
-        HTTPRequest.HTTPMethod.CONNECT: _do_CONNECT,
-        HTTPRequest.HTTPMethod.OPTIONS: _do_OPTIONS,
-        HTTPRequest.HTTPMethod.TRACE: _do_TRACE,
-        HTTPRequest.HTTPMethod.PATCH: _do_PATCH
+        response = self._do_metrics(request)
+        response.remove_content()
+        return response
+
+    # routes of each method, by normalised path
+    ROUTES = Router()
+    ROUTES.add_prefix(SmartDeviceHandler.SMART_HOME_KEY, _do_smart_home,
+                      (HTTPRequest.HTTPMethod.GET,
+                       HTTPRequest.HTTPMethod.POST))
+    ROUTES.add_prefix(SmartDeviceHandler.SMART_HOME_KEY, _do_HEAD_smart_home,
+                      (HTTPRequest.HTTPMethod.HEAD,))
+    ROUTES.add(Metrics.METRICS_URI, _do_metrics,
+               (HTTPRequest.HTTPMethod.GET,))
+    ROUTES.add(Metrics.METRICS_URI, _do_HEAD_metrics,
+               (HTTPRequest.HTTPMethod.HEAD,))
+    ROUTES.add_prefix("/", _do_GET, (HTTPRequest.HTTPMethod.GET,))
+    ROUTES.add_prefix("/", _do_HEAD, (HTTPRequest.HTTPMethod.HEAD,))
+
+    # content-codings of compressed files, most preferred first
+    ENCODING_PREFERENCE = ("br", "gzip")
+
+    # Prometheus text exposition format, served at Metrics.METRICS_URI
+    METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    # Cache-Control policy of static files, by extension
+    CACHE_CONTROL = {
+        ".html": "no-cache",
+        ".css": "public, max-age=3600",
+        ".js": "public, max-age=3600",
+        ".png": "public, max-age=86400",
+        ".ico": "public, max-age=86400",
+        ".webmanifest": "public, max-age=86400"
     }
 
+    # MIME type of static files, by extension
     FILE_TYPES = {
-        ".html": "text",
-        ".css": "text",
-        ".png": "image",
-        ".ico": "image"
+        ".html": "text/html",
+        ".css": "text/css",
+        ".js": "text/javascript",
+        ".png": "image/png",
+        ".ico": "image/ico",
+        ".webmanifest": "application/manifest+json"
     }
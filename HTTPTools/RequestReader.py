@@ -0,0 +1,276 @@
+"""Module containing a class to frame HTTP requests from a stream of bytes."""
+from time import perf_counter
+import re
+
+
+class RequestReader:
+    """Class to split the bytes recieved on a connection into HTTP requests.
+
+    Bytes are buffered as they arrive. A request is complete once its header
+    section has been recieved, followed by exactly Content-Length bytes of
+    body, or by a complete chunked body, which is decoded. Requests larger
+    than the configured limits are rejected.
+
+    A request must also arrive in time. The header section is allowed
+    HEADER_TIMEOUT seconds from its first byte, and the body BODY_TIMEOUT
+    seconds from the end of the header section. Each is extended by a
+    second for every MIN_RATE bytes recieved, up to MAX_HEADER_TIME and
+    MAX_BODY_TIME, so a client trickling bytes cannot hold a connection
+    open indefinitely, but a large request on a slow link still arrives.
+    """
+
+    BUFFER_SIZE = 16384  # bytes read from a socket at once
+    MAX_HEADER_SIZE = 16384  # bytes allowed in the header section
+    MAX_BODY_SIZE = 1048576  # bytes allowed in the body
+    MAX_CHUNK_LINE_SIZE = 1024  # bytes allowed in a chunk-size line
+    HEADER_TIMEOUT = 10  # seconds to recieve the header section
+    MAX_HEADER_TIME = 30  # most seconds, however fast it arrives
+    BODY_TIMEOUT = 10  # seconds to recieve the body
+    MAX_BODY_TIME = 60  # most seconds, however fast it arrives
+    MIN_RATE = 500  # bytes a second which extend a deadline by a second
+
+    END_OF_HEADERS = re.compile(b"\r?\n\r?\n")
+
+    class RequestError(Exception):
+        """Exception raised when a request cannot be framed."""
+
+        def __init__(self, status_code, message):
+            """Initialise a RequestError.
+
+            Args:
+                status_code (int): The HTTP status code to respond with.
+                message (string): A description of the error.
+            """
+            Exception.__init__(self, message)
+            self.status_code = status_code
+
+    def __init__(self, max_header_size=None, max_body_size=None):
+        """Initialise an empty RequestReader.
+
+        Args:
+            max_header_size (int): The maximum size of a header section.
+                Default is RequestReader.MAX_HEADER_SIZE.
+            max_body_size (int): The maximum size of a (decoded) body.
+                Default is RequestReader.MAX_BODY_SIZE.
+        """
+        self.max_header_size = (self.MAX_HEADER_SIZE
+                                if max_header_size is None
+                                else max_header_size)
+        self.max_body_size = (self.MAX_BODY_SIZE if max_body_size is None
+                              else max_body_size)
+        self.buffer = bytearray()
+        self.read_buffer = memoryview(bytearray(self.BUFFER_SIZE))
+        self.receive_time = 0.0  # seconds taken to recieve the last request
+        self._start_request()
+
+    def _start_request(self):
+        """Reset the framing state, ready for the next request."""
+        self.head = None  # header section of the current request
+        self.scanned = 0  # bytes searched for the end of the headers
+        self.content_length = 0
+        self.chunked = False
+        self.body = None  # decoded chunked body, so far
+        self.chunk_size = None  # size of the chunk being read
+        # when the first byte of the request was buffered
+        self.started_at = perf_counter() if self.buffer else None
+        self.head_recieved_at = None  # when the header section was complete
+
+    def pending(self):
+        """Check whether part of a request has been recieved.
+
+        Returns:
+            bool: True if there are buffered bytes of an incomplete request.
+        """
+        return bool(self.buffer) or self.head is not None
+
+    def time_left(self):
+        """Find the time left to recieve the rest of the current request.
+
+        Returns:
+            float: The seconds until the request's deadline, which are
+                negative once it has passed, or None if no part of a
+                request has been recieved.
+        """
+        if self.head is None:
+            if self.started_at is None:
+                return None
+            started_at = self.started_at
+            allowed = min(self.HEADER_TIMEOUT + len(self.buffer) /
+                          self.MIN_RATE, self.MAX_HEADER_TIME)
+        else:
+            started_at = self.head_recieved_at
+            recieved = len(self.buffer)
+            if self.body is not None:
+                recieved += len(self.body)
+            allowed = min(self.BODY_TIMEOUT + recieved / self.MIN_RATE,
+                          self.MAX_BODY_TIME)
+        return started_at + allowed - perf_counter()
+
+    def feed(self, data):
+        """Add recieved bytes to the buffer.
+
+        Args:
+            data (byte string): The recieved bytes.
+        """
+        if self.started_at is None:
+            self.started_at = perf_counter()
+        self.buffer += data
+
+    def recv_from(self, client):
+        """Recieve the bytes available on a socket into the buffer.
+
+        Args:
+            client (socket): The socket to recieve from.
+
+        Returns:
+            int: The number of bytes recieved, 0 if the client has closed
+                the connection.
+        """
+        recieved = client.recv_into(self.read_buffer)
+        if recieved and self.started_at is None:
+            self.started_at = perf_counter()
+        self.buffer += self.read_buffer[:recieved]
+        return recieved
+
+    def next_request(self):
+        """Take the next complete request from the buffer.
+
+        Returns:
+            byte string: The header section and decoded body of the request,
+                or None if no request has been completely recieved.
+
+        Raises:
+            RequestReader.RequestError: If the request is malformed or too
+                large.
+        """
+        if self.head is None and not self._read_head():
+            return None
+
+        if self.chunked:
+            body = self._read_chunked_body()
+        else:
+            body = self._read_body()
+        if body is None:
+            return None
+
+        request = self.head + body
+        self.receive_time = perf_counter() - self.started_at
+        self._start_request()
+        return request
+
+    def _read_head(self):
+        """Move a complete header section from the buffer into head.
+
+        Returns:
+            bool: True if the header section has been recieved.
+        """
+        # ignore empty lines preceding a request
+        while self.buffer[:1] in (b"\r", b"\n"):
+            del self.buffer[:1]
+
+        match = self.END_OF_HEADERS.search(self.buffer,
+                                           max(0, self.scanned - 3))
+        end_of_headers = len(self.buffer) if match is None else match.end()
+        if end_of_headers > self.max_header_size:
+            raise self.RequestError(431, "Request headers too large!")
+        if match is None:
+            self.scanned = len(self.buffer)
+            return False
+
+        self.head = bytes(self.buffer[:end_of_headers])
+        self.head_recieved_at = perf_counter()
+        del self.buffer[:end_of_headers]
+        self._parse_framing()
+        return True
+
+    def _parse_framing(self):
+        """Find how the body of the request is framed from its headers."""
+        content_lengths = set()
+        transfer_encoding = None
+        for line in self.head.splitlines()[1:]:
+            field, _, value = line.partition(b":")
+            field = field.strip().lower()
+            if field == b"content-length":
+                content_lengths.add(value.strip())
+            elif field == b"transfer-encoding":
+                transfer_encoding = value.strip().lower()
+
+        if transfer_encoding is not None:
+            if content_lengths:
+                raise self.RequestError(
+                    400, "Both Content-Length and Transfer-Encoding given!")
+            if not transfer_encoding.endswith(b"chunked"):
+                raise self.RequestError(501, "Unsupported Transfer-Encoding!")
+            self.chunked = True
+            self.body = bytearray()
+            return
+
+        if len(content_lengths) > 1:
+            raise self.RequestError(400, "Conflicting Content-Length!")
+        if content_lengths:
+            content_length = content_lengths.pop()
+            if not content_length.isdigit():
+                raise self.RequestError(400, "Invalid Content-Length!")
+            self.content_length = int(content_length)
+            if self.content_length > self.max_body_size:
+                raise self.RequestError(413, "Request body too large!")
+
+    def _read_body(self):
+        """Take a Content-Length framed body from the buffer.
+
+        Returns:
+            byte string: The body, or None if it is incomplete.
+        """
+        if len(self.buffer) < self.content_length:
+            return None
+        body = bytes(self.buffer[:self.content_length])
+        del self.buffer[:self.content_length]
+        return body
+
+    def _read_chunked_body(self):
+        """Decode the chunks of a chunked body from the buffer.
+
+        Returns:
+            byte string: The decoded body, or None if it is incomplete.
+        """
+        while True:
+            if self.chunk_size is None:
+                end_of_line = self.buffer.find(b"\n")
+                if end_of_line == -1:
+                    if len(self.buffer) > self.MAX_CHUNK_LINE_SIZE:
+                        raise self.RequestError(400, "Invalid chunk size!")
+                    return None
+
+                # ignore any chunk extensions
+                size = self.buffer[:end_of_line].split(b";", 1)[0].strip()
+                try:
+                    self.chunk_size = int(size, 16)
+                except ValueError:
+                    raise self.RequestError(400, "Invalid chunk size!")
+                if len(self.body) + self.chunk_size > self.max_body_size:
+                    raise self.RequestError(413, "Request body too large!")
+                del self.buffer[:end_of_line + 1]
+
+            # the last chunk is followed by optional trailers, which are
+            # ignored, and an empty line
+            if self.chunk_size == 0:
+                if self.buffer[:2] == b"\r\n" or self.buffer[:1] == b"\n":
+                    del self.buffer[:self.buffer.find(b"\n") + 1]
+                    return bytes(self.body)
+                match = self.END_OF_HEADERS.search(self.buffer)
+                if match is None:
+                    if len(self.buffer) > self.max_header_size:
+                        raise self.RequestError(
+                            431, "Request trailers too large!")
+                    return None
+                del self.buffer[:match.end()]
+                return bytes(self.body)
+
+            # each chunk of data is followed by a line break
+            if len(self.buffer) < self.chunk_size + 2:
+                return None
+            if self.buffer[self.chunk_size:self.chunk_size + 2] != b"\r\n":
+                raise self.RequestError(400, "Invalid chunk!")
+            self.body += self.buffer[:self.chunk_size]
+            del self.buffer[:self.chunk_size + 2]
+            self.chunk_size = None
@@ -0,0 +1,83 @@
+"""Module containing a table of routes from request paths to handlers."""
+
+
+class Router:
+    """Class to find the function handling a request, by method and path.
+
+    A route is either an exact path, or a prefix ending in "/" which matches
+    every path under it. Routes are kept in dicts, so finding a request's
+    route takes one lookup for an exact path, then one for each
+    "/"-terminated prefix of the path, longest first, however many routes
+    there are.
+    """
+
+    def __init__(self):
+        """Initialise a Router with no routes."""
+        self.exact = {}  # function, by (method, path)
+        self.prefixes = {}  # function, by (method, prefix)
+        self.methods = set()  # every method with a route
+
+    def add(self, path, function, methods):
+        """Route requests for a path to a function.
+
+        Args:
+            path (string): The normalised path.
+            function (function): Called with the request to respond to it.
+            methods (iterable(HTTPRequest.HTTPMethod)): The request methods
+                routed.
+        """
+        for method in methods:
+            self.exact[(method, path)] = function
+            self.methods.add(method)
+
+    def add_prefix(self, prefix, function, methods):
+        """Route requests for every path under a prefix to a function.
+
+        Args:
+            prefix (string): The start of the paths, ending in "/".
+            function (function): Called with the request to respond to it.
+            methods (iterable(HTTPRequest.HTTPMethod)): The request methods
+                routed.
+
+        Raises:
+            Exception: If the prefix does not end in "/".
+        """
+        if not prefix.endswith("/"):
+            raise Exception("Route prefix must end in /: {}".format(prefix))
+        for method in methods:
+            self.prefixes[(method, prefix)] = function
+            self.methods.add(method)
+
+    def find(self, method, path):
+        """Find the function routed a request.
+
+        Args:
+            method (HTTPRequest.HTTPMethod): The request method.
+            path (string): The normalised request path.
+
+        Returns:
+            function: The function routed the request, or None if there is
+                no route for it.
+        """
+        function = self.exact.get((method, path))
+        if function is not None:
+            return function
+        end = path.rfind("/")
+        while end != -1:
+            function = self.prefixes.get((method, path[:end + 1]))
+            if function is not None:
+                return function
+            end = path.rfind("/", 0, end)
+        return None
+
+    def allowed_methods(self, path):
+        """Find the methods with a route for a path.
+
+        Args:
+            path (string): The normalised request path.
+
+        Returns:
+            list(HTTPRequest.HTTPMethod): The methods, in any order.
+        """
+        return [method for method in self.methods
+                if self.find(method, path) is not None]
@@ -1,82 +1,333 @@
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from json import loads, dumps
+from urllib.parse import parse_qs
 from .HTTPResponse import HTTPResponse
+from .DeviceRegistry import DeviceRegistry
+from .DeviceStateStore import DeviceStateStore
+from .DeviceControllerPool import DeviceControllerPool
+from .DeviceEventHub import DeviceEventHub
+from .DirectiveSchema import DirectiveSchema
 
 
 class SmartDeviceHandler():
 
     SMART_HOME_KEY = "/smarthome/"
     DEVICES_FILE = "Smart_Devices/Smart_Devices.json"
+    DEVICE_STATE_DIRECTORY = "Smart_Devices"
+    BATCH_WORKERS = 8  # devices of a batch handled at once
+    POLL_TIMEOUT = 25  # seconds a long-poll waits for changes by default
+    MAX_POLL_TIMEOUT = 60  # most seconds a long-poll may wait
 
     def __init__(self):
-        self.device_file_lock = Lock()
+        self.device_registry = DeviceRegistry(self.DEVICES_FILE)
+        self.device_state_store = DeviceStateStore(
+            self.DEVICE_STATE_DIRECTORY, reserved_files=[self.DEVICES_FILE])
+        self.batch_executor = ThreadPoolExecutor(self.BATCH_WORKERS)
+        self.device_controllers = DeviceControllerPool()
+        self.device_events = DeviceEventHub()
 
     def handle_request(self, request):
-        self.command = request.request_uri[len(self.SMART_HOME_KEY):]
+        command = request.path[len(self.SMART_HOME_KEY):]
+        query = parse_qs(request.query)
 
         try:
-            if self.command == "discover":
-                return self._run_discovery()
+            if command == "discover":
+                return self._run_discovery(request)
 
-            if self.command == "status":
+            if command == "status":
                 return self._run_status_check(request.body)
 
-            if self.command == "directive":
+            if command == "directive":
                 return self._run_directive(request.body)
 
+            if command == "status_batch":
+                return self._run_status_batch(request.body)
+
+            if command == "directive_batch":
+                return self._run_directive_batch(request.body)
+
+            if command == "subscribe":
+                return self._run_subscribe(request, query)
+
+            if command == "poll":
+                return self._run_poll(query)
+
         except Exception as msg:
             return HTTPResponse(500, str(msg))
 
         return HTTPResponse(501, "Not implemented.")
 
-    def _run_discovery(self):
-        device_data = self._load_devices()
-        return HTTPResponse(200, dumps(device_data), "text/json")
+    def _run_discovery(self, request):
+        # the payload is only serialised when the devices file changes
+        payload, etag = self.device_registry.get_discovery()
 
-    def _run_status_check(self, request_body):
-        endpoint_id = request_body.strip()
-        endpoint = self._find_endpoint(endpoint_id)
+        if_none_match = request.get_header("If-None-Match")
+        if if_none_match is not None and any(
+                tag.strip() in (etag, "W/" + etag, "*")
+                for tag in if_none_match.split(",")):
+            response = HTTPResponse(304, b"")
+            response.remove_header("Content-Type")
+            response.remove_header("Content-Length")
+        else:
+            response = HTTPResponse(200, payload, "text/json")
+        response.add_header("ETag", etag)
+        response.add_header("Cache-Control", "no-cache")
+        return response
 
-        if endpoint is None:
+    def _run_status_check(self, request_body):
+        endpoint_id = request_body.strip().decode("utf-8")
+        index = self.device_registry.get_index()
+        if endpoint_id not in index.endpoints:
             return HTTPResponse(404, "endpoint not found!")
 
-        return HTTPResponse(200, "endpoint found!")
+        _, status = self._read_status(endpoint_id)
+        return HTTPResponse(200, dumps(status), "text/json")
+
+    def _read_status(self, endpoint_id):
+        # report the current value of each property
+        state = self.device_state_store.get_state(endpoint_id)
+        properties = [] if state is None else \
+            self._describe_properties(state["properties"])
+        return 200, {"endpointId": endpoint_id, "properties": properties}
+
+    def _describe_properties(self, device_properties):
+        return [
+            {
+                "name": device_property["name"],
+                "instance": device_property.get("instance"),
+                "value": device_property["value"]["current"]
+            }
+            for device_property in device_properties
+        ]
 
     def _run_directive(self, request_body):
-        directive_json = loads(request_body)["directive"]
+        try:
+            directive_json = loads(request_body)
+        except ValueError:
+            return HTTPResponse(400, "invalid JSON!")
+        if not isinstance(directive_json, dict):
+            return HTTPResponse(400, "malformed directive!")
+        directive_json = directive_json.get("directive")
+
+        index = self.device_registry.get_index()
+        error = self._check_directive(index, directive_json)
+        if error is not None:
+            return HTTPResponse(*error)
+
+        status_code, message = self._execute_directive(directive_json)
+        return HTTPResponse(status_code, message)
+
+    def _check_directive(self, index, directive_json):
+        error = DirectiveSchema.check_structure(directive_json)
+        if error is not None:
+            return error
+        return self._check_target(index, directive_json)
+
+    def _check_target(self, index, directive_json):
+        # the directive's structure has already been checked
+        header = directive_json["header"]
 
         # check endpoint exists
         endpoint_id = directive_json["endpoint"]["endpointId"]
-        endpoint = self._find_endpoint(endpoint_id)
-        if endpoint is None:
-            return HTTPResponse(404, "endpoint not found!")
+        if endpoint_id not in index.endpoints:
+            return 404, "endpoint not found!"
 
         # check endpoint has given interface
-        interface = directive_json["header"]["namespace"]
-        if not self._device_has_interface(endpoint, interface):
-            return HTTPResponse(405, "endpoint does not use this interface!")
-
-        return HTTPResponse(200, "Directive")
-
-    def _load_devices(self):
-        self.device_file_lock.acquire()
-        with open(self.DEVICES_FILE, "r") as input_file:
-            devices = loads(input_file.read())
-        self.device_file_lock.release()
-        return devices
-
-    def _find_endpoint(self, endpoint_id):
-        device_data = self._load_devices()
-
-        for endpoint in device_data["endpoints"]:
-            if endpoint["endpointId"] == endpoint_id:
-                return endpoint
-
-        # otherwise, endpoint not found
-        return None
-
-    def _device_has_interface(self, endpoint, interface):
-        for capability in endpoint["capabilities"]:
-            if capability["interface"] == interface:
-                return True
-        return False
+        interface = header["namespace"]
+        if (endpoint_id, interface) not in index.interfaces:
+            return 405, "endpoint does not use this interface!"
+
+        # check the directive against the capability's compiled schema
+        key = (endpoint_id, interface, header.get("instance"))
+        if key not in index.capabilities:
+            return 400, "endpoint has no such instance!"
+        validator = index.validators.get(key)
+        if validator is None:
+            return None
+        return validator(header, directive_json.get("payload", {}))
+
+    def _execute_directive(self, directive_json):
+        self._apply_directive(directive_json["endpoint"]["endpointId"],
+                              directive_json["header"],
+                              directive_json.get("payload", {}))
+        return 200, "Directive"
+
+    def _apply_directive(self, endpoint_id, header, payload):
+        if header["namespace"] != "Alexa.RangeController":
+            return
+        if header["name"] not in ("SetRangeValue", "AdjustRangeValue"):
+            return
+
+        changed = []
+
+        def update(state):
+            for device_property in state["properties"]:
+                if device_property["name"] != "rangeValue" or \
+                        device_property.get("instance") != \
+                        header.get("instance"):
+                    continue
+
+                value = device_property["value"]
+                if header["name"] == "SetRangeValue":
+                    target = payload["rangeValue"]
+                else:
+                    target = value["current"] + payload["rangeValueDelta"]
+                # keep the value within the supported range
+                value["current"] = min(max(target, value["min"]),
+                                       value["max"])
+                changed.append(device_property)
+
+        self.device_state_store.update(endpoint_id, update)
+        if changed:
+            self.device_events.publish(endpoint_id,
+                                       self._describe_properties(changed))
+
+        # the device is set in the background, once the state is saved
+        for device_property in changed:
+            if "controller" in device_property:
+                self.device_controllers.submit(
+                    endpoint_id, device_property.get("instance"),
+                    device_property["controller"],
+                    device_property["value"]["current"])
+
+    def _run_status_batch(self, request_body):
+        try:
+            endpoint_ids = loads(request_body)
+        except ValueError:
+            return HTTPResponse(400, "invalid JSON!")
+        if not isinstance(endpoint_ids, list):
+            return HTTPResponse(400, "expected an array of endpoint ids!")
+
+        # validate every endpoint against one version of the index
+        index = self.device_registry.get_index()
+        results = [None] * len(endpoint_ids)
+        valid = []
+        for position, endpoint_id in enumerate(endpoint_ids):
+            if isinstance(endpoint_id, str) and endpoint_id in index.endpoints:
+                valid.append((position, endpoint_id, endpoint_id))
+            else:
+                results[position] = (404, "endpoint not found!")
+
+        self._run_batch(valid, self._read_status, results)
+        return self._batch_response(endpoint_ids, results)
+
+    def _run_directive_batch(self, request_body):
+        try:
+            directives = loads(request_body)
+        except ValueError:
+            return HTTPResponse(400, "invalid JSON!")
+        if not isinstance(directives, list):
+            return HTTPResponse(400, "expected an array of directives!")
+
+        # validate every directive against one version of the index
+        index = self.device_registry.get_index()
+        results = [None] * len(directives)
+        endpoint_ids = [None] * len(directives)
+        valid = []
+        for position, directive in enumerate(directives):
+            directive_json = directive.get("directive") \
+                if isinstance(directive, dict) else None
+            error = DirectiveSchema.check_structure(directive_json)
+            if error is None:
+                endpoint_ids[position] = \
+                    directive_json["endpoint"]["endpointId"]
+                # a bad item fails on its own, not the whole batch
+                try:
+                    error = self._check_target(index, directive_json)
+                except Exception as msg:
+                    error = 500, str(msg)
+            if error is None:
+                valid.append((position, endpoint_ids[position],
+                              directive_json))
+            else:
+                results[position] = error
+
+        self._run_batch(valid, self._execute_directive, results)
+        return self._batch_response(endpoint_ids, results)
+
+    def _run_batch(self, items, run_item, results):
+        # items for one device run in order, while devices run concurrently
+        by_device = {}
+        for position, endpoint_id, item in items:
+            by_device.setdefault(endpoint_id, []).append((position, item))
+
+        def run_device(device_items):
+            for position, item in device_items:
+                try:
+                    results[position] = run_item(item)
+                except Exception as msg:
+                    results[position] = (500, str(msg))
+
+        futures = [self.batch_executor.submit(run_device, device_items)
+                   for device_items in by_device.values()]
+        for future in futures:
+            future.result()
+
+    def _batch_response(self, endpoint_ids, results):
+        body = [
+            {"endpointId": endpoint_id, "status": status_code,
+             "result": result}
+            for endpoint_id, (status_code, result)
+            in zip(endpoint_ids, results)
+        ]
+        return HTTPResponse(200, dumps(body), "text/json")
+
+    def _query_endpoints(self, query):
+        # endpoints=a,b limits the changes to those devices
+        if "endpoints" not in query:
+            return None
+        return {endpoint_id for value in query["endpoints"]
+                for endpoint_id in value.split(",") if endpoint_id}
+
+    def _too_many_subscribers(self):
+        response = HTTPResponse(503, "too many subscribers!")
+        response.add_header("Retry-After",
+                            str(self.device_events.RETRY // 1000))
+        return response
+
+    def _run_subscribe(self, request, query):
+        if not self.device_events.try_subscribe():
+            return self._too_many_subscribers()
+
+        # an EventSource resumes from the last change it recieved
+        try:
+            last_event_id = int(request.get_header("Last-Event-ID"))
+        except (TypeError, ValueError):
+            last_event_id = None
+        last_id = self.device_events.resume_id(last_event_id)
+
+        stream = self.device_events.subscribe(
+            last_id, self._query_endpoints(query))
+        # the place is given back when the stream is closed
+        response = HTTPResponse(200, HTTPResponse.StreamContent(
+            stream, self.device_events.release), "text/event-stream")
+        response.add_header("Cache-Control", "no-cache")
+        return response
+
+    def _run_poll(self, query):
+        try:
+            after = int(query["after"][0]) if "after" in query else None
+            timeout = min(float(query["timeout"][0]), self.MAX_POLL_TIMEOUT) \
+                if "timeout" in query else self.POLL_TIMEOUT
+        except ValueError:
+            return HTTPResponse(400, "invalid after or timeout!")
+        # a long poll holds a thread, so it takes a subscriber's place
+        if not self.device_events.try_subscribe():
+            return self._too_many_subscribers()
+        last_id = self.device_events.resume_id(after)
+        endpoint_ids = self._query_endpoints(query)
+
+        # the wait happens while the response is sent, off the request path
+        def poll():
+            events, last_seen = self.device_events.wait(
+                last_id, endpoint_ids, max(timeout, 0))
+            body = {
+                "lastEventId": last_seen,
+                "events": [dict(event.data, id=event.id) for event in events]
+            }
+            yield dumps(body).encode("utf-8")
+
+        response = HTTPResponse(200, HTTPResponse.StreamContent(
+            poll(), self.device_events.release), "text/json")
+        response.add_header("Cache-Control", "no-cache")
+        return response
@@ -0,0 +1,332 @@
+"""Module containing an in-memory cache of static files."""
+from collections import OrderedDict
+from email.utils import formatdate
+from gzip import compress as gzip_compress
+from os import path, stat, walk
+from threading import Lock
+from time import monotonic
+
+try:
+    from brotli import compress as brotli_compress
+except ImportError:
+    brotli_compress = None
+
+
+class StaticFileCache:
+    """Class to cache the paths and contents of static files.
+
+    Every file under the root directory is indexed by its URI path when the
+    cache is created, so finding a file, or finding that there is none, is
+    a dict lookup. The index is rebuilt when a path is not found, at most
+    once every INDEX_INTERVAL seconds, to pick up new files. File contents
+    are kept in memory, evicting the least recently used files beyond a
+    byte budget.
+    A cached file is only checked for changes (by its modification time and
+    size) once every CHECK_INTERVAL seconds, so repeated requests for it do
+    not touch the filesystem.
+
+    Text files are compressed once, when they are loaded, and the compressed
+    variants kept alongside the original contents. precompress() loads them
+    all up front, so no request waits for compression. Brotli variants are
+    only made if the brotli package is installed.
+    """
+
+    MAX_BYTES = 64 * 1024 * 1024  # total bytes of file contents cached
+    MAX_FILE_SIZE = 4 * 1024 * 1024  # larger files are read on each request
+    CHECK_INTERVAL = 2  # seconds between checks of a file for changes
+    INDEX_INTERVAL = 10  # least seconds between rebuilds of the index
+    COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg",
+                               ".txt", ".xml", ".webmanifest"}
+
+    class Entry:
+        """Class to store a cached file."""
+
+        def __init__(self, full_path, size, mtime, data, encodings=None):
+            """Initialise a cache entry.
+
+            Args:
+                full_path (string): The full path to the file.
+                size (int): The size of the file, in bytes.
+                mtime (int): The modification time of the file, in ns.
+                data (byte string): The contents of the file, or None if it
+                    is too large to cache.
+                encodings (dict): The compressed contents of the file,
+                    keyed by content-coding, e.g. "gzip".
+            """
+            self.path = full_path
+            self.size = size
+            self.mtime = mtime
+            self.data = data
+            self.encodings = {} if encodings is None else encodings
+            self.compressible = False
+            self.metadata_only = False  # contents not read, though cacheable
+            self.checked_at = monotonic()
+
+            # validators, used by clients to revalidate their copies
+            self.etag = '"{:x}-{:x}"'.format(mtime, size)
+            self.modified_at = mtime // 1000000000  # whole seconds
+            self.last_modified = formatdate(self.modified_at, usegmt=True)
+
+        def get_etag(self, encoding=None):
+            """Find the entity tag of the file, or of a compressed variant.
+
+            Args:
+                encoding (string): The content-coding of the variant, or
+                    None for the original file.
+
+            Returns:
+                string: The quoted entity tag.
+            """
+            if encoding is None:
+                return self.etag
+            return self.etag[:-1] + "-" + encoding + '"'
+
+        def cached_bytes(self):
+            """Find the memory used by the entry's contents.
+
+            Returns:
+                int: The bytes of original and compressed contents cached.
+            """
+            if self.data is None:
+                return 0
+            return len(self.data) + sum(len(variant) for variant
+                                        in self.encodings.values())
+
+    def __init__(self, root, max_bytes=None, check_interval=None,
+                 index_interval=None):
+        """Initialise an empty cache of the files in a directory.
+
+        Args:
+            root (string): The directory which URIs are resolved within.
+            max_bytes (int): The budget for cached file contents.
+                Default is StaticFileCache.MAX_BYTES.
+            check_interval (float): The seconds between checks of a file for
+                changes. Default is StaticFileCache.CHECK_INTERVAL.
+            index_interval (float): The least seconds between rebuilds of
+                the index. Default is StaticFileCache.INDEX_INTERVAL.
+        """
+        self.root = path.abspath(root)
+        self.max_bytes = self.MAX_BYTES if max_bytes is None else max_bytes
+        self.check_interval = (self.CHECK_INTERVAL if check_interval is None
+                               else check_interval)
+        self.index_interval = (self.INDEX_INTERVAL if index_interval is None
+                               else index_interval)
+        self.lock = Lock()
+        self.files = OrderedDict()  # full path -> Entry, least recent first
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reads = 0
+        self.index = {}  # URI path -> full path
+        self.indexed_at = 0.0
+        self.reindex()
+
+    def reindex(self):
+        """Index the URI path of every file in the root directory.
+
+        A directory containing index.html is also indexed, with and without
+        a trailing slash. Hidden files and directories are left out.
+        """
+        self.indexed_at = monotonic()
+        index = {}
+        for directory, directory_names, file_names in walk(self.root):
+            directory_names[:] = [name for name in directory_names
+                                  if not name.startswith(".")]
+            relative_path = path.relpath(directory, self.root)
+            uri = "/" if relative_path == "." else \
+                "/" + relative_path.replace(path.sep, "/") + "/"
+            for file_name in file_names:
+                if not file_name.startswith("."):
+                    index[uri + file_name] = path.join(directory, file_name)
+            if "index.html" in file_names:
+                index[uri] = index[uri.rstrip("/") or "/"] = \
+                    path.join(directory, "index.html")
+        self.index = index
+
+    def _find_path(self, uri):
+        """Find the file in the root directory for a given URI path.
+
+        If the path is not indexed, the index is rebuilt first if it is old
+        enough.
+
+        Args:
+            uri (string): The normalised URI path of the file.
+
+        Returns:
+            string: The full path to the file, or None if there is none.
+        """
+        full_path = self.index.get(uri)
+        if full_path is None and \
+                monotonic() - self.indexed_at >= self.index_interval:
+            self.reindex()
+            full_path = self.index.get(uri)
+        return full_path
+
+    def _load(self, full_path, read=True):
+        """Read a file into a new cache entry.
+
+        Args:
+            full_path (string): The full path to the file.
+            read (bool): Whether the contents are needed. If not, only the
+                file's metadata is loaded, and its compressed variants are
+                made once it is read.
+
+        Returns:
+            StaticFileCache.Entry: The entry, or None if the file is missing.
+        """
+        compressible = (path.splitext(full_path)[1]
+                        in self.COMPRESSIBLE_EXTENSIONS)
+        try:
+            status = stat(full_path)
+            cacheable = status.st_size <= self.MAX_FILE_SIZE
+            data = None
+            if cacheable and read:
+                with open(full_path, "rb") as input_file:
+                    data = input_file.read()
+                self.reads += 1
+        except OSError:
+            return None
+
+        entry = self.Entry(full_path, status.st_size, status.st_mtime_ns,
+                           data)
+        entry.metadata_only = cacheable and data is None
+        if compressible:
+            entry.compressible = True
+            if data is not None:
+                entry.encodings = self._compress(data)
+        return entry
+
+    def _compress(self, data):
+        """Make the compressed variants of a file's contents.
+
+        Args:
+            data (byte string): The contents of the file.
+
+        Returns:
+            dict: The compressed contents, keyed by content-coding. Only
+                variants smaller than the original are included.
+        """
+        variants = {"gzip": gzip_compress(data, 9, mtime=0)}
+        if brotli_compress is not None:
+            variants["br"] = brotli_compress(data)
+        return {coding: variant for coding, variant in variants.items()
+                if len(variant) < len(data)}
+
+    def _is_current(self, entry):
+        """Check whether a cached file is unchanged on disk.
+
+        The file is only examined once every check_interval seconds.
+
+        Args:
+            entry (StaticFileCache.Entry): The cached file.
+
+        Returns:
+            bool: False if the file has changed or been removed.
+        """
+        now = monotonic()
+        if now - entry.checked_at < self.check_interval:
+            return True
+        try:
+            status = stat(entry.path)
+        except OSError:
+            return False
+        entry.checked_at = now
+        return (status.st_mtime_ns == entry.mtime
+                and status.st_size == entry.size)
+
+    def _store(self, entry):
+        """Add an entry, evicting the least recently used beyond the budget.
+
+        Must be called while holding the lock.
+        """
+        self._discard(entry.path)
+        self.files[entry.path] = entry
+        self.cached_bytes += entry.cached_bytes()
+
+        while self.cached_bytes > self.max_bytes and len(self.files) > 1:
+            _, evicted = self.files.popitem(last=False)
+            self.cached_bytes -= evicted.cached_bytes()
+            self.evictions += 1
+
+    def _discard(self, full_path):
+        """Remove a file from the cache, if present.
+
+        Must be called while holding the lock.
+        """
+        entry = self.files.pop(full_path, None)
+        if entry is not None:
+            self.cached_bytes -= entry.cached_bytes()
+
+    def get(self, uri, read=True):
+        """Find the cached file for a URI, loading it if necessary.
+
+        Args:
+            uri (string): The normalised URI path, see HTTPRequest.path.
+            read (bool): Whether the file's contents are needed, or only its
+                metadata. Default is True.
+
+        Returns:
+            StaticFileCache.Entry: The cached file, or None if no file was
+                found for the URI.
+        """
+        full_path = self._find_path(uri)
+        if full_path is None:
+            return None
+
+        with self.lock:
+            entry = self.files.get(full_path)
+            if (entry is not None and not (read and entry.metadata_only)
+                    and self._is_current(entry)):
+                self.files.move_to_end(full_path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # read the file outside the lock
+        entry = self._load(full_path, read)
+
+        with self.lock:
+            if entry is None:
+                self._discard(full_path)
+                return None
+            self._store(entry)
+        return entry
+
+    def warm(self):
+        """Load every file in the root directory into the cache.
+
+        Returns:
+            int: The number of files loaded.
+        """
+        uris = {full_path: uri for uri, full_path in self.index.items()}
+        return sum(1 for uri in uris.values() if self.get(uri) is not None)
+
+    def precompress(self):
+        """Load and compress every compressible file in the root directory.
+
+        Returns:
+            int: The number of files loaded.
+        """
+        uris = {full_path: uri for uri, full_path in self.index.items()
+                if path.splitext(full_path)[1]
+                in self.COMPRESSIBLE_EXTENSIONS}
+        return sum(1 for uri in uris.values() if self.get(uri) is not None)
+
+    def stats(self):
+        """Take a snapshot of the cache's statistics.
+
+        Returns:
+            dict: Hit, miss, eviction and file read counts, and the number
+                of files and bytes cached.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reads": self.reads,
+                "files": len(self.files),
+                "bytes": self.cached_bytes,
+                "indexed": len(self.index)
+            }
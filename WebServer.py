@@ -2,12 +2,38 @@
 
 Handling of requests is delegated to a "request handler" class.
 """
-from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+from socket import (socket, socketpair, AF_INET, SOCK_STREAM, SOL_SOCKET,
+                    SO_REUSEADDR)
 import select
-from threading import Thread
+import selectors
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from json import dumps, loads
+from math import ceil
+from os import getpid, kill
+from queue import Queue, Full
+from signal import SIGINT, SIGKILL, SIGTERM, SIG_IGN, signal
+from threading import Thread, Lock
+from time import monotonic, perf_counter, sleep, time
+from traceback import print_exc
+try:
+    from os import sendfile
+except ImportError:
+    sendfile = None
+try:
+    from os import WNOHANG, _exit, fork, waitpid
+    from socket import AF_UNIX, MSG_DONTWAIT, SOCK_SEQPACKET, SO_REUSEPORT
+except ImportError:
+    fork = None  # serving from several processes needs a POSIX system
 from HTTPTools.RequestHandler import RequestHandler
 from HTTPTools.HTTPResponse import HTTPResponse
 from HTTPTools.HTTPRequest import HTTPRequest
+from HTTPTools.RequestReader import RequestReader
+from HTTPTools.DeviceControllerPool import DeviceControllerPool
+from HTTPTools.DeviceStateStore import DeviceStateStore
+from HTTPTools.Metrics import Metrics
+from HTTPTools.RateLimiter import RateLimiter
 
 
 class WebServer:
@@ -19,33 +45,396 @@ class WebServer:
     HOST, PORT = '', 8080  # localhost port 8080
     ADDRESS_FAMILY = AF_INET  # ipv4 addresses
     SOCKET_TYPE = SOCK_STREAM  # TCP socket
-    REQUEST_QUEUE_SIZE = 5  # only 1 connection handled at a time
+    REQUEST_QUEUE_SIZE = 5  # connections waiting in the listen backlog
+    SERVING_MODES = ("threaded", "event-loop", "worker-pool")
+    SHUTDOWN_TIMEOUT = 10  # seconds allowed to finish serving on shutdown
+    WRITE_TIMEOUT = 10  # seconds to send a response, extended at the rate:
+    MIN_WRITE_RATE = 8192  # bytes a second which extend it by a second
 
-    def __init__(self):
-        """Create a TCP socket."""
+    def __init__(self, port=None, mode="threaded", request_queue_size=None,
+                 workers=None, worker_queue_size=None, processes=None,
+                 reuse_port=False):
+        """Create a TCP socket.
+
+        Args:
+            port (int): The port to listen on. Default is WebServer.PORT.
+            mode (string): How client connections are served, one of
+                WebServer.SERVING_MODES. Default is "threaded".
+            request_queue_size (int): The size of the listen backlog.
+                Default is WebServer.REQUEST_QUEUE_SIZE.
+            workers (int): The number of threads in "worker-pool" mode.
+            worker_queue_size (int): The number of connections allowed to
+                wait for a worker in "worker-pool" mode.
+            processes (int): The number of worker processes to fork, each
+                serving in the given mode. Default is 1, serving from this
+                process.
+            reuse_port (bool): Whether to bind with SO_REUSEPORT, so that
+                each worker process listens on its own socket.
+        """
+        if mode not in self.SERVING_MODES:
+            raise Exception("Unknown serving mode: {}".format(mode))
+        self.mode = mode
+        self.processes = 1 if processes is None else processes
+        if self.processes > 1 and fork is None:
+            raise Exception("Worker processes need a POSIX system!")
+        self.reuse_port = reuse_port
+        self.request_queue_size = (self.REQUEST_QUEUE_SIZE
+                                   if request_queue_size is None
+                                   else request_queue_size)
+        self.workers = workers
+        self.worker_queue_size = worker_queue_size
+
+        self.listen_socket = self._bind(self.PORT if port is None else port)
+        self.port = self.listen_socket.getsockname()[1]
+        # with SO_REUSEPORT, each worker process listens on its own socket
+        if not (reuse_port and self.processes > 1):
+            self.listen_socket.listen(self.request_queue_size)
+
+        self.worker_pool = None
+        self.event_loop = None
+        self.stopping = False
+
+    def _bind(self, port):
+        """Create a TCP socket bound to a port.
+
+        Args:
+            port (int): The port to bind to, or 0 for any free port.
+
+        Returns:
+            socket: The bound socket.
+        """
         listen_socket = socket(self.ADDRESS_FAMILY, self.SOCKET_TYPE)
         listen_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-        listen_socket.bind((self.HOST, self.PORT))
-        listen_socket.listen(self.REQUEST_QUEUE_SIZE)
-        self.listen_socket = listen_socket
+        if self.reuse_port:
+            listen_socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        listen_socket.bind((self.HOST, port))
+        return listen_socket
+
+    @staticmethod
+    def wants_keep_alive(request):
+        """Check whether a client wants its connection kept open.
+
+        HTTP/1.1 connections persist unless the client sends
+        "Connection: close", older versions only persist if the client sends
+        "Connection: keep-alive".
+
+        Args:
+            request (HTTPRequest): The client's request.
+
+        Returns:
+            bool: True if the connection should persist.
+        """
+        connection = request.get_header("Connection", "").lower()
+
+        if request.http_version == "HTTP/1.1":
+            return "close" not in connection
+        return "keep-alive" in connection
+
+    @staticmethod
+    def create_response(request_data, request_handler,
+                        allow_keep_alive=False, timing=None,
+                        client_address=None):
+        """Generate the response to a raw client request.
+
+        A client over its rate limit is sent a 429 response, and the
+        connection closed, once the request line is parsed and before the
+        request is handled.
+
+        Args:
+            request_data (byte string): The raw HTTP request.
+            request_handler (RequestHandler): The handler used to respond to
+                a valid request.
+            allow_keep_alive (bool): Whether the connection may be kept open
+                after the response, if the client asks for it.
+            timing (Metrics.RequestTiming): The timing of the request, whose
+                request details and parse and handle phases are filled in.
+            client_address (tuple): A tuple containing the IP and port of
+                the client, used to limit its rate. Default is None, which
+                does not limit the request.
+
+        Returns:
+            tuple: A valid HTTP response (HTTPResponse), and whether the
+                connection should be kept open after it is sent (bool).
+        """
+        keep_alive = False
+        started = perf_counter()
+
+        # attempt to parse the request as a HTTPRequest
+        try:
+            request = HTTPRequest(request_data)
+        except Exception as msg:
+            # generate response to invalid request
+            response = HTTPResponse(400, str(msg))
+            parsed = perf_counter()
+        else:
+            parsed = perf_counter()
+            if timing is not None:
+                timing.method = request.method.value
+                timing.uri = request.path
+            if client_address is not None and \
+                    request_handler.rate_limiter.rules:
+                retry_after = request_handler.rate_limiter.check(
+                    client_address[0], request.path)
+                if retry_after:
+                    response = HTTPResponse(429, "Too many requests.")
+                    response.add_header("Retry-After",
+                                        str(ceil(retry_after)))
+                    response.add_header("Connection", "close")
+                    if timing is not None:
+                        timing.parse = parsed - started
+                        timing.status_code = 429
+                    return response, False
+            # generate response to valid request
+            try:
+                response = request_handler.generate_response(request)
+            except Exception as msg:
+                response = HTTPResponse(500, str(msg))
+            if response is None:
+                response = HTTPResponse(
+                    404, "Failed to find {}".format(request.request_uri))
+            # a streamed body ends when the connection is closed
+            keep_alive = (allow_keep_alive and not response.is_stream()
+                          and WebServer.wants_keep_alive(request))
+
+        response.add_header("Connection",
+                            "keep-alive" if keep_alive else "close")
+        if timing is not None:
+            timing.parse = parsed - started
+            timing.handle = perf_counter() - parsed
+            timing.status_code = response.status_code
+        return response, keep_alive
+
+    @staticmethod
+    def count_bytes(response, buffers):
+        """Find the size of a response.
+
+        Args:
+            response (HTTPResponse): The response.
+            buffers (list(byte string)): The response's buffers, see
+                HTTPResponse.create_http_buffers.
+
+        Returns:
+            int: The number of bytes in the response, excluding streamed
+                content.
+        """
+        size = sum(len(buffer) for buffer in buffers)
+        if response.is_file():
+            size += response.content.size
+        return size
+
+    @staticmethod
+    def write_deadline(size):
+        """Find when a response must be sent by, so slow readers are cut off.
+
+        Args:
+            size (int): The number of bytes in the response.
+
+        Returns:
+            float: The monotonic() time by which it must be sent.
+        """
+        return monotonic() + WebServer.WRITE_TIMEOUT + \
+            size / WebServer.MIN_WRITE_RATE
+
+    @staticmethod
+    def send_response(client, response, timing):
+        """Send a response over a blocking socket, timing it.
+
+        The response must be sent by its write_deadline.
+
+        Args:
+            client (socket): The socket connected to the client.
+            response (HTTPResponse): The response to send.
+            timing (Metrics.RequestTiming): The timing of the request, whose
+                serialize and send phases are filled in.
+        """
+        started = perf_counter()
+        buffers = response.create_http_buffers()
+        serialized = perf_counter()
+        timing.serialize = serialized - started
+        timing.status_code = response.status_code
+        timing.bytes_sent = WebServer.count_bytes(response, buffers)
+        response.send(client, buffers,
+                      WebServer.write_deadline(timing.bytes_sent))
+        timing.send = perf_counter() - serialized
+
+    @staticmethod
+    def create_error_response(error):
+        """Generate the response to a request which could not be read.
+
+        Args:
+            error (RequestReader.RequestError): The reason the request could
+                not be read.
+
+        Returns:
+            HTTPResponse: A valid HTTP response, closing the connection.
+        """
+        response = HTTPResponse(error.status_code, str(error))
+        response.add_header("Connection", "close")
+        return response
 
     def serve_forever(self):
-        """Continually accept and respond to client requests."""
-        print("Serving on port {} ...".format(self.PORT))
-        while True:
-            client_connection, client_address = self.listen_socket.accept()
-            print("Request made from {}".format(client_address))
+        """Accept and respond to client requests until shut down.
+
+        With several processes, worker processes are forked to serve, and
+        this process supervises them.
+        """
+        if self.processes > 1:
+            WebServer.Supervisor(self).run()
+        else:
+            self._serve()
+
+    def shutdown(self):
+        """Stop accepting connections, so that serve_forever returns.
+
+        Connections already accepted are served for up to SHUTDOWN_TIMEOUT
+        seconds first. Safe to call from a signal handler.
+        """
+        self.stopping = True
+        if self.event_loop is not None:
+            self.event_loop.stop(self.SHUTDOWN_TIMEOUT)
+        else:
+            # interrupts the blocking accept in _serve
+            self.listen_socket.close()
+
+    def _serve(self):
+        """Accept and respond to client requests in this process."""
+        print("Serving on port {} ({}) ...".format(self.port, self.mode))
+        if self.mode == "event-loop" and not self.stopping:
+            self.event_loop = WebServer.EventLoop(self.listen_socket)
+            self.event_loop.run()
+            return
+        if self.mode == "worker-pool":
+            # the pool's threads are started in the serving process
+            self.worker_pool = WebServer.WorkerPool(self.workers,
+                                                    self.worker_queue_size)
+
+        while not self.stopping:
+            try:
+                client_connection, client_address = \
+                    self.listen_socket.accept()
+            except OSError:
+                if self.stopping:
+                    break
+                raise
+            if not WebServer.connection_limiter.acquire(client_address):
+                WebServer.connection_limiter.reject(client_connection)
+                continue
+            if self.worker_pool is not None:
+                self.worker_pool.submit(client_connection, client_address)
+                self.worker_pool.report_stats()
+                continue
             ct = WebServer.ClientThread(client_connection, client_address)
             ct.start()
 
-    class ClientThread(Thread):
-        """Class to handle a client request on a single thread."""
+        # let the connections already accepted finish
+        deadline = monotonic() + self.SHUTDOWN_TIMEOUT
+        while (WebServer.ClientConnection.active or
+               (self.worker_pool is not None and
+                not self.worker_pool.queue.empty())) and \
+                monotonic() < deadline:
+            sleep(0.1)
+
+    class ConnectionLimiter:
+        """Class to cap the connections open at once from each IP address.
+
+        Each IP's count is removed when its last connection closes, so only
+        clients with open connections take up memory, and nothing needs to
+        be swept.
+        """
 
-        BUFFER_SIZE = 4096  # somewhat arbitrary
-        READ_TIMEOUT = 2  # 1 seconds
+        MAX_PER_IP = 64  # connections open at once from one IP address
+        REJECTION = (b"HTTP/1.1 429 Too Many Requests\r\n"
+                     b"Content-Type: text/plain\r\n"
+                     b"Content-Length: 26\r\n"
+                     b"Connection: close\r\n\r\n"
+                     b"Too many connections open.")
+
+        def __init__(self, max_per_ip=None):
+            """Initialise a ConnectionLimiter with no connections open.
+
+            Args:
+                max_per_ip (int): The connections allowed from one IP
+                    address, or 0 for no limit. Default is
+                    ConnectionLimiter.MAX_PER_IP.
+            """
+            self.max_per_ip = (self.MAX_PER_IP if max_per_ip is None
+                               else max_per_ip)
+            self.counts = {}  # open connections, by IP address
+            self.lock = Lock()
+            self.rejected = 0
+
+        def acquire(self, address):
+            """Count a new connection, if its IP address is under the cap.
+
+            Args:
+                address (tuple): A tuple containing the IP and port of the
+                    client.
+
+            Returns:
+                bool: True if the connection may be served, and must be
+                    released when closed.
+            """
+            ip = address[0]
+            with self.lock:
+                count = self.counts.get(ip, 0)
+                if self.max_per_ip and count >= self.max_per_ip:
+                    self.rejected += 1
+                    return False
+                self.counts[ip] = count + 1
+            return True
+
+        def release(self, address):
+            """Stop counting a closed connection.
+
+            Args:
+                address (tuple): A tuple containing the IP and port of the
+                    client.
+            """
+            ip = address[0]
+            with self.lock:
+                count = self.counts.pop(ip) - 1
+                if count:
+                    self.counts[ip] = count
+
+        def reject(self, client):
+            """Send a rejection, if it fits in the socket's buffer, and close.
+
+            Args:
+                client (socket): A newly accepted socket.
+            """
+            try:
+                client.setblocking(False)
+                client.send(self.REJECTION)
+            except OSError:
+                pass
+            finally:
+                client.close()
+
+    connection_limiter = ConnectionLimiter()
+
+    class ClientConnection:
+        """Class to handle a client connection on the calling thread.
+
+        HTTP/1.1 connections are kept open between requests, until the client
+        asks for them to be closed, stays idle for KEEP_ALIVE_TIMEOUT seconds
+        or has sent MAX_KEEP_ALIVE_REQUESTS requests. Pipelined requests are
+        answered in order.
+
+        A request must keep arriving, with no gap longer than READ_TIMEOUT,
+        and be complete by the deadline set by the RequestReader, or the
+        client is sent a 408 response. Responses must be sent by their
+        WebServer.write_deadline.
+        """
+
+        READ_TIMEOUT = 2  # seconds to wait for the rest of a request
+        KEEP_ALIVE_TIMEOUT = 5  # seconds to wait for the next request
+        MAX_KEEP_ALIVE_REQUESTS = 100  # requests served per connection
+
+        active = 0  # connections being handled, in every thread
+        active_lock = Lock()
 
         def __init__(self, client, address):
-            """Initialise a thread to handle a client request.
+            """Initialise a handler for a client connection.
 
             Args:
                 client (socket): A socket object, currently accepting a
@@ -53,64 +442,927 @@ class WebServer:
                 address (tuple): A tuple containing the IP and port of the
                     connected client.
             """
-            Thread.__init__(self, daemon=True)
             self.client = client
             self.address = address
             self.request_handler = RequestHandler()
+            self.reader = RequestReader()
 
         def _recieve_data(self):
-            """Read all available bytes from the buffer."""
+            """Read bytes until a complete request has been recieved.
+
+            The request is stored in request_data, which is None if the
+            client closed the connection or stayed idle. Any bytes of
+            following requests are kept in the reader.
+
+            Raises:
+                RequestReader.RequestError: If the request is malformed, too
+                    large or not completed in time.
+            """
             self.client.setblocking(0)
 
-            request_data = b""
-            while True:
+            self.request_data = self.reader.next_request()
+            while self.request_data is None:
                 # check if there is data to be read
-                ready = select.select([self.client], [], [], self.READ_TIMEOUT)
-                if ready[0]:
-                    # read new data
-                    new_data = self.client.recv(self.BUFFER_SIZE)
-                    request_data += new_data
-
-                    if len(new_data) < self.BUFFER_SIZE:
-                        break
+                pending = self.reader.pending()
+                if pending:
+                    timeout = min(self.READ_TIMEOUT, self.reader.time_left())
+                    if timeout <= 0:
+                        raise RequestReader.RequestError(
+                            408, "Timed out reading request!")
+                else:
+                    timeout = self.KEEP_ALIVE_TIMEOUT
+                ready = select.select([self.client], [], [], timeout)
+                if not ready[0]:
+                    if pending:
+                        raise RequestReader.RequestError(
+                            408, "Timed out reading request!")
+                    break
 
-                # if no new data in the timeout, but some data already
-                # recieved, then exit assuming full message has been recieved
-                elif request_data:
+                # stop if the client has closed the connection
+                if not self.reader.recv_from(self.client):
                     break
-            self.request_data = request_data
+                self.request_data = self.reader.next_request()
+
             self.client.setblocking(1)
-            print("Data recieved from {}".format(self.address))
 
-        def _generate_response(self):
-            """Generate a response to the client request."""
-            # attempt to parse the request as a HTTPRequest
+        def _generate_response(self, allow_keep_alive, timing):
+            """Generate a response to the client request.
+
+            Args:
+                allow_keep_alive (bool): Whether the connection may be kept
+                    open after the response.
+                timing (Metrics.RequestTiming): The timing of the request.
+            """
+            self.response, self.keep_alive = WebServer.create_response(
+                self.request_data, self.request_handler, allow_keep_alive,
+                timing, self.address)
+
+        def handle(self):
+            """Handle requests from the client until the connection closes.
+
+            Recieve data from the client, generate an appropriate response
+            and send it, until the connection no longer needs to be kept
+            alive. Then close the connection.
+            """
+            with WebServer.ClientConnection.active_lock:
+                WebServer.ClientConnection.active += 1
             try:
-                request = HTTPRequest(self.request_data)
-            except Exception as msg:
-                # generate response to invalid request
-                response = HTTPResponse(400, str(msg))
-            else:
-                # generate response to valid request
-                response = self.request_handler.generate_response(request)
-            self.response = response.create_http_response()
+                for served in range(1, self.MAX_KEEP_ALIVE_REQUESTS + 1):
+                    try:
+                        self._recieve_data()
+                    except RequestReader.RequestError as error:
+                        timing = Metrics.RequestTiming(self.address)
+                        WebServer.send_response(
+                            self.client,
+                            WebServer.create_error_response(error), timing)
+                        self.request_handler.metrics.record(timing)
+                        break
+                    if self.request_data is None:
+                        break
+
+                    timing = Metrics.RequestTiming(self.address)
+                    timing.receive = self.reader.receive_time
+                    self._generate_response(
+                        served < self.MAX_KEEP_ALIVE_REQUESTS, timing)
+                    if self.response.is_stream():
+                        self.request_handler.metrics.record(timing)
+                        # the stream may stay open for a long time, so it
+                        # is sent from its own thread
+                        WebServer.StreamThread(self.client, self.address,
+                                               self.response).start()
+                        self.client = None
+                        break
+                    WebServer.send_response(self.client, self.response,
+                                            timing)
+                    self.request_handler.metrics.record(timing)
+
+                    if not self.keep_alive:
+                        break
+            except OSError:
+                pass
+            finally:
+                if self.client is not None:
+                    self.client.close()
+                    WebServer.connection_limiter.release(self.address)
+                with WebServer.ClientConnection.active_lock:
+                    WebServer.ClientConnection.active -= 1
+
+    class ClientThread(Thread):
+        """Class to handle a client request on a single thread."""
+
+        def __init__(self, client, address):
+            """Initialise a thread to handle a client request.
+
+            Args:
+                client (socket): A socket object, currently accepting a
+                    connection from the client.
+                address (tuple): A tuple containing the IP and port of the
+                    connected client.
+            """
+            Thread.__init__(self, daemon=True)
+            self.connection = WebServer.ClientConnection(client, address)
 
         def run(self):
-            """Handle a single request from the client.
+            """Handle the client request."""
+            self.connection.handle()
+
+    class StreamThread(Thread):
+        """Class to send a streamed response on its own thread.
+
+        Streams, such as subscriptions to device state, stay open for a long
+        time, so they are handed off to a StreamThread rather than holding
+        a worker or blocking the event loop. The connection is closed once
+        the stream ends or the client goes away.
+        """
 
-            Recieve data from the client, generate an appropriate response,
-            send the response and close the connection.
+        SEND_TIMEOUT = 10  # seconds allowed for each part to be sent
 
+        def __init__(self, client, address, response):
+            """Initialise a thread to send a streamed response.
+
+            Args:
+                client (socket): The socket connected to the client.
+                address (tuple): A tuple containing the IP and port of the
+                    connected client.
+                response (HTTPResponse): The response, with a
+                    HTTPResponse.StreamContent body.
             """
-            self._recieve_data()
-            self._generate_response()
+            Thread.__init__(self, daemon=True)
+            self.client = client
+            self.address = address
+            self.response = response
+
+        def run(self):
+            """Send the response, then close the connection."""
+            try:
+                self.client.settimeout(self.SEND_TIMEOUT)
+                self.response.send(self.client)
+            except OSError:
+                pass
+            finally:
+                self.response.content.close()
+                self.client.close()
+                WebServer.connection_limiter.release(self.address)
+                RequestHandler.access_log.log({
+                    "time": time(),
+                    "client": "{}:{}".format(*self.address[:2]),
+                    "event": "stream closed"
+                })
 
-            # send response and close the connection
-            self.client.sendall(self.response)
-            print("Response sent to {}".format(self.address))
-            self.client.close()
+    class WorkerPool:
+        """Class to handle client requests on a fixed pool of threads.
+
+        Accepted connections wait in a bounded queue until a worker is free.
+        When the queue is full, the client is immediately sent a 503 response
+        asking it to retry later, rather than the server falling behind.
+        A worker holds a connection until it closes, so a quarter of the
+        workers are kept from any one client IP: its further connections
+        are deferred to wait for the workers it occupies, and slow clients
+        cannot starve the others. Deferred connections do not take up the
+        queue, but only a quarter of its size may wait from one IP, queued
+        or deferred; that IP's further connections are sent a 429 response,
+        so one client can never fill the queue.
+        """
+
+        WORKERS = 8  # threads handling requests
+        QUEUE_SIZE = 64  # connections waiting for a free worker
+        RETRY_AFTER = 1  # seconds a rejected client should wait
+        REJECT_TIMEOUT = 0.5  # seconds allowed to send a rejection
+        STATS_INTERVAL = 60  # seconds between printed statistics
+
+        def __init__(self, workers=None, queue_size=None,
+                     max_waiting_per_ip=None):
+            """Start the worker threads.
+
+            Args:
+                workers (int): The number of worker threads.
+                    Default is WorkerPool.WORKERS.
+                queue_size (int): The number of connections allowed to wait
+                    for a worker. Default is WorkerPool.QUEUE_SIZE.
+                max_waiting_per_ip (int): The connections allowed to wait
+                    from one IP address, queued or deferred. Default is a
+                    quarter of the queue size.
+            """
+            self.workers = self.WORKERS if workers is None else workers
+            self.queue = Queue(self.QUEUE_SIZE if queue_size is None
+                               else queue_size)
+            self.max_waiting_per_ip = max_waiting_per_ip or max(
+                1, (self.queue.maxsize or self.QUEUE_SIZE) // 4)
+            self.stats_lock = Lock()
+            self.accepted = 0
+            self.rejected = 0
+            self.rejected_per_ip = 0
+            self.completed = 0
+            self.busy = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.next_report = monotonic() + self.STATS_INTERVAL
+            self.max_busy_per_ip = max(
+                1, self.workers - max(1, self.workers // 4))
+            self.busy_by_ip = {}  # workers occupied, by client IP
+            self.deferred = {}  # deque of connections waiting, by client IP
+            self.deferred_count = 0
+            self.waiting_by_ip = {}  # connections queued or deferred, by IP
+
+            # exported by /metrics, so the pool's saturation can be scraped
+            metrics = RequestHandler.metrics
+            metrics.add_gauge("worker_pool_workers", "Worker threads.",
+                              lambda: self.workers)
+            metrics.add_gauge("worker_pool_busy_workers",
+                              "Workers handling a connection.",
+                              lambda: self.busy)
+            metrics.add_gauge("worker_pool_queue_depth",
+                              "Connections queued for a worker.",
+                              self.queue.qsize)
+            metrics.add_gauge("worker_pool_deferred_connections",
+                              "Connections waiting for the workers their IP "
+                              "occupies.", lambda: self.deferred_count)
+            metrics.add_counter("worker_pool_rejected_total",
+                                "Connections sent a 503, because the queue "
+                                "was full.", lambda: self.rejected)
+            metrics.add_counter("worker_pool_rejected_per_ip_total",
+                                "Connections sent a 429, because too many "
+                                "were waiting from their IP.",
+                                lambda: self.rejected_per_ip)
+
+            for _ in range(self.workers):
+                Thread(target=self._work, daemon=True).start()
+
+        def submit(self, client, address):
+            """Queue a connection, or reject it if the queue is full.
+
+            A connection from an IP with max_waiting_per_ip connections
+            already waiting is sent a 429 response instead.
+
+            Args:
+                client (socket): A socket object, currently accepting a
+                    connection from the client.
+                address (tuple): A tuple containing the IP and port of the
+                    connected client.
+            """
+            ip = address[0]
+            with self.stats_lock:
+                waiting = self.waiting_by_ip.get(ip, 0)
+                if waiting >= self.max_waiting_per_ip:
+                    self.rejected_per_ip += 1
+                    queued = None
+                else:
+                    try:
+                        self.queue.put_nowait((client, address, monotonic()))
+                        queued = True
+                        self.accepted += 1
+                        self.waiting_by_ip[ip] = waiting + 1
+                    except Full:
+                        queued = False
+                        self.rejected += 1
+            if queued is None:
+                WebServer.connection_limiter.reject(client)
+            elif not queued:
+                self._reject(client)
+            if not queued:
+                WebServer.connection_limiter.release(address)
+
+        def _reject(self, client):
+            """Send a "service unavailable" response and close the connection.
+
+            Args:
+                client (socket): A socket object, currently accepting a
+                    connection from the client.
+            """
+            response = HTTPResponse(503, "Server busy, please retry.")
+            response.add_header("Retry-After", str(self.RETRY_AFTER))
+            response.add_header("Connection", "close")
+            try:
+                client.settimeout(self.REJECT_TIMEOUT)
+                client.sendall(response.create_http_response())
+            except OSError:
+                pass
+            finally:
+                client.close()
+
+        def _work(self):
+            """Continually handle queued connections.
+
+            A connection from a client IP already occupying its share of
+            the workers is deferred, to be handled by one of those workers
+            once it is free.
+            """
+            while True:
+                client, address, queued_at = self.queue.get()
+                ip = address[0]
+                with self.stats_lock:
+                    busy = self.busy_by_ip.get(ip, 0)
+                    if busy >= self.max_busy_per_ip:
+                        self.deferred.setdefault(ip, deque()).append(
+                            (client, address, queued_at))
+                        self.deferred_count += 1
+                        continue
+                    self.busy_by_ip[ip] = busy + 1
+                while client is not None:
+                    self._handle(client, address, queued_at)
+                    with self.stats_lock:
+                        waiting = self.deferred.get(ip)
+                        if waiting:
+                            client, address, queued_at = waiting.popleft()
+                            self.deferred_count -= 1
+                            if not waiting:
+                                del self.deferred[ip]
+                        else:
+                            client = None
+                            if self.busy_by_ip[ip] == 1:
+                                del self.busy_by_ip[ip]
+                            else:
+                                self.busy_by_ip[ip] -= 1
+
+        def _handle(self, client, address, queued_at):
+            """Handle a connection, recording how long it waited."""
+            wait = monotonic() - queued_at
+            ip = address[0]
+            with self.stats_lock:
+                waiting = self.waiting_by_ip[ip] - 1
+                if waiting:
+                    self.waiting_by_ip[ip] = waiting
+                else:
+                    del self.waiting_by_ip[ip]
+                self.busy += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                WebServer.ClientConnection(client, address).handle()
+            finally:
+                with self.stats_lock:
+                    self.busy -= 1
+                    self.completed += 1
+
+        def stats(self):
+            """Take a snapshot of the pool's statistics.
+
+            Returns:
+                dict: Queue depth, busy workers, connections deferred and
+                    other counts, and the mean and maximum time connections
+                    waited for a worker.
+            """
+            with self.stats_lock:
+                started = self.completed + self.busy
+                return {
+                    "workers": self.workers,
+                    "busy": self.busy,
+                    "queue_depth": self.queue.qsize(),
+                    "queue_size": self.queue.maxsize,
+                    "deferred": self.deferred_count,
+                    "accepted": self.accepted,
+                    "rejected": self.rejected,
+                    "rejected_per_ip": self.rejected_per_ip,
+                    "completed": self.completed,
+                    "mean_wait_ms": (1000 * self.total_wait / started
+                                     if started else 0.0),
+                    "max_wait_ms": 1000 * self.max_wait
+                }
+
+        def report_stats(self):
+            """Print the pool's statistics, at most once per STATS_INTERVAL."""
+            now = monotonic()
+            if now < self.next_report:
+                return
+            self.next_report = now + self.STATS_INTERVAL
+            print("Worker pool: {}".format(self.stats()))
+
+    class EventLoop:
+        """Class to serve every client connection from a single thread.
+
+        All client sockets are multiplexed with a selector, so no thread is
+        created per connection. At most MAX_CONNECTIONS clients are served
+        at once; while at the limit, new connections wait in the listen
+        backlog. Connections are kept alive, pipelined requests answered
+        and deadlines enforced as in ClientConnection.
+        """
+
+        READ_TIMEOUT = 2  # seconds to wait for the rest of a request
+        KEEP_ALIVE_TIMEOUT = 5  # seconds to wait for the next request
+        MAX_KEEP_ALIVE_REQUESTS = 100  # requests served per connection
+        MAX_CONNECTIONS = 512  # clients served concurrently
+        FILE_CHUNK_SIZE = 1048576  # bytes sent from a file at once
+
+        class Connection:
+            """Class to store the state of a single client connection."""
+
+            def __init__(self, client, address):
+                """Initialise the state of a newly accepted connection.
+
+                Args:
+                    client (socket): A non-blocking socket connected to the
+                        client.
+                    address (tuple): A tuple containing the IP and port of
+                        the connected client.
+                """
+                self.client = client
+                self.address = address
+                self.reader = RequestReader()
+                self.writing = False
+                self.output = []  # buffers of the response left to send
+                self.file = None  # file the response body is sent from
+                self.file_offset = 0
+                self.file_remaining = 0
+                self.keep_alive = False
+                self.requests_served = 0
+                self.last_activity = monotonic()
+                self.timing = None  # timing of the response being sent
+                self.send_started = 0.0
+                self.write_deadline = None
+
+        def __init__(self, listen_socket, max_connections=None):
+            """Initialise an event loop around a listening socket.
+
+            Args:
+                listen_socket (socket): A bound, listening TCP socket.
+                max_connections (int): The maximum number of clients served
+                    concurrently. Default is EventLoop.MAX_CONNECTIONS.
+            """
+            self.listen_socket = listen_socket
+            self.max_connections = (self.MAX_CONNECTIONS
+                                    if max_connections is None
+                                    else max_connections)
+            self.selector = selectors.DefaultSelector()
+            self.connections = {}
+            self.accepting = False
+            self.next_expiry_check = 0
+            self.request_handler = RequestHandler()
+            self.stopping = False
+            self.stop_deadline = None
+
+        def stop(self, timeout):
+            """Stop accepting connections, so that run returns.
+
+            Safe to call from a signal handler.
+
+            Args:
+                timeout (float): The most seconds to keep serving the
+                    connections already accepted.
+            """
+            self.stop_deadline = monotonic() + timeout
+            self.stopping = True
+
+        def _start_accepting(self):
+            """Watch the listening socket for new connections."""
+            if not self.accepting and not self.stopping:
+                self.selector.register(self.listen_socket,
+                                       selectors.EVENT_READ)
+                self.accepting = True
+
+        def _stop_accepting(self):
+            """Leave new connections in the listen backlog."""
+            if self.accepting:
+                self.selector.unregister(self.listen_socket)
+                self.accepting = False
+
+        def _accept(self):
+            """Accept waiting connections, up to the concurrency limit."""
+            while len(self.connections) < self.max_connections:
+                try:
+                    client, address = self.listen_socket.accept()
+                except BlockingIOError:
+                    return
+                if not WebServer.connection_limiter.acquire(address):
+                    WebServer.connection_limiter.reject(client)
+                    continue
+                client.setblocking(False)
+                connection = self.Connection(client, address)
+                self.connections[client] = connection
+                self.selector.register(client, selectors.EVENT_READ,
+                                       connection)
+            self._stop_accepting()
+
+        def _detach(self, connection):
+            """Stop serving a client connection and forget its state."""
+            self.selector.unregister(connection.client)
+            del self.connections[connection.client]
+            if len(self.connections) < self.max_connections:
+                self._start_accepting()
+
+        def _close(self, connection):
+            """Close a client connection and forget its state."""
+            self._detach(connection)
+            connection.client.close()
+            WebServer.connection_limiter.release(connection.address)
+            if connection.file is not None:
+                connection.file.close()
+
+        def _respond(self, connection, request_data):
+            """Generate a response and start sending it to the client."""
+            connection.requests_served += 1
+            timing = Metrics.RequestTiming(connection.address)
+            timing.receive = connection.reader.receive_time
+            response, connection.keep_alive = WebServer.create_response(
+                request_data, self.request_handler,
+                connection.requests_served < self.MAX_KEEP_ALIVE_REQUESTS,
+                timing, connection.address)
+            if response.is_stream():
+                self.request_handler.metrics.record(timing)
+                # producing the stream may block, so it leaves the loop
+                self._detach(connection)
+                connection.client.setblocking(True)
+                WebServer.StreamThread(connection.client, connection.address,
+                                       response).start()
+                return
+            self._start_writing(connection, response, timing)
+
+        def _respond_with_error(self, connection, error):
+            """Send an error response, then close the connection."""
+            connection.keep_alive = False
+            self._start_writing(connection,
+                                WebServer.create_error_response(error),
+                                Metrics.RequestTiming(connection.address))
+
+        def _start_writing(self, connection, response, timing):
+            """Start sending a response to the client.
+
+            Args:
+                connection (EventLoop.Connection): The client connection.
+                response (HTTPResponse): The response to send.
+                timing (Metrics.RequestTiming): The timing of the request.
+            """
+            connection.writing = True
+            started = perf_counter()
+            connection.output = response.create_http_buffers()
+            connection.send_started = perf_counter()
+            timing.serialize = connection.send_started - started
+            timing.status_code = response.status_code
+            timing.bytes_sent = WebServer.count_bytes(response,
+                                                      connection.output)
+            connection.timing = timing
+            connection.write_deadline = WebServer.write_deadline(
+                timing.bytes_sent)
+            if response.is_file():
+                try:
+                    connection.file = open(response.content.path, "rb")
+                except OSError:
+                    self._close(connection)
+                    return
+                connection.file_offset = 0
+                connection.file_remaining = response.content.size
+
+            self.selector.modify(connection.client, selectors.EVENT_WRITE,
+                                 connection)
+            self._write(connection)
+
+        def _next_request(self, connection):
+            """Respond to the next request, if it has been fully recieved."""
+            try:
+                request_data = connection.reader.next_request()
+            except RequestReader.RequestError as error:
+                self._respond_with_error(connection, error)
+                return
+            if request_data is not None:
+                self._respond(connection, request_data)
+
+        def _read(self, connection):
+            """Read available bytes, responding once a request is read."""
+            try:
+                recieved = connection.reader.recv_from(connection.client)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self._close(connection)
+                return
+
+            # client closed the connection
+            if not recieved:
+                self._close(connection)
+                return
+
+            connection.last_activity = monotonic()
+            self._next_request(connection)
+
+        def _send_file(self, connection):
+            """Send part of the response body from its file.
+
+            Returns:
+                int: The number of bytes sent.
+            """
+            count = min(connection.file_remaining, self.FILE_CHUNK_SIZE)
+            if sendfile is not None:
+                return sendfile(connection.client.fileno(),
+                                connection.file.fileno(),
+                                connection.file_offset, count)
+            connection.file.seek(connection.file_offset)
+            return connection.client.send(connection.file.read(count))
+
+        def _write(self, connection):
+            """Send as much of the response as the socket will accept."""
+            try:
+                while connection.output:
+                    HTTPResponse.send_buffers(connection.client,
+                                              connection.output)
+
+                while connection.file_remaining:
+                    sent = self._send_file(connection)
+                    if not sent:
+                        raise OSError("File changed while being sent!")
+                    connection.file_offset += sent
+                    connection.file_remaining -= sent
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self._close(connection)
+                return
+
+            if connection.file is not None:
+                connection.file.close()
+                connection.file = None
+            connection.timing.send = perf_counter() - connection.send_started
+            self.request_handler.metrics.record(connection.timing)
+            connection.timing = None
+            if not connection.keep_alive:
+                self._close(connection)
+                return
+
+            # wait for the next request, which may already be buffered
+            connection.writing = False
+            connection.last_activity = monotonic()
+            self.selector.modify(connection.client, selectors.EVENT_READ,
+                                 connection)
+            self._next_request(connection)
+
+        def _expire(self):
+            """Close idle connections and time out stalled transfers."""
+            now = monotonic()
+            if now < self.next_expiry_check:
+                return
+            self.next_expiry_check = now + self.READ_TIMEOUT / 4
+            for connection in list(self.connections.values()):
+                if connection.writing:
+                    if now >= connection.write_deadline:
+                        self._close(connection)
+                    continue
+                idle = now - connection.last_activity
+                pending = connection.reader.pending()
+                if pending and (idle >= self.READ_TIMEOUT or
+                                connection.reader.time_left() <= 0):
+                    error = RequestReader.RequestError(
+                        408, "Timed out reading request!")
+                    self._respond_with_error(connection, error)
+                elif not pending and idle >= self.KEEP_ALIVE_TIMEOUT:
+                    self._close(connection)
+
+        def run(self):
+            """Multiplex and respond to client connections until stopped."""
+            self.listen_socket.setblocking(False)
+            self._start_accepting()
+            while not self.stopping or self.connections:
+                if self.stopping:
+                    self._stop_accepting()
+                    if monotonic() >= self.stop_deadline:
+                        break
+                events = self.selector.select(self.READ_TIMEOUT / 4)
+                for key, mask in events:
+                    if key.fileobj is self.listen_socket:
+                        self._accept()
+                    elif mask & selectors.EVENT_READ:
+                        self._read(key.data)
+                    elif mask & selectors.EVENT_WRITE:
+                        self._write(key.data)
+                self._expire()
+
+    class Supervisor:
+        """Class to serve from several worker processes, forked from this one.
+
+        Each worker serves connections in the server's mode. The workers
+        either accept from the listening socket created before forking, or,
+        if the server binds with SO_REUSEPORT, each listens on a socket of
+        its own and the kernel spreads new connections between them.
+
+        Workers which exit are restarted, at most one every RESTART_DELAY
+        seconds. SIGTERM or SIGINT stops the workers gracefully: each stops
+        accepting and finishes its current connections before exiting.
+
+        The workers share device state through the state files (see
+        DeviceStateStore), and changes of device state are relayed through
+        the supervisor, which numbers them, so that every worker streams the
+        same changes with the same IDs.
+        """
+
+        RESTART_DELAY = 1  # seconds between restarts of workers
+        KILL_DELAY = 5  # seconds allowed to exit after SHUTDOWN_TIMEOUT
+        MAX_MESSAGE_SIZE = 65536  # bytes of a single relayed change
+
+        def __init__(self, server):
+            """Initialise a supervisor of a server's worker processes.
+
+            Args:
+                server (WebServer): The server, with its listening socket
+                    bound.
+            """
+            self.server = server
+            self.workers = {}  # relay channel of each worker, by process ID
+            self.last_event_id = 0
+            self.stopping = False
+            self.kill_deadline = None
+
+            handler = RequestHandler.smart_device_handler
+            store = handler.device_state_store
+            handler.device_state_store = DeviceStateStore(
+                store.directory, shared=True,
+                reserved_files=store.reserved_files)
+
+        def _start_worker(self):
+            """Fork a worker process."""
+            channel, worker_channel = socketpair(AF_UNIX, SOCK_SEQPACKET)
+            pid = fork()
+            if pid == 0:
+                channel.close()
+                status = 0
+                try:
+                    self._run_worker(worker_channel)
+                except BaseException:
+                    print_exc()
+                    status = 1
+                finally:
+                    sys.stdout.flush()
+                    _exit(status)
+
+            worker_channel.close()
+            self.workers[pid] = channel
+            print("Started worker process {}".format(pid))
+
+        def _run_worker(self, channel):
+            """Serve connections, in a newly forked worker process.
+
+            Args:
+                channel (socket): The worker's end of its relay channel.
+            """
+            server = self.server
+            signal(SIGINT, SIG_IGN)  # the supervisor stops the workers
+            signal(SIGTERM, lambda signum, frame: server.shutdown())
+            for other_channel in self.workers.values():
+                if other_channel is not None:
+                    other_channel.close()
+
+            if server.reuse_port:
+                server.listen_socket.close()
+                server.listen_socket = server._bind(server.port)
+                server.listen_socket.listen(server.request_queue_size)
+
+            events = RequestHandler.smart_device_handler.device_events
+            events.last_id = self.last_event_id
+            events.relay = lambda data: channel.send(
+                dumps(data).encode("utf-8"))
+            Thread(target=self._receive_changes, args=(channel, events),
+                   daemon=True).start()
+            server._serve()
+
+        def _receive_changes(self, channel, events):
+            """Publish the changes relayed to a worker, until it is stopped.
+
+            Args:
+                channel (socket): The worker's end of its relay channel.
+                events (DeviceEventHub): The worker's hub.
+            """
+            while True:
+                message = channel.recv(self.MAX_MESSAGE_SIZE)
+                if not message:
+                    # the supervisor has gone, so stop too
+                    kill(getpid(), SIGTERM)
+                    return
+                change = loads(message)
+                events.receive(change["id"], change["data"])
+
+        def _relay(self, pid, channel):
+            """Number a change sent by a worker and send it to every worker.
+
+            Args:
+                pid (int): The process ID of the worker.
+                channel (socket): The supervisor's end of its relay channel.
+            """
+            message = channel.recv(self.MAX_MESSAGE_SIZE)
+            if not message:
+                # the worker is exiting
+                channel.close()
+                self.workers[pid] = None
+                return
+
+            self.last_event_id += 1
+            message = dumps({"id": self.last_event_id,
+                             "data": loads(message)}).encode("utf-8")
+            for worker_pid, worker_channel in self.workers.items():
+                if worker_channel is None:
+                    continue
+                try:
+                    worker_channel.send(message, MSG_DONTWAIT)
+                except OSError:
+                    print("Change {} not relayed to worker {}".format(
+                        self.last_event_id, worker_pid))
+
+        def _reap(self):
+            """Forget any workers which have exited."""
+            for pid in list(self.workers):
+                exited, status = waitpid(pid, WNOHANG)
+                if not exited:
+                    continue
+                channel = self.workers.pop(pid)
+                if channel is not None:
+                    channel.close()
+                if not self.stopping:
+                    print("Worker process {} exited with status {}".format(
+                        pid, status))
+
+        def _stop(self, signum, frame):
+            """Ask every worker to stop, when the supervisor is signalled."""
+            if self.stopping:
+                return
+            self.stopping = True
+            self.kill_deadline = (monotonic() + self.server.SHUTDOWN_TIMEOUT
+                                  + self.KILL_DELAY)
+            for pid in self.workers:
+                kill(pid, SIGTERM)
+
+        def run(self):
+            """Start the workers, then supervise them until they stop."""
+            print("Supervising {} worker processes on port {} ({}) ..."
+                  .format(self.server.processes, self.server.port,
+                          self.server.mode))
+            sys.stdout.flush()  # not to be repeated by each worker
+            signal(SIGTERM, self._stop)
+            signal(SIGINT, self._stop)
+            for _ in range(self.server.processes):
+                self._start_worker()
+
+            next_start = 0
+            while self.workers:
+                channels = {channel: pid for pid, channel
+                            in self.workers.items() if channel is not None}
+                ready = select.select(list(channels), [], [], 0.5)[0]
+                for channel in ready:
+                    self._relay(channels[channel], channel)
+                self._reap()
+
+                if self.stopping:
+                    if monotonic() >= self.kill_deadline:
+                        for pid in self.workers:
+                            kill(pid, SIGKILL)
+                elif len(self.workers) < self.server.processes and \
+                        monotonic() >= next_start:
+                    self._start_worker()
+                    next_start = monotonic() + self.RESTART_DELAY
+            self.server.listen_socket.close()
+            print("All worker processes stopped.")
 
 
 if __name__ == "__main__":
-    server = WebServer()
+    parser = ArgumentParser(description="Serve TannoHolmes.com")
+    parser.add_argument("--port", type=int, default=WebServer.PORT)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        default="threaded")
+    parser.add_argument("--backlog", type=int,
+                        default=WebServer.REQUEST_QUEUE_SIZE,
+                        help="size of the listen backlog")
+    parser.add_argument("--workers", type=int,
+                        default=WebServer.WorkerPool.WORKERS,
+                        help="threads in worker-pool mode")
+    parser.add_argument("--worker-queue", type=int,
+                        default=WebServer.WorkerPool.QUEUE_SIZE,
+                        help="connections waiting for a worker before "
+                             "clients are sent 503")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="load every static file into memory at startup")
+    parser.add_argument("--no-precompress", action="store_true",
+                        help="compress text files on their first request, "
+                             "rather than at startup")
+    parser.add_argument("--fake-controllers", action="store_true",
+                        help="record device commands instead of running them")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes forked to serve, e.g. one per "
+                             "CPU core")
+    parser.add_argument("--reuse-port", action="store_true",
+                        help="give each worker process its own listening "
+                             "socket, bound with SO_REUSEPORT")
+    parser.add_argument("--access-log-sample", type=float, default=1.0,
+                        help="fraction of requests written to the access "
+                             "log, server errors are always written")
+    parser.add_argument("--max-connections-per-ip", type=int,
+                        default=WebServer.ConnectionLimiter.MAX_PER_IP,
+                        help="connections open at once from one IP address, "
+                             "0 for no limit")
+    parser.add_argument("--rate-limit", action="append", default=[],
+                        metavar="PREFIX=RATE[/BURST]",
+                        help="limit each client to RATE requests a second, "
+                             "in bursts of up to BURST, to URIs starting "
+                             "with PREFIX, may be repeated")
+    args = parser.parse_args()
+
+    RequestHandler.access_log.sample_rate = args.access_log_sample
+    WebServer.connection_limiter.max_per_ip = args.max_connections_per_ip
+    RequestHandler.rate_limiter = RateLimiter(
+        [RateLimiter.Rule.parse(spec) for spec in args.rate_limit])
+
+    if args.warm_cache:
+        RequestHandler.static_files.warm()
+    elif not args.no_precompress:
+        RequestHandler.static_files.precompress()
+    if args.fake_controllers:
+        RequestHandler.smart_device_handler.device_controllers = \
+            DeviceControllerPool(
+                controller_factory=DeviceControllerPool.FakeController)
+    server = WebServer(args.port, args.mode, args.backlog,
+                       args.workers, args.worker_queue, args.processes,
+                       args.reuse_port)
     server.serve_forever()
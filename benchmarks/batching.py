@@ -0,0 +1,116 @@
+"""Benchmark N single smart-home calls against one batched call.
+
+Sets the position of every blind in a generated fleet, and reads back the
+status of every blind, first with one request per device on a keep-alive
+connection, then with a single status_batch or directive_batch request.
+
+Usage: python benchmarks/batching.py [--repeats N]
+"""
+from argparse import ArgumentParser
+from json import dumps
+from socket import create_connection
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from bench_utils import (build_request, percentile, print_table,
+                         provision_fleet, quiet, read_response, start_server)
+from HTTPTools.DeviceRegistry import DeviceRegistry
+from HTTPTools.DeviceStateStore import DeviceStateStore
+from HTTPTools.RequestHandler import RequestHandler
+
+BATCH_SIZES = [10, 50, 200]
+
+
+def directive(endpoint_id, value):
+    """Build a directive setting the position of a blind."""
+    return {"directive": {
+        "header": {"namespace": "Alexa.RangeController",
+                   "name": "SetRangeValue", "instance": "Blind.Position"},
+        "endpoint": {"endpointId": endpoint_id},
+        "payload": {"rangeValue": value}
+    }}
+
+
+def time_calls(port, raw_requests, repeats):
+    """Time sending a list of requests in turn on a keep-alive connection.
+
+    Returns:
+        float: The p50 time to send all of the requests, in milliseconds.
+    """
+    timings = []
+    client = None
+    for _ in range(repeats):
+        start = perf_counter()
+        for raw_request in raw_requests:
+            if client is None:
+                client = create_connection(("localhost", port))
+                reader = client.makefile("rb")
+            client.sendall(raw_request)
+            status_code, headers, _ = read_response(reader)
+            assert status_code == 200
+            # reconnect once the server's keep-alive limit is reached
+            if headers.get("connection") == "close":
+                client.close()
+                client = None
+        timings.append(perf_counter() - start)
+    if client is not None:
+        client.close()
+    return percentile(timings, 0.5) * 1000
+
+
+def post(command, body):
+    """Build a keep-alive smart-home request."""
+    return build_request("POST", "/smarthome/" + command,
+                         body.encode("utf-8"),
+                         headers={"Connection": "keep-alive"})
+
+
+def main():
+    """Time single and batched calls for each batch size."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=10,
+                        help="times each set of calls is made")
+    args = parser.parse_args()
+
+    with quiet():
+        server = start_server()
+    handler = RequestHandler.smart_device_handler
+
+    results = []
+    with TemporaryDirectory() as directory:
+        devices_file = provision_fleet(max(BATCH_SIZES), directory)
+        handler.device_registry = DeviceRegistry(devices_file)
+        handler.device_state_store = DeviceStateStore(directory)
+
+        for size in BATCH_SIZES:
+            endpoint_ids = ["bench_device_{}".format(number)
+                            for number in range(size)]
+            directives = [directive(endpoint_id, number % 100)
+                          for number, endpoint_id in enumerate(endpoint_ids)]
+            with quiet():
+                results.append({
+                    "devices": size,
+                    "directive_single_ms": time_calls(
+                        server.port,
+                        [post("directive", dumps(item))
+                         for item in directives], args.repeats),
+                    "directive_batch_ms": time_calls(
+                        server.port,
+                        [post("directive_batch", dumps(directives))],
+                        args.repeats),
+                    "status_single_ms": time_calls(
+                        server.port,
+                        [post("status", endpoint_id)
+                         for endpoint_id in endpoint_ids], args.repeats),
+                    "status_batch_ms": time_calls(
+                        server.port,
+                        [post("status_batch", dumps(endpoint_ids))],
+                        args.repeats)
+                })
+
+    print_table(results, ["devices", "directive_single_ms",
+                          "directive_batch_ms", "status_single_ms",
+                          "status_batch_ms"])
+
+
+if __name__ == "__main__":
+    main()
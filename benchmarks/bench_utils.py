@@ -0,0 +1,268 @@
+"""Module containing helpers shared by the benchmark scripts.
+
+Benchmarks are run from the repository root, e.g.
+"python benchmarks/serving_modes.py", and drive a real WebServer over
+localhost sockets.
+"""
+from contextlib import contextmanager
+from os import chdir, devnull, path
+from socket import create_connection
+from threading import Thread
+from time import perf_counter
+import sys
+
+REPO_ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# the server resolves www_root and Smart_Devices relative to the cwd
+chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from WebServer import WebServer  # noqa: E402
+from HTTPTools.DeviceProvisioner import DeviceProvisioner  # noqa: E402
+from HTTPTools.RequestHandler import RequestHandler  # noqa: E402
+
+# the access log is written by a background thread, so is discarded rather
+# than hidden by quiet()
+RequestHandler.access_log.stream = open(devnull, "w")
+
+
+@contextmanager
+def quiet():
+    """Discard everything printed to stdout, e.g. the server's logging."""
+    stdout = sys.stdout
+    with open(devnull, "w") as sink:
+        sys.stdout = sink
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def start_server(**kwargs):
+    """Start a WebServer on a free port, serving from a daemon thread.
+
+    Args:
+        **kwargs: Keyword arguments passed on to WebServer.
+
+    Returns:
+        WebServer: The running server.
+    """
+    server = WebServer(port=0, **kwargs)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_request(method, uri, body=b"", headers=None):
+    """Build a raw HTTP request.
+
+    Args:
+        method (string): The HTTP method.
+        uri (string): The request URI.
+        body (byte string): The body of the request.
+        headers (dict): Extra header fields.
+
+    Returns:
+        byte string: The raw request.
+    """
+    lines = ["{} {} HTTP/1.1".format(method, uri), "Host: localhost"]
+    fields = {"Connection": "close"}
+    if body:
+        fields["Content-Length"] = str(len(body))
+    fields.update(headers or {})
+    lines += ["{}: {}".format(field, value) for field, value in fields.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body
+
+
+def fetch(port, raw_request):
+    """Send one request on a new connection and read until it is closed.
+
+    Args:
+        port (int): The port the server listens on.
+        raw_request (byte string): The raw request to send.
+
+    Returns:
+        byte string: The raw response.
+    """
+    with create_connection(("localhost", port)) as client:
+        client.sendall(raw_request)
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def read_response(reader):
+    """Read one response from a persistent connection.
+
+    Args:
+        reader (file): A buffered binary file made from the client socket.
+
+    Returns:
+        tuple: The status code (int), the header fields (dict, with
+            lower-case names) and the body (byte string).
+    """
+    status_line = reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the server.")
+    status_code = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = reader.readline().strip()
+        if not line:
+            break
+        field, _, value = line.decode("utf-8").partition(":")
+        headers[field.strip().lower()] = value.strip()
+
+    body = reader.read(int(headers.get("content-length", 0)))
+    return status_code, headers, body
+
+
+def run_load(port, raw_request, clients, requests_per_client):
+    """Fire requests at a server from several concurrent client threads.
+
+    Args:
+        port (int): The port the server listens on.
+        raw_request (byte string): The raw request every client sends.
+        clients (int): The number of concurrent client threads.
+        requests_per_client (int): Requests sent by each client in turn.
+
+    Returns:
+        dict: The load summary, see summarise().
+    """
+    latencies = []
+    errors = []
+
+    def client():
+        for _ in range(requests_per_client):
+            start = perf_counter()
+            try:
+                fetch(port, raw_request)
+            except OSError:
+                errors.append(1)
+                continue
+            latencies.append(perf_counter() - start)
+
+    threads = [Thread(target=client) for _ in range(clients)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    return summarise(latencies, elapsed, len(errors))
+
+
+def percentile(values, fraction):
+    """Find a percentile of a list of values.
+
+    Args:
+        values (list(float)): The values, in any order.
+        fraction (float): The percentile, as a fraction in [0, 1].
+
+    Returns:
+        float: The percentile, or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarise(latencies, elapsed, errors=0):
+    """Summarise the latencies of a load run.
+
+    Args:
+        latencies (list(float)): The latency of every request, in seconds.
+        elapsed (float): The wall time of the run, in seconds.
+        errors (int): The number of failed requests.
+
+    Returns:
+        dict: Requests per second and latency percentiles in milliseconds.
+    """
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def generate_parameters(count):
+    """Generate the parameters of a large fleet of blinds.
+
+    Args:
+        count (int): The number of devices.
+
+    Returns:
+        list(dict): Provisioning parameters for devices with IDs
+            "bench_device_0", ...
+    """
+    return [{
+        "endpointId": "bench_device_{}".format(number),
+        "friendlyName": "Device {}".format(number),
+        "mac_address": "02:00:{}".format(":".join(
+            "{:02X}".format(byte) for byte in number.to_bytes(4, "big"))),
+        "characteristic": "fd5db22e-cb57-11ea-87d0-0242ac130003",
+        "max_angle": 360
+    } for number in range(count)]
+
+
+def generate_endpoints(count, template=None):
+    """Generate endpoints for a large fleet of devices from a template.
+
+    Args:
+        count (int): The number of endpoints to generate.
+        template (string): The path to the device template.
+            Default is DeviceProvisioner.TEMPLATE.
+
+    Returns:
+        list(dict): The endpoints, with IDs "bench_device_0", ...
+    """
+    provisioner = DeviceProvisioner(template)
+    return [provisioner.stamp(parameters)["endpoint"]
+            for parameters in generate_parameters(count)]
+
+
+def provision_fleet(count, directory):
+    """Provision a large fleet of blinds into an empty directory.
+
+    Args:
+        count (int): The number of devices.
+        directory (string): The directory for the devices file and the
+            devices' state files.
+
+    Returns:
+        string: The path to the devices file.
+    """
+    devices_file = path.join(directory, "devices.json")
+    DeviceProvisioner().provision(generate_parameters(count), devices_file,
+                                  directory)
+    return devices_file
+
+
+def print_table(rows, columns):
+    """Print a list of result dicts as an aligned table.
+
+    Args:
+        rows (list(dict)): The results to print.
+        columns (list(string)): The keys to print, in order.
+    """
+    def cell(row, column):
+        value = row.get(column, "")
+        return "{:.2f}".format(value) if isinstance(value, float) \
+            else str(value)
+
+    widths = [max([len(column)] + [len(cell(row, column)) for row in rows])
+              for column in columns]
+    print("  ".join(column.ljust(width)
+                    for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(cell(row, column).ljust(width)
+                        for column, width in zip(columns, widths)))
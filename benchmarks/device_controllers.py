@@ -0,0 +1,142 @@
+"""Benchmark running device commands through the controller pool.
+
+Bursts of directives are sent to a fleet of generated blinds, whose fake
+controllers take --delay seconds per command, like a BLE write. Reports the
+HTTP latency of the directives, the time until every device has settled,
+and how many commands were coalesced, against running each command inline
+on the requesting thread with a newly constructed controller.
+
+Usage: python benchmarks/device_controllers.py [--delay S] [--burst N]
+"""
+from argparse import ArgumentParser
+from json import dumps
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter
+from bench_utils import (build_request, fetch, percentile, print_table,
+                         provision_fleet, quiet, start_server)
+from HTTPTools.DeviceControllerPool import DeviceControllerPool
+from HTTPTools.DeviceRegistry import DeviceRegistry
+from HTTPTools.DeviceStateStore import DeviceStateStore
+from HTTPTools.RequestHandler import RequestHandler
+
+FLEET_SIZES = [1, 8, 32]
+
+
+def directive(endpoint_id, value):
+    """Build a directive setting the position of a blind."""
+    return {"directive": {
+        "header": {"namespace": "Alexa.RangeController",
+                   "name": "SetRangeValue", "instance": "Blind.Position"},
+        "endpoint": {"endpointId": endpoint_id},
+        "payload": {"rangeValue": value}
+    }}
+
+
+def run_inline(endpoint_ids, burst, delay, spec):
+    """Run every command on its requesting thread, as a blocking call.
+
+    Returns:
+        float: The p50 time per command, in milliseconds.
+    """
+    latencies = []
+
+    def client(endpoint_id):
+        for value in range(burst):
+            start = perf_counter()
+            controller = DeviceControllerPool.Controller(
+                spec, DeviceControllerPool.FakeController(spec, delay))
+            controller.set(value)
+            latencies.append(perf_counter() - start)
+
+    threads = [Thread(target=client, args=(endpoint_id,))
+               for endpoint_id in endpoint_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return percentile(latencies, 0.5) * 1000
+
+
+def run_pooled(port, endpoint_ids, burst):
+    """Send bursts of directives to the server, one client per device.
+
+    Returns:
+        tuple: The p50 and p99 directive latencies, in milliseconds.
+    """
+    latencies = []
+
+    def client(endpoint_id):
+        for value in range(burst):
+            raw_request = build_request(
+                "POST", "/smarthome/directive",
+                dumps(directive(endpoint_id, value)).encode("utf-8"))
+            start = perf_counter()
+            fetch(port, raw_request)
+            latencies.append(perf_counter() - start)
+
+    threads = [Thread(target=client, args=(endpoint_id,))
+               for endpoint_id in endpoint_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000)
+
+
+def main():
+    """Time bursts of directives for each fleet size."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--delay", type=float, default=0.05,
+                        help="seconds taken by each controller command")
+    parser.add_argument("--burst", type=int, default=10,
+                        help="directives sent to each device")
+    args = parser.parse_args()
+
+    with quiet():
+        server = start_server(request_queue_size=128)
+    handler = RequestHandler.smart_device_handler
+
+    results = []
+    with TemporaryDirectory() as directory:
+        devices_file = provision_fleet(max(FLEET_SIZES), directory)
+        handler.device_registry = DeviceRegistry(devices_file)
+        handler.device_state_store = DeviceStateStore(directory)
+        spec = handler.device_state_store.get_state(
+            "bench_device_0")["properties"][0]["controller"]
+
+        for size in FLEET_SIZES:
+            endpoint_ids = ["bench_device_{}".format(number)
+                            for number in range(size)]
+            pool = DeviceControllerPool(controller_factory=lambda spec: (
+                DeviceControllerPool.FakeController(spec, args.delay)))
+            handler.device_controllers = pool
+
+            start = perf_counter()
+            with quiet():
+                p50_ms, p99_ms = run_pooled(server.port, endpoint_ids,
+                                            args.burst)
+            pool.wait()
+            settled_ms = (perf_counter() - start) * 1000
+            stats = pool.stats()
+
+            results.append({
+                "devices": size,
+                "inline_p50_ms": run_inline(endpoint_ids, args.burst,
+                                            args.delay, spec),
+                "pooled_p50_ms": p50_ms,
+                "pooled_p99_ms": p99_ms,
+                "settled_ms": settled_ms,
+                "executed": stats["executed"],
+                "coalesced": stats["coalesced"],
+                "controllers": len(pool.controllers)
+            })
+
+    print_table(results, ["devices", "inline_p50_ms", "pooled_p50_ms",
+                          "pooled_p99_ms", "settled_ms", "executed",
+                          "coalesced", "controllers"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark endpoint lookups against fleets of generated devices.
+
+Compares the registry's indexed lookups with re-reading the devices file and
+scanning its endpoints for every lookup.
+
+Usage: python benchmarks/device_registry.py [--lookups N]
+"""
+from argparse import ArgumentParser
+from json import dump, loads
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from bench_utils import generate_endpoints, print_table
+from HTTPTools.DeviceRegistry import DeviceRegistry
+
+FLEET_SIZES = [10, 1000, 5000]
+
+
+def scan_lookup(devices_file, endpoint_id, interface):
+    """Look up an endpoint by re-reading and scanning the devices file."""
+    with open(devices_file, "r") as input_file:
+        devices = loads(input_file.read())
+    for endpoint in devices["endpoints"]:
+        if endpoint["endpointId"] == endpoint_id:
+            return any(capability["interface"] == interface
+                       for capability in endpoint["capabilities"])
+    return False
+
+
+def time_lookups(lookup, endpoint_ids, interface):
+    """Time a lookup function over a list of endpoint IDs.
+
+    Returns:
+        float: Lookups per second.
+    """
+    start = perf_counter()
+    for endpoint_id in endpoint_ids:
+        lookup(endpoint_id, interface)
+    return len(endpoint_ids) / (perf_counter() - start)
+
+
+def main():
+    """Time lookups for each fleet size."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=20000,
+                        help="indexed lookups for each fleet size")
+    parser.add_argument("--scans", type=int, default=50,
+                        help="file-scanning lookups for each fleet size")
+    args = parser.parse_args()
+
+    random = Random(0)
+    interface = "Alexa.RangeController"
+    results = []
+    with TemporaryDirectory() as directory:
+        for size in FLEET_SIZES:
+            devices_file = path.join(directory, "devices-{}.json".format(size))
+            with open(devices_file, "w") as output_file:
+                dump({"endpoints": generate_endpoints(size)}, output_file)
+            endpoint_ids = ["bench_device_{}".format(random.randrange(size))
+                            for _ in range(args.lookups)]
+
+            registry = DeviceRegistry(devices_file)
+            start = perf_counter()
+            registry.find_endpoint(endpoint_ids[0])
+            load_ms = (perf_counter() - start) * 1000
+
+            results.append({
+                "endpoints": size,
+                "load_ms": load_ms,
+                "indexed_per_sec": time_lookups(registry.has_interface,
+                                                endpoint_ids, interface),
+                "scan_per_sec": time_lookups(
+                    lambda endpoint_id, interface: scan_lookup(
+                        devices_file, endpoint_id, interface),
+                    endpoint_ids[:args.scans], interface)
+            })
+
+    print_table(results, ["endpoints", "load_ms", "indexed_per_sec",
+                          "scan_per_sec"])
+
+
+if __name__ == "__main__":
+    main()
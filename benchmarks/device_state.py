@@ -0,0 +1,105 @@
+"""Benchmark concurrent reads and updates of device state.
+
+Compares the per-device reader-writer locks of DeviceStateStore with a single
+lock around every access, with all threads using one device or each thread
+using its own device.
+
+Usage: python benchmarks/device_state.py [--threads N] [--operations N]
+"""
+from argparse import ArgumentParser
+from json import load
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import perf_counter
+from bench_utils import REPO_ROOT, print_table
+from HTTPTools.DeviceStateStore import DeviceStateStore
+
+STATE_TEMPLATE = path.join(REPO_ROOT, "Smart_Devices", "smart_blind_01.json")
+
+
+class GlobalLockStore(DeviceStateStore):
+    """DeviceStateStore with a single lock around every read and update."""
+
+    def __init__(self, directory):
+        DeviceStateStore.__init__(self, directory)
+        self.global_lock = Lock()
+
+    def get_state(self, endpoint_id):
+        with self.global_lock:
+            return DeviceStateStore.get_state(self, endpoint_id)
+
+    def update(self, endpoint_id, update):
+        with self.global_lock:
+            return DeviceStateStore.update(self, endpoint_id, update)
+
+
+def increment(state):
+    """Move a blind's position by one, wrapping within its range."""
+    value = state["properties"][0]["value"]
+    value["current"] = (value["current"] + 1) % (value["max"] + 1)
+
+
+def run(store, endpoint_ids, operations, read_fraction):
+    """Run a mix of reads and updates from one thread per endpoint ID.
+
+    Returns:
+        float: Operations per second, across all threads.
+    """
+    updates_every = max(1, round(1 / (1 - read_fraction))) \
+        if read_fraction < 1 else None
+
+    def client(endpoint_id):
+        for number in range(operations):
+            if updates_every is not None and number % updates_every == 0:
+                store.update(endpoint_id, increment)
+            else:
+                store.get_state(endpoint_id)
+
+    threads = [Thread(target=client, args=(endpoint_id,))
+               for endpoint_id in endpoint_ids]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(endpoint_ids) * operations / (perf_counter() - start)
+
+
+def main():
+    """Time each store under each workload."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8,
+                        help="concurrent client threads")
+    parser.add_argument("--operations", type=int, default=200,
+                        help="reads and updates made by each thread")
+    args = parser.parse_args()
+
+    with open(STATE_TEMPLATE, "r") as input_file:
+        state = load(input_file)
+
+    results = []
+    with TemporaryDirectory() as directory:
+        endpoint_ids = ["bench_device_{}".format(number)
+                        for number in range(args.threads)]
+        for endpoint_id in endpoint_ids:
+            DeviceStateStore.write_atomically(
+                path.join(directory, endpoint_id + ".json"), state)
+
+        for devices in ("same", "different"):
+            clients = (endpoint_ids[:1] * args.threads if devices == "same"
+                       else endpoint_ids)
+            for read_fraction in (1.0, 0.9, 0.0):
+                row = {"devices": devices, "reads": read_fraction}
+                for name, store_class in (("per_device", DeviceStateStore),
+                                          ("global_lock", GlobalLockStore)):
+                    row[name + "_ops"] = run(store_class(directory), clients,
+                                             args.operations, read_fraction)
+                results.append(row)
+
+    print_table(results, ["devices", "reads", "per_device_ops",
+                          "global_lock_ops"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Micro-benchmark request body parsing and directive validation.
+
+Compares HTTPRequest, which keeps the body as bytes, with building the body
+from decoded lines as HTTPRequest used to, for bodies of several sizes. Then
+times parsing and validating directives against the compiled schema,
+against parsing them and only checking the endpoint and interface, as
+directives used to be checked.
+
+Usage: python benchmarks/directive_validation.py [--iterations N]
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from time import perf_counter
+from bench_utils import build_request, print_table
+from HTTPTools.HTTPRequest import HTTPRequest
+from HTTPTools.SmartDeviceHandler import SmartDeviceHandler
+
+BODY_SIZES = [1024, 65536, 1048576]
+
+
+def parse_lines(request_data):
+    """Parse a request, building its body from lines as before."""
+    lines = [line.decode("utf-8") for line in request_data.splitlines()]
+    headers = {}
+    body = ""
+    end_of_headers = False
+    for line in lines[1:]:
+        if end_of_headers:
+            body += line + "\n"
+            continue
+        if not line:
+            end_of_headers = True
+            continue
+        field, value = line.split(":", 1)
+        headers[field] = value.strip()
+    return headers, body
+
+
+def time_calls(function, argument, iterations):
+    """Time calling a function repeatedly.
+
+    Returns:
+        float: Calls per second.
+    """
+    start = perf_counter()
+    for _ in range(iterations):
+        function(argument)
+    return iterations / (perf_counter() - start)
+
+
+def directive(value):
+    """Build a directive setting the position of the example blind."""
+    return {"directive": {
+        "header": {"namespace": "Alexa.RangeController",
+                   "name": "SetRangeValue", "instance": "Blind.Position"},
+        "endpoint": {"endpointId": "smart_blind_01"},
+        "payload": {"rangeValue": value}
+    }}
+
+
+def main():
+    """Time body parsing, then directive validation."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000,
+                        help="directives parsed and validated")
+    args = parser.parse_args()
+
+    results = []
+    for size in BODY_SIZES:
+        line = b"x" * 62 + b"\r\n"
+        body = line * (size // len(line))
+        raw_request = build_request("POST", "/smarthome/directive", body)
+        iterations = max(5, args.iterations * 64 // size)
+        results.append({
+            "body_bytes": len(body),
+            "lines_per_sec": time_calls(parse_lines, raw_request,
+                                        iterations),
+            "bytes_per_sec": time_calls(HTTPRequest, raw_request, iterations)
+        })
+    print_table(results, ["body_bytes", "lines_per_sec", "bytes_per_sec"])
+    print()
+
+    handler = SmartDeviceHandler()
+    registry = handler.device_registry
+
+    def check_by_hand(request):
+        directive_json = loads(request.body)["directive"]
+        endpoint_id = directive_json["endpoint"]["endpointId"]
+        registry.find_endpoint(endpoint_id)
+        registry.has_interface(endpoint_id,
+                               directive_json["header"]["namespace"])
+
+    def check_schema(request):
+        directive_json = loads(request.body).get("directive")
+        return handler._check_directive(registry.get_index(),
+                                        directive_json)
+
+    results = []
+    for name, value in (("valid", 50), ("out_of_range", 150)):
+        raw_request = build_request("POST", "/smarthome/directive",
+                                    dumps(directive(value)).encode("utf-8"))
+        request = HTTPRequest(raw_request)
+        results.append({
+            "directive": name,
+            "parse_only_per_sec": time_calls(HTTPRequest, raw_request,
+                                             args.iterations),
+            "by_hand_per_sec": time_calls(check_by_hand, request,
+                                          args.iterations),
+            "schema_per_sec": time_calls(check_schema, request,
+                                         args.iterations),
+            "result": str(check_schema(request))
+        })
+    print_table(results, ["directive", "parse_only_per_sec",
+                          "by_hand_per_sec", "schema_per_sec", "result"])
+
+
+if __name__ == "__main__":
+    main()
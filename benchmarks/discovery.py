@@ -0,0 +1,129 @@
+"""Benchmark discovery against fleets of generated devices.
+
+Times discovery requests over a keep-alive connection, both full (200) and
+revalidated (304) responses, alongside re-reading and serialising the
+devices file for each request, as discovery used to. Also times rebuilding
+the cached response after one endpoint of the fleet changes.
+
+Usage: python benchmarks/discovery.py [--requests N]
+"""
+from argparse import ArgumentParser
+from json import dump, dumps, loads
+from os import path, utime
+from socket import create_connection
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from bench_utils import (build_request, generate_endpoints, percentile,
+                         print_table, quiet, read_response, start_server)
+from HTTPTools.DeviceRegistry import DeviceRegistry
+from HTTPTools.RequestHandler import RequestHandler
+
+FLEET_SIZES = [10, 1000, 10000]
+
+
+def time_requests(port, raw_request, count):
+    """Time discovery requests sent in turn on one keep-alive connection.
+
+    Returns:
+        tuple: The p50 latency in milliseconds and the last status code.
+    """
+    latencies = []
+    with create_connection(("localhost", port)) as client:
+        reader = client.makefile("rb")
+        for _ in range(count):
+            start = perf_counter()
+            client.sendall(raw_request)
+            status_code, _, _ = read_response(reader)
+            latencies.append(perf_counter() - start)
+    return percentile(latencies, 0.5) * 1000, status_code
+
+
+def time_uncached(devices_file, count):
+    """Time reading and serialising the devices file, as before caching.
+
+    Returns:
+        float: The p50 time in milliseconds.
+    """
+    latencies = []
+    for _ in range(count):
+        start = perf_counter()
+        with open(devices_file, "r") as input_file:
+            dumps(loads(input_file.read())).encode("utf-8")
+        latencies.append(perf_counter() - start)
+    return percentile(latencies, 0.5) * 1000
+
+
+def time_rebuild(devices_file, registry):
+    """Change one endpoint, then time reloading and rebuilding discovery.
+
+    Returns:
+        tuple: The incremental and full rebuild times, in milliseconds.
+    """
+    with open(devices_file, "r") as input_file:
+        devices = loads(input_file.read())
+    devices["endpoints"][0]["friendlyName"] = "Renamed device"
+    with open(devices_file, "w") as output_file:
+        dump(devices, output_file)
+    utime(devices_file)
+
+    start = perf_counter()
+    registry.get_discovery()
+    incremental_ms = (perf_counter() - start) * 1000
+
+    start = perf_counter()
+    DeviceRegistry(devices_file).get_discovery()
+    full_ms = (perf_counter() - start) * 1000
+    return incremental_ms, full_ms
+
+
+def main():
+    """Time discovery for each fleet size."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=50,
+                        help="discovery requests for each fleet size")
+    args = parser.parse_args()
+
+    with quiet():
+        server = start_server()
+    handler = RequestHandler.smart_device_handler
+    discover = build_request("POST", "/smarthome/discover",
+                             headers={"Connection": "keep-alive"})
+
+    results = []
+    with TemporaryDirectory() as directory:
+        for size in FLEET_SIZES:
+            devices_file = path.join(directory, "devices-{}.json".format(size))
+            with open(devices_file, "w") as output_file:
+                dump({"endpoints": generate_endpoints(size)}, output_file)
+            registry = DeviceRegistry(devices_file, check_interval=0)
+            handler.device_registry = registry
+
+            payload, etag = registry.get_discovery()
+            revalidate = build_request(
+                "POST", "/smarthome/discover",
+                headers={"Connection": "keep-alive", "If-None-Match": etag})
+            with quiet():
+                cached_ms, _ = time_requests(server.port, discover,
+                                             args.requests)
+                not_modified_ms, status_code = time_requests(
+                    server.port, revalidate, args.requests)
+            assert status_code == 304
+
+            incremental_ms, full_ms = time_rebuild(devices_file, registry)
+            results.append({
+                "endpoints": size,
+                "payload_kb": len(payload) / 1024,
+                "uncached_ms": time_uncached(devices_file, args.requests),
+                "cached_ms": cached_ms,
+                "304_ms": not_modified_ms,
+                "full_rebuild_ms": full_ms,
+                "incr_rebuild_ms": incremental_ms
+            })
+
+    print_table(results, ["endpoints", "payload_kb", "uncached_ms",
+                          "cached_ms", "304_ms", "full_rebuild_ms",
+                          "incr_rebuild_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark the memory used to serve static files of growing size.
+
+Measures the peak Python memory allocated while serving each file, against
+the peak when the whole response is built as one byte string. Synthetic
+files are written to www_root for the run and removed afterwards.
+
+Usage: python benchmarks/file_serving.py [--mode MODE] [--requests N]
+"""
+from argparse import ArgumentParser
+from os import path, remove
+from socket import create_connection
+from time import perf_counter
+import tracemalloc
+from bench_utils import (REPO_ROOT, WebServer, build_request, print_table,
+                         quiet, start_server)
+from HTTPTools.HTTPResponse import HTTPResponse
+from HTTPTools.RequestHandler import RequestHandler
+
+ICON = "/android-chrome-512x512.png"
+SYNTHETIC_SIZES = [1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024]
+
+
+def drain_response(client, buffer):
+    """Read a response without keeping its body in memory.
+
+    Args:
+        client (socket): The connected client socket.
+        buffer (memoryview): A reusable buffer to recieve into.
+
+    Returns:
+        int: The number of body bytes read.
+    """
+    head = b""
+    while b"\r\n\r\n" not in head:
+        head += client.recv(1024)
+    head, _, body = head.partition(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        field, _, value = line.partition(b":")
+        if field.lower() == b"content-length":
+            length = int(value)
+
+    remaining = length - len(body)
+    while remaining:
+        remaining -= client.recv_into(buffer, min(remaining, len(buffer)))
+    return length
+
+
+def measure(port, uri, requests):
+    """Fetch a file repeatedly, tracking peak memory and throughput.
+
+    Returns:
+        dict: The peak memory allocated, in KiB, and bytes per second.
+    """
+    raw_request = build_request("GET", uri)
+    buffer = memoryview(bytearray(65536))
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sent = 0
+    start = perf_counter()
+    for _ in range(requests):
+        with create_connection(("localhost", port)) as client:
+            client.sendall(raw_request)
+            sent += drain_response(client, buffer)
+    elapsed = perf_counter() - start
+    return {
+        "peak_kib": (tracemalloc.get_traced_memory()[1] - baseline) / 1024,
+        "mib_per_sec": sent / elapsed / 1024 / 1024
+    }
+
+
+def copy_peak(response):
+    """Find the peak memory used to build a response as one byte string.
+
+    Returns:
+        float: The peak memory allocated, in KiB.
+    """
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    response.create_http_response()
+    return (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+
+
+def main():
+    """Serve files of each size, reporting peak memory per request."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        default="threaded")
+    parser.add_argument("--requests", type=int, default=5,
+                        help="requests for each file")
+    args = parser.parse_args()
+
+    files = [(ICON, None)]
+    for size in SYNTHETIC_SIZES:
+        name = "bench-{}.png".format(size)
+        with open(path.join(REPO_ROOT, "www_root", name), "wb") as output:
+            output.write(b"\0" * size)
+        files.append(("/" + name, size))
+    RequestHandler.static_files.reindex()
+
+    results = []
+    tracemalloc.start()
+    try:
+        with quiet():
+            server = start_server(mode=args.mode)
+            measure(server.port, "/index.html", 1)  # warm up the server
+            for uri, size in files:
+                # load the file into the cache, if it fits
+                entry = RequestHandler.static_files.get(uri)
+                result = measure(server.port, uri, args.requests)
+                result.update(
+                    uri=uri, file_kib=entry.size / 1024,
+                    sendfile=entry.data is None,
+                    copy_peak_kib=copy_peak(HTTPResponse(
+                        200, HTTPResponse.FileContent(entry.path,
+                                                      entry.size))))
+                results.append(result)
+    finally:
+        tracemalloc.stop()
+        for uri, size in files:
+            if size is not None:
+                remove(path.join(REPO_ROOT, "www_root", uri[1:]))
+
+    print_table(results, ["uri", "file_kib", "sendfile", "peak_kib",
+                          "copy_peak_kib", "mib_per_sec"])
+
+
+if __name__ == "__main__":
+    main()
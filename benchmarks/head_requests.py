@@ -0,0 +1,69 @@
+"""Benchmark HEAD requests, checking they match GET without reading files.
+
+Sends HEAD to a cold cache before GET for each asset, comparing the headers
+of the two responses and counting the files the cache read for the HEAD.
+
+Usage: python benchmarks/head_requests.py [--requests N]
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from bench_utils import (build_request, fetch, print_table, quiet,
+                         start_server, summarise)
+from HTTPTools.RequestHandler import RequestHandler
+
+ASSETS = ["/", "/favicon.ico", "/android-chrome-512x512.png", "/frog.png",
+          "/CustomSmartHome/Privacy-Notice.html"]
+
+
+def response_headers(raw_response):
+    """Split the header fields from a raw response.
+
+    Returns:
+        tuple: The status line (byte string) and the header lines (list).
+    """
+    head = raw_response.partition(b"\r\n\r\n")[0].split(b"\r\n")
+    return head[0], sorted(head[1:])
+
+
+def main():
+    """Compare HEAD and GET responses for each asset."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests timed for each method")
+    args = parser.parse_args()
+
+    cache = RequestHandler.static_files
+    headers = {"Accept-Encoding": "gzip"}
+    results = []
+    with quiet():
+        server = start_server(mode="event-loop")
+        for uri in ASSETS:
+            reads = cache.stats()["reads"]
+            head = fetch(server.port, build_request("HEAD", uri, b"",
+                                                    headers))
+            head_reads = cache.stats()["reads"] - reads
+            get = fetch(server.port, build_request("GET", uri, b"", headers))
+
+            result = {"uri": uri, "head_reads": head_reads,
+                      "headers_match": (response_headers(head)
+                                        == response_headers(get)),
+                      "head_has_body": head.endswith(b"\r\n\r\n") is False}
+            for method in ("HEAD", "GET"):
+                raw_request = build_request(method, uri, b"", headers)
+                latencies = []
+                start = perf_counter()
+                for _ in range(args.requests):
+                    request_start = perf_counter()
+                    fetch(server.port, raw_request)
+                    latencies.append(perf_counter() - request_start)
+                summary = summarise(latencies, perf_counter() - start)
+                result[method.lower() + "_per_sec"] = \
+                    summary["requests_per_sec"]
+            results.append(result)
+
+    print_table(results, ["uri", "headers_match", "head_has_body",
+                          "head_reads", "head_per_sec", "get_per_sec"])
+
+
+if __name__ == "__main__":
+    main()
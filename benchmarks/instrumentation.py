@@ -0,0 +1,92 @@
+"""Micro-benchmark the cost of instrumenting each request.
+
+Compares recording a request's timing in Metrics, with the access log
+hooked in at several sample rates, against the three print() calls the
+server used to make for every request. Output goes to os.devnull in both
+cases. Also times rendering /metrics once every URI class has been seen.
+
+Usage: python benchmarks/instrumentation.py [--iterations N]
+"""
+from argparse import ArgumentParser
+from os import devnull
+from time import perf_counter
+import sys
+from bench_utils import print_table
+from HTTPTools.AccessLog import AccessLog
+from HTTPTools.Metrics import Metrics
+
+ADDRESS = ("127.0.0.1", 51278)
+URIS = ["/index.html", "/smarthome/discover", "/smarthome/status",
+        "/smarthome/directive", "/metrics", None]
+SAMPLE_RATES = [0.0, 0.01, 0.1, 1.0]
+
+
+def make_timing(index):
+    """Build the timing of a typical request."""
+    timing = Metrics.RequestTiming(ADDRESS)
+    timing.uri = URIS[index % len(URIS)]
+    timing.method = None if timing.uri is None else "GET"
+    timing.status_code = 400 if timing.uri is None else 200
+    timing.bytes_sent = 902
+    for phase in Metrics.PHASES:
+        setattr(timing, phase, 0.0001 * (index % 50))
+    return timing
+
+
+def time_calls(function, arguments):
+    """Time calling a function with each argument in turn.
+
+    Returns:
+        float: Calls per second.
+    """
+    start = perf_counter()
+    for argument in arguments:
+        function(argument)
+    return len(arguments) / (perf_counter() - start)
+
+
+def print_request(timing):
+    """Log a request as the server used to."""
+    print("Request made from {}".format(timing.address))
+    print("Data recieved from {}".format(timing.address))
+    print("Response sent to {}".format(timing.address))
+
+
+def main():
+    """Time each way of instrumenting a request, then rendering."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000,
+                        help="requests recorded by each method")
+    args = parser.parse_args()
+    timings = [make_timing(index) for index in range(args.iterations)]
+
+    with open(devnull, "w") as sink:
+        stdout = sys.stdout
+        sys.stdout = sink
+        try:
+            results = [{"method": "print", "requests_per_sec": time_calls(
+                print_request, timings), "dropped": 0}]
+        finally:
+            sys.stdout = stdout
+
+        results.append({"method": "metrics", "requests_per_sec": time_calls(
+            Metrics().record, timings), "dropped": 0})
+        for sample_rate in SAMPLE_RATES:
+            metrics = Metrics()
+            access_log = AccessLog(sink, sample_rate, args.iterations)
+            metrics.add_hook(access_log)
+            results.append({
+                "method": "metrics+log@{:g}".format(sample_rate),
+                "requests_per_sec": time_calls(metrics.record, timings),
+                "dropped": access_log.dropped
+            })
+
+    start = perf_counter()
+    for _ in range(100):
+        metrics.render()
+    print_table(results, ["method", "requests_per_sec", "dropped"])
+    print("render: {:.3f} ms".format((perf_counter() - start) * 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Benchmark fetching a page's assets over one or many connections.
+
+Fetches index.html and every asset it links to, either on a new connection
+per asset, one after another on a single persistent connection, or all
+pipelined on a single persistent connection.
+
+Usage: python benchmarks/keep_alive.py [--mode MODE] [--pages N]
+"""
+from argparse import ArgumentParser
+from socket import create_connection
+from time import perf_counter
+from bench_utils import (WebServer, build_request, fetch, print_table, quiet,
+                         read_response, start_server, summarise)
+
+PAGE_ASSETS = [
+    "/index.html",
+    "/apple-touch-icon.png",
+    "/favicon-32x32.png",
+    "/favicon-16x16.png",
+    "/favicon.ico",
+    "/android-chrome-192x192.png",
+    "/android-chrome-512x512.png",
+]
+
+
+def new_connections(port, pages):
+    """Fetch every asset on its own connection."""
+    requests = [build_request("GET", uri) for uri in PAGE_ASSETS]
+    latencies = []
+    for _ in range(pages):
+        for raw_request in requests:
+            start = perf_counter()
+            fetch(port, raw_request)
+            latencies.append(perf_counter() - start)
+    return latencies
+
+
+def one_connection(port, pages, pipelined=False):
+    """Fetch every asset over persistent connections, one per page load."""
+    keep_alive = {"Connection": "keep-alive"}
+    requests = [build_request("GET", uri, headers=keep_alive)
+                for uri in PAGE_ASSETS]
+    latencies = []
+    for _ in range(pages):
+        with create_connection(("localhost", port)) as client:
+            reader = client.makefile("rb")
+            if pipelined:
+                start = perf_counter()
+                client.sendall(b"".join(requests))
+                for _ in requests:
+                    read_response(reader)
+                per_request = (perf_counter() - start) / len(requests)
+                latencies.extend([per_request] * len(requests))
+                continue
+            for raw_request in requests:
+                start = perf_counter()
+                client.sendall(raw_request)
+                read_response(reader)
+                latencies.append(perf_counter() - start)
+    return latencies
+
+
+def main():
+    """Load the page repeatedly in each connection strategy."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        default="threaded")
+    parser.add_argument("--pages", type=int, default=100,
+                        help="page loads per strategy")
+    args = parser.parse_args()
+
+    strategies = [
+        ("new connection per asset", lambda port: new_connections(
+            port, args.pages)),
+        ("one connection", lambda port: one_connection(port, args.pages)),
+        ("one connection, pipelined", lambda port: one_connection(
+            port, args.pages, pipelined=True)),
+    ]
+
+    results = []
+    with quiet():
+        server = start_server(mode=args.mode)
+        for name, strategy in strategies:
+            start = perf_counter()
+            latencies = strategy(server.port)
+            result = summarise(latencies, perf_counter() - start)
+            result["strategy"] = name
+            results.append(result)
+
+    print_table(results, ["strategy", "requests", "requests_per_sec",
+                          "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark how throughput scales with the number of worker processes.
+
+Starts WebServer.py with --processes N for N from 1 up to the number of CPU
+cores, and drives it from several client processes, so that the load
+generator is not limited to one core either. Run on a multi-core machine;
+with a single core, extra processes only add overhead.
+
+Usage: python benchmarks/process_scaling.py [--mode MODE] [--reuse-port]
+           [--clients N] [--requests N] [--max-processes N]
+"""
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from os import cpu_count, devnull, path
+from signal import SIGTERM
+from socket import create_connection
+from subprocess import Popen, STDOUT
+from time import perf_counter, sleep
+import sys
+from bench_utils import WebServer, build_request, print_table, run_load
+
+SERVER = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                   "WebServer.py")
+PORT = 8097
+WORKLOADS = [
+    ("static", build_request("GET", "/index.html")),
+    ("discovery", build_request("GET", "/smarthome/discover")),
+    ("status", build_request("POST", "/smarthome/status", b"smart_blind_01"))
+]
+
+
+def process_counts(limit):
+    """Find the numbers of worker processes to try.
+
+    Args:
+        limit (int): The most worker processes to try.
+
+    Returns:
+        list(int): Powers of two up to the limit, and the limit itself.
+    """
+    counts = [1]
+    while counts[-1] * 2 < limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+def start_server(processes, mode, reuse_port):
+    """Start the server in its own process, waiting until it accepts.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    command = [sys.executable, SERVER, "--port", str(PORT), "--mode", mode,
+               "--processes", str(processes), "--backlog", "128",
+               "--fake-controllers"]
+    if reuse_port:
+        command.append("--reuse-port")
+    with open(devnull, "w") as output:
+        server = Popen(command, stdout=output, stderr=STDOUT,
+                       cwd=path.dirname(SERVER))
+    for _ in range(100):
+        try:
+            create_connection(("localhost", PORT)).close()
+            return server
+        except OSError:
+            sleep(0.1)
+    server.kill()
+    raise Exception("Server did not start!")
+
+
+def run(clients, requests, raw_request, client_processes):
+    """Drive the server from several client processes at once.
+
+    Returns:
+        dict: Requests completed, errors, throughput and worst p99 latency.
+    """
+    with Pool(client_processes) as pool:
+        start = perf_counter()
+        summaries = pool.starmap(run_load, [(PORT, raw_request, clients,
+                                             requests)] * client_processes)
+        elapsed = perf_counter() - start
+    completed = sum(summary["requests"] for summary in summaries)
+    return {
+        "requests": completed,
+        "errors": sum(summary["errors"] for summary in summaries),
+        "requests_per_sec": completed / elapsed,
+        "p99_ms": max(summary["p99_ms"] for summary in summaries)
+    }
+
+
+def main():
+    """Run each workload against each number of worker processes."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        default="threaded")
+    parser.add_argument("--reuse-port", action="store_true")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="client threads in each client process")
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests sent by each client thread")
+    parser.add_argument("--client-processes", type=int,
+                        default=cpu_count() or 1)
+    parser.add_argument("--max-processes", type=int,
+                        default=cpu_count() or 1,
+                        help="most worker processes to try, default is the "
+                             "number of CPU cores")
+    args = parser.parse_args()
+
+    results = []
+    for processes in process_counts(args.max_processes):
+        server = start_server(processes, args.mode, args.reuse_port)
+        try:
+            for name, raw_request in WORKLOADS:
+                result = run(args.clients, args.requests, raw_request,
+                             args.client_processes)
+                result.update({"processes": processes, "workload": name})
+                results.append(result)
+        finally:
+            server.send_signal(SIGTERM)
+            server.wait()
+
+    for result in results:
+        single = next(other for other in results
+                      if other["workload"] == result["workload"]
+                      and other["processes"] == 1)
+        result["scaling"] = "{:.2f}x".format(
+            result["requests_per_sec"] / single["requests_per_sec"])
+    print_table(results, ["workload", "processes", "requests", "errors",
+                          "requests_per_sec", "p99_ms", "scaling"])
+
+
+if __name__ == "__main__":
+    main()
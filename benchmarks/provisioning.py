@@ -0,0 +1,56 @@
+"""Benchmark provisioning fleets of devices from the blind template.
+
+Times stamping and validating devices, then provisioning them (writing
+their state files and the devices file) into an empty registry, and
+merging a smaller batch into the provisioned fleet.
+
+Usage: python benchmarks/provisioning.py [--merge N]
+"""
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from bench_utils import generate_parameters, print_table, provision_fleet
+from HTTPTools.DeviceProvisioner import DeviceProvisioner
+
+FLEET_SIZES = [100, 1000, 10000]
+
+
+def main():
+    """Time provisioning for each fleet size."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--merge", type=int, default=100,
+                        help="devices merged into each provisioned fleet")
+    args = parser.parse_args()
+
+    provisioner = DeviceProvisioner()
+    results = []
+    for size in FLEET_SIZES:
+        rows = generate_parameters(size + args.merge)
+        start = perf_counter()
+        for row in rows[:size]:
+            provisioner.validate(provisioner.stamp(row))
+        stamp_s = perf_counter() - start
+
+        with TemporaryDirectory() as directory:
+            start = perf_counter()
+            devices_file = provision_fleet(size, directory)
+            provision_s = perf_counter() - start
+
+            start = perf_counter()
+            provisioner.provision(rows[size:], devices_file, directory)
+            merge_s = perf_counter() - start
+
+        results.append({
+            "devices": size,
+            "stamp_validate_s": stamp_s,
+            "provision_s": provision_s,
+            "devices_per_sec": size / provision_s,
+            "merge_s": merge_s
+        })
+
+    print_table(results, ["devices", "stamp_validate_s", "provision_s",
+                          "devices_per_sec", "merge_s"])
+
+
+if __name__ == "__main__":
+    main()
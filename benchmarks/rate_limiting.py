@@ -0,0 +1,94 @@
+"""Micro-benchmark rate limiting, and the memory its buckets take.
+
+Times RateLimiter.check for requests from growing numbers of clients, and
+counts the buckets kept once the clients have been idle long enough for
+their buckets to refill. Then times a server answering a flooding client,
+which opens a connection for each request, with 429 responses against
+serving it a static file.
+
+Usage: python benchmarks/rate_limiting.py [--checks N] [--requests N]
+"""
+from argparse import ArgumentParser
+from socket import create_connection
+from time import perf_counter, sleep
+from bench_utils import (build_request, print_table, quiet, read_response,
+                         start_server)
+from HTTPTools.RateLimiter import RateLimiter
+from HTTPTools.RequestHandler import RequestHandler
+
+CLIENT_COUNTS = [1, 1000, 100000]
+RULES = ["/smarthome/=20/10", "/=100/50"]
+
+
+def time_checks(limiter, clients, checks):
+    """Time checking requests from clients in turn.
+
+    Returns:
+        float: Checks per second.
+    """
+    ips = ["10.{}.{}.{}".format(number >> 16, (number >> 8) & 255,
+                                number & 255) for number in range(clients)]
+    paths = ["/index.html", "/smarthome/status"]
+    start = perf_counter()
+    for number in range(checks):
+        limiter.check(ips[number % clients], paths[number & 1])
+    return checks / (perf_counter() - start)
+
+
+def time_flood(port, requests):
+    """Time sending requests, each on a new connection.
+
+    Returns:
+        tuple: Responses per second, and the status codes received (set).
+    """
+    raw_request = build_request("GET", "/index.html")
+    status_codes = set()
+    start = perf_counter()
+    for _ in range(requests):
+        with create_connection(("localhost", port)) as client:
+            client.sendall(raw_request)
+            status_codes.add(read_response(client.makefile("rb"))[0])
+    return requests / (perf_counter() - start), status_codes
+
+
+def main():
+    """Time checks and count buckets, then time a flooding client."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--checks", type=int, default=200000,
+                        help="requests checked for each number of clients")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="requests sent by the flooding client")
+    args = parser.parse_args()
+
+    results = []
+    for clients in CLIENT_COUNTS:
+        limiter = RateLimiter([RateLimiter.Rule.parse(rule)
+                               for rule in RULES])
+        checks_per_sec = time_checks(limiter, clients, args.checks)
+        buckets = len(limiter.buckets)
+        sleep(max(rule.refill_time for rule in limiter.rules))
+        time_checks(limiter, 1, 1)
+        results.append({"clients": clients,
+                        "checks_per_sec": checks_per_sec,
+                        "buckets": buckets,
+                        "buckets_after_idle": len(limiter.buckets)})
+    print_table(results, ["clients", "checks_per_sec", "buckets",
+                          "buckets_after_idle"])
+
+    results = []
+    with quiet():
+        server = start_server()
+        for name, rules in (("unlimited", []), ("limited", ["/=1/1"])):
+            RequestHandler.rate_limiter = RateLimiter(
+                [RateLimiter.Rule.parse(rule) for rule in rules])
+            responses_per_sec, status_codes = time_flood(server.port,
+                                                         args.requests)
+            results.append({"limit": name,
+                            "responses_per_sec": responses_per_sec,
+                            "status_codes": sorted(status_codes)})
+    print()
+    print_table(results, ["limit", "responses_per_sec", "status_codes"])
+
+
+if __name__ == "__main__":
+    main()
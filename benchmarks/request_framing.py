@@ -0,0 +1,94 @@
+"""Benchmark the latency of reading POST requests of various sizes.
+
+Bodies are sent whole, split across several writes, or chunk encoded. With
+requests framed by Content-Length, none of these should wait for a read
+timeout, even when the request ends on a read-buffer boundary.
+
+Usage: python benchmarks/request_framing.py [--mode MODE] [--requests N]
+"""
+from argparse import ArgumentParser
+from socket import IPPROTO_TCP, TCP_NODELAY, create_connection
+from time import perf_counter, sleep
+from bench_utils import (WebServer, build_request, print_table, quiet,
+                         read_response, start_server, summarise)
+
+BODY_SIZES = [100, 4096 - 73, 4096, 16384, 65536]
+SPLIT_DELAY = 0.001  # seconds between the writes of a split request
+
+
+def chunk_encode(body, chunk_size=1000):
+    """Encode a body with chunked transfer encoding."""
+    chunks = [body[start:start + chunk_size]
+              for start in range(0, len(body), chunk_size)]
+    encoded = [b"%x\r\n%s\r\n" % (len(chunk), chunk) for chunk in chunks]
+    return b"".join(encoded) + b"0\r\n\r\n"
+
+
+def time_requests(port, raw_request, requests, segments):
+    """Send a request repeatedly on one connection, timing each response.
+
+    Args:
+        port (int): The port the server listens on.
+        raw_request (byte string): The raw request.
+        requests (int): The number of times to send it.
+        segments (int): The number of separate writes used to send it.
+
+    Returns:
+        list(float): The latency of every request, in seconds.
+    """
+    step = -(-len(raw_request) // segments)
+    latencies = []
+    with create_connection(("localhost", port)) as client:
+        # send each segment immediately, rather than coalescing them
+        client.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        reader = client.makefile("rb")
+        for _ in range(requests):
+            start = perf_counter()
+            for offset in range(0, len(raw_request), step):
+                client.sendall(raw_request[offset:offset + step])
+                if offset + step < len(raw_request):
+                    sleep(SPLIT_DELAY)
+            read_response(reader)
+            latencies.append(perf_counter() - start)
+    return latencies
+
+
+def main():
+    """Time POST requests of each size and framing."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        default="threaded")
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests sent for each size and framing")
+    args = parser.parse_args()
+
+    keep_alive = {"Connection": "keep-alive"}
+    results = []
+    with quiet():
+        server = start_server(mode=args.mode)
+        for size in BODY_SIZES:
+            body = b"x" * size
+            framings = [
+                ("content-length", build_request(
+                    "POST", "/smarthome/status", body, keep_alive), 1),
+                ("content-length, split", build_request(
+                    "POST", "/smarthome/status", body, keep_alive), 3),
+                ("chunked", build_request(
+                    "POST", "/smarthome/status", b"",
+                    dict(keep_alive, **{"Transfer-Encoding": "chunked"}))
+                    + chunk_encode(body), 1),
+            ]
+            for framing, raw_request, segments in framings:
+                start = perf_counter()
+                latencies = time_requests(server.port, raw_request,
+                                          args.requests, segments)
+                result = summarise(latencies, perf_counter() - start)
+                result.update(body_bytes=size, framing=framing)
+                results.append(result)
+
+    print_table(results, ["body_bytes", "framing", "requests", "p50_ms",
+                          "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Micro-benchmark parsing requests captured from browsers and Alexa.
+
+Compares HTTPRequest, which only parses the request line up front and finds
+header fields when they are asked for, with parsing every header line into
+a dict as HTTPRequest used to. Each capture is parsed alone, then parsed and
+queried for the headers the server reads when handling it.
+
+Usage: python benchmarks/request_parsing.py [--iterations N]
+"""
+from argparse import ArgumentParser
+from json import dumps
+from time import perf_counter
+import re
+from bench_utils import print_table
+from HTTPTools.HTTPRequest import HTTPRequest
+
+CHROME_GET = (
+    b"GET /index.html HTTP/1.1\r\n"
+    b"Host: tannoholmes.com\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Cache-Control: max-age=0\r\n"
+    b"sec-ch-ua: \"Chromium\";v=\"118\", \"Google Chrome\";v=\"118\", "
+    b"\"Not=A?Brand\";v=\"99\"\r\n"
+    b"sec-ch-ua-mobile: ?0\r\n"
+    b"sec-ch-ua-platform: \"Windows\"\r\n"
+    b"Upgrade-Insecure-Requests: 1\r\n"
+    b"User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    b"AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 "
+    b"Safari/537.36\r\n"
+    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,"
+    b"image/avif,image/webp,image/apng,*/*;q=0.8,"
+    b"application/signed-exchange;v=b3;q=0.7\r\n"
+    b"Sec-Fetch-Site: none\r\n"
+    b"Sec-Fetch-Mode: navigate\r\n"
+    b"Sec-Fetch-User: ?1\r\n"
+    b"Sec-Fetch-Dest: document\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Accept-Language: en-GB,en-US;q=0.9,en;q=0.8\r\n"
+    b"Cookie: _ga=GA1.1.1234567890.1697000000; "
+    b"_ga_ABCDEF1234=GS1.1.1697000000.1.0.1697000000.0.0.0\r\n"
+    b"\r\n"
+)
+
+FIREFOX_CONDITIONAL = (
+    b"GET /css/style.css HTTP/1.1\r\n"
+    b"Host: tannoholmes.com\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 "
+    b"Firefox/118.0\r\n"
+    b"Accept: text/css,*/*;q=0.1\r\n"
+    b"Accept-Language: en-GB,en;q=0.5\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Referer: http://tannoholmes.com/index.html\r\n"
+    b"If-Modified-Since: Mon, 02 Oct 2023 18:21:05 GMT\r\n"
+    b"If-None-Match: \"5f1e2d3c4b5a6978-1a2b\"\r\n"
+    b"Sec-Fetch-Dest: style\r\n"
+    b"Sec-Fetch-Mode: no-cors\r\n"
+    b"Sec-Fetch-Site: same-origin\r\n"
+    b"\r\n"
+)
+
+ALEXA_BODY = dumps({"directive": {
+    "header": {"namespace": "Alexa.RangeController",
+               "name": "SetRangeValue", "instance": "Blind.Position",
+               "payloadVersion": "3",
+               "messageId": "1bd5d003-31b9-476f-ad03-71d471922820",
+               "correlationToken": "dFMb0z+PgpgdDmluhJ1LddFvSqZ/jCc8ptlAKul"
+                                   "UFRHHbTTABx7z9RmP8PFtYZRVyXszrTzKxoUt2m"},
+    "endpoint": {"scope": {"type": "BearerToken",
+                           "token": "access-token-from-skill"},
+                 "endpointId": "smart_blind_01", "cookie": {}},
+    "payload": {"rangeValue": 50}
+}}).encode("utf-8")
+
+ALEXA_DIRECTIVE = (
+    b"POST /smarthome/directive HTTP/1.1\r\n"
+    b"Host: tannoholmes.com:8080\r\n"
+    b"Content-Type: application/json; charset=utf-8\r\n"
+    b"Accept: application/json\r\n"
+    b"Accept-Charset: utf-8\r\n"
+    b"User-Agent: Apache-HttpClient/UNAVAILABLE (Java/1.8.0_372)\r\n"
+    b"X-Amzn-Trace-Id: Root=1-652c1f3a-5d3c2b1a0f9e8d7c6b5a4938\r\n"
+    b"Signature: B2KnXnqa3ZKzDwZBZUBLo3Jc+1SGJsdZBpMgAy4KUrQ=\r\n"
+    b"SignatureCertChainUrl: https://s3.amazonaws.com/echo.api/"
+    b"echo-api-cert-12.pem\r\n"
+    b"Content-Length: " + str(len(ALEXA_BODY)).encode("ascii") + b"\r\n"
+    b"Connection: keep-alive\r\n"
+    b"\r\n" + ALEXA_BODY
+)
+
+CURL_GET = (
+    b"GET /smarthome/discover HTTP/1.1\r\n"
+    b"Host: localhost:8080\r\n"
+    b"User-Agent: curl/8.4.0\r\n"
+    b"Accept: */*\r\n"
+    b"\r\n"
+)
+
+# each capture, with the headers the server reads when handling it
+CAPTURES = [
+    ("chrome_get", CHROME_GET, ["Connection", "Accept-Encoding",
+                                "If-None-Match"]),
+    ("firefox_conditional", FIREFOX_CONDITIONAL, ["Connection",
+                                                  "Accept-Encoding",
+                                                  "If-None-Match"]),
+    ("alexa_directive", ALEXA_DIRECTIVE, ["Connection"]),
+    ("curl_get", CURL_GET, ["Connection", "If-None-Match"])
+]
+
+
+class DictRequest:
+    """Parse every header line into a dict, as HTTPRequest used to."""
+
+    END_OF_HEADERS = re.compile(b"\r?\n\r?\n")
+
+    def __init__(self, request_data):
+        """Parse a raw request."""
+        end_of_headers = self.END_OF_HEADERS.search(request_data)
+        head = request_data[:end_of_headers.start()].decode("utf-8")
+        self.body = request_data[end_of_headers.end():]
+        lines = head.splitlines()
+        method, self.request_uri, self.http_version = \
+            lines.pop(0).strip().split(" ")
+        self.method = HTTPRequest.HTTPMethod(method)
+        self.headers = {}
+        for line in lines:
+            field, value = line.split(":", 1)
+            self.headers[field] = value.strip()
+
+    def get_header(self, field, default=None):
+        """Find a header field by scanning every field."""
+        field = field.lower()
+        for header_field, header_value in self.headers.items():
+            if header_field.lower() == field:
+                return header_value
+        return default
+
+
+def time_calls(function, iterations):
+    """Time calling a function repeatedly.
+
+    Returns:
+        float: Calls per second.
+    """
+    start = perf_counter()
+    for _ in range(iterations):
+        function()
+    return iterations / (perf_counter() - start)
+
+
+def main():
+    """Time each parser on each capture."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000,
+                        help="times each capture is parsed")
+    args = parser.parse_args()
+
+    results = []
+    for name, capture, fields in CAPTURES:
+        def handle(parse):
+            request = parse(capture)
+            return [request.get_header(field) for field in fields]
+
+        assert handle(DictRequest) == handle(HTTPRequest)
+        result = {"capture": name, "bytes": len(capture)}
+        for parse, label in ((DictRequest, "dict"), (HTTPRequest, "lazy")):
+            result[label + "_parse_per_sec"] = time_calls(
+                lambda: parse(capture), args.iterations)
+            result[label + "_handle_per_sec"] = time_calls(
+                lambda: handle(parse), args.iterations)
+        for stage in ("parse", "handle"):
+            result[stage + "_speedup"] = "{:.1f}x".format(
+                result["lazy_{}_per_sec".format(stage)] /
+                result["dict_{}_per_sec".format(stage)])
+        results.append(result)
+
+    print_table(results, ["capture", "bytes", "dict_parse_per_sec",
+                          "lazy_parse_per_sec", "dict_handle_per_sec",
+                          "lazy_handle_per_sec", "parse_speedup",
+                          "handle_speedup"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark serialising and sending HTTP responses.
+
+Compares HTTPResponse, which takes its status line and Content-Type header
+from a cache and sends the header and body with one socket.sendmsg call,
+with formatting the whole header and concatenating the body to it as
+HTTPResponse used to, for bodies of several sizes. Responses are sent over
+a local socket pair, drained by a reader thread.
+
+Usage: python benchmarks/response_serialization.py [--iterations N]
+"""
+from argparse import ArgumentParser
+from socket import socketpair
+from threading import Thread
+from time import perf_counter
+from bench_utils import print_table
+from HTTPTools.HTTP_STATUS_CODES import HTTP_STATUS_CODES
+from HTTPTools.HTTPResponse import HTTPResponse
+
+BODY_SIZES = [64, 4096, 65536, 1048576]
+
+
+def format_response(response):
+    """Serialise a response by formatting it, as HTTPResponse used to."""
+    string = "{0} {1} {2}\r\n".format(HTTPResponse.HTTP_VERSION,
+                                      response.status_code,
+                                      HTTP_STATUS_CODES[response.status_code])
+    for header_field, header_value in response.headers.items():
+        string += "{0}: {1}\r\n".format(header_field, header_value)
+    string += "\r\n"
+    return string.encode("utf-8") + response.content
+
+
+def make_response(body):
+    """Build a response with the headers of a typical static file."""
+    response = HTTPResponse(200, body)
+    response.add_header("ETag", "\"5f1e2d3c4b5a6978-1a2b\"")
+    response.add_header("Last-Modified", "Mon, 02 Oct 2023 18:21:05 GMT")
+    response.add_header("Cache-Control", "public, max-age=3600")
+    response.add_header("Connection", "keep-alive")
+    return response
+
+
+def time_calls(function, iterations):
+    """Time calling a function repeatedly.
+
+    Returns:
+        float: Calls per second.
+    """
+    start = perf_counter()
+    for _ in range(iterations):
+        function()
+    return iterations / (perf_counter() - start)
+
+
+def drain(client):
+    """Read from a socket until it is closed."""
+    while client.recv(1048576):
+        pass
+
+
+def time_sends(send, iterations):
+    """Time sending a response repeatedly over a local socket pair.
+
+    Returns:
+        float: Responses sent per second.
+    """
+    server, client = socketpair()
+    reader = Thread(target=drain, args=(client,))
+    reader.start()
+    try:
+        return time_calls(lambda: send(server), iterations)
+    finally:
+        server.close()
+        reader.join()
+        client.close()
+
+
+def main():
+    """Time serialising, then sending, responses of each body size."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50000,
+                        help="responses serialised for the smallest body")
+    args = parser.parse_args()
+
+    results = []
+    for size in BODY_SIZES:
+        response = make_response(b"x" * size)
+        assert format_response(response) == response.create_http_response()
+        iterations = max(50, args.iterations * 64 // max(size, 4096))
+        results.append({
+            "body_bytes": size,
+            "format_per_sec": time_calls(lambda: format_response(response),
+                                         iterations),
+            "cached_per_sec": time_calls(response.create_http_response,
+                                         iterations),
+            "buffers_per_sec": time_calls(response.create_http_buffers,
+                                          iterations),
+            "sendall_per_sec": time_sends(
+                lambda client: client.sendall(format_response(response)),
+                iterations),
+            "sendmsg_per_sec": time_sends(response.send, iterations)
+        })
+
+    print_table(results, ["body_bytes", "format_per_sec", "cached_per_sec",
+                          "buffers_per_sec", "sendall_per_sec",
+                          "sendmsg_per_sec"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Micro-benchmark routing requests and finding static files.
+
+Compares normalising the URI, looking up the route table and finding the
+static file in the cache's path index with how RequestHandler used to
+dispatch: string checks on the raw URI, then probing the filesystem with
+path.isdir and path.isfile for a file in www_root. Requests are routed
+without being handled, so only finding the handler and file is timed.
+
+Usage: python benchmarks/routing.py [--iterations N]
+"""
+from argparse import ArgumentParser
+from os import path
+from time import perf_counter
+from bench_utils import print_table
+from HTTPTools.HTTPRequest import HTTPRequest
+from HTTPTools.Metrics import Metrics
+from HTTPTools.RequestHandler import RequestHandler
+from HTTPTools.SmartDeviceHandler import SmartDeviceHandler
+
+GET = HTTPRequest.HTTPMethod.GET
+POST = HTTPRequest.HTTPMethod.POST
+REQUESTS = [
+    ("static_hit", GET, "/index.html"),
+    ("static_query", GET, "/index.html?v=3"),
+    ("static_miss", GET, "/wp-login.php"),
+    ("static_deep_miss", GET, "/CustomSmartHome/assets/js/app.js"),
+    ("smart_home", POST, "/smarthome/status"),
+    ("metrics", GET, "/metrics"),
+]
+
+
+def legacy_route(method, uri, root):
+    """Route a request as RequestHandler used to.
+
+    Returns:
+        string: The handler routed the request, and the static file found.
+    """
+    if uri.startswith(SmartDeviceHandler.SMART_HOME_KEY):
+        return "smart_home"
+    if method != GET:
+        return None
+    if uri == Metrics.METRICS_URI:
+        return "metrics"
+    full_path = root + "/" + uri
+    index_path = path.join(full_path, "index.html")
+    if path.isdir(full_path) and path.isfile(index_path):
+        return index_path
+    if path.isfile(full_path):
+        return full_path
+    return None
+
+
+def route(method, uri, static_files):
+    """Route a request with the route table and the path index.
+
+    Returns:
+        string: The handler routed the request, and the static file found.
+    """
+    uri_path, _ = HTTPRequest._normalise_uri(uri)
+    function = RequestHandler.ROUTES.find(method, uri_path)
+    if function is RequestHandler._do_GET:
+        entry = static_files.get(uri_path, False)
+        return None if entry is None else entry.path
+    return function
+
+
+def time_calls(function, iterations):
+    """Time calling a function repeatedly.
+
+    Returns:
+        float: Calls per second.
+    """
+    start = perf_counter()
+    for _ in range(iterations):
+        function()
+    return iterations / (perf_counter() - start)
+
+
+def main():
+    """Time routing each request, the old way and the new."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000,
+                        help="times each request is routed")
+    args = parser.parse_args()
+    static_files = RequestHandler.static_files
+
+    results = []
+    for name, method, uri in REQUESTS:
+        results.append({
+            "request": name,
+            "legacy_per_sec": time_calls(
+                lambda: legacy_route(method, uri, static_files.root),
+                args.iterations),
+            "router_per_sec": time_calls(
+                lambda: route(method, uri, static_files), args.iterations)
+        })
+        results[-1]["speedup"] = "{:.1f}x".format(
+            results[-1]["router_per_sec"] / results[-1]["legacy_per_sec"])
+
+    print_table(results, ["request", "legacy_per_sec", "router_per_sec",
+                          "speedup"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Benchmark comparing the throughput and latency of each serving mode.
+
+Usage: python benchmarks/serving_modes.py [--clients N] [--requests N]
+"""
+from argparse import ArgumentParser
+from bench_utils import (WebServer, build_request, print_table, quiet,
+                         run_load, start_server)
+
+
+def main():
+    """Run the same load against a server in each serving mode."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests sent by each client")
+    parser.add_argument("--uri", default="/index.html")
+    parser.add_argument("--backlog", type=int, default=128,
+                        help="size of the server's listen backlog")
+    args = parser.parse_args()
+
+    raw_request = build_request("GET", args.uri)
+    results = []
+    for mode in WebServer.SERVING_MODES:
+        with quiet():
+            server = start_server(mode=mode,
+                                  request_queue_size=args.backlog)
+            result = run_load(server.port, raw_request,
+                              args.clients, args.requests)
+        result["mode"] = mode
+        results.append(result)
+        if server.worker_pool is not None:
+            print("Worker pool: {}".format(server.worker_pool.stats()))
+
+    print_table(results, ["mode", "requests", "errors", "requests_per_sec",
+                          "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Benchmark normal clients' throughput while slow clients attack the server.
+
+Measures the throughput of normal clients alone, then alongside slow clients
+connecting from another loopback address: slowloris clients which trickle
+header lines, clients which trickle a request body, and clients which
+request a large file many times and never read it. Each slow client
+reconnects whenever the server cuts it off. The server's deadlines are
+shortened to --timeout seconds, and its minimum write rate raised to 1
+MiB/s, so slow connections are cut off within the run.
+
+Reports, for each serving mode, the normal clients' throughput and p99
+latency with and without the attack, how long slow connections lasted, how
+many the per-IP cap refused, and whether throughput stayed within
+--tolerance of the baseline.
+
+Usage: python benchmarks/slow_clients.py [--mode MODE] [--kind KIND]
+           [--clients N] [--slow-clients N] [--duration S] [--timeout S]
+           [--max-per-ip N]
+"""
+from argparse import ArgumentParser
+from select import select
+from socket import MSG_PEEK, create_connection
+from threading import Thread
+from time import perf_counter, sleep
+from bench_utils import (WebServer, build_request, fetch, percentile,
+                         print_table, quiet, start_server)
+from HTTPTools.RequestReader import RequestReader
+
+SLOW_ADDRESS = "127.0.0.2"  # slow clients connect from here
+TRICKLE_INTERVAL = 0.25  # seconds between each byte a slow client sends
+SLOW_KINDS = ("headers", "body", "reader")
+REFUSALS = (b"HTTP/1.1 429", b"HTTP/1.1 503")  # per-IP cap, busy pool
+
+
+def run_normal_client(port, deadline, latencies, errors):
+    """Fetch the index page on new connections until the deadline."""
+    raw_request = build_request("GET", "/index.html")
+    while perf_counter() < deadline:
+        start = perf_counter()
+        try:
+            response = fetch(port, raw_request)
+        except OSError:
+            errors.append(1)
+            continue
+        if not response.startswith(b"HTTP/1.1 200"):
+            errors.append(1)
+            continue
+        latencies.append(perf_counter() - start)
+
+
+def attack(client, kind):
+    """Act as a slow client until the server closes the connection.
+
+    Returns:
+        bool: True if the server refused the connection.
+    """
+    if kind == "headers":
+        client.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n")
+    elif kind == "body":
+        client.sendall(build_request("POST", "/smarthome/status",
+                                     headers={"Content-Length": "1000"}))
+    else:
+        client.sendall(build_request("GET", "/frog.png",
+                                     headers={"Connection": "keep-alive"})
+                       * 20 + b"GET /frog.png HTTP/1.1\r\n")
+    trickle = b"X-Padding: " + b"a" * 1000
+
+    for index in range(len(trickle)):
+        readable, _, _ = select([client], [], [], TRICKLE_INTERVAL)
+        if readable:
+            data = client.recv(12, MSG_PEEK)
+            if data.startswith(REFUSALS):
+                return True
+            if kind != "reader":
+                while client.recv(65536):
+                    pass
+                return False
+            # the reader never reads its responses, and finds the server
+            # has closed the connection when sending fails
+            if not data:
+                return False
+            sleep(TRICKLE_INTERVAL)
+        client.sendall(trickle[index:index + 1])
+    return False
+
+
+def run_slow_client(port, kind, deadline, lifetimes, refused):
+    """Attack the server on connection after connection until the deadline.
+    """
+    while perf_counter() < deadline:
+        start = perf_counter()
+        try:
+            with create_connection(("127.0.0.1", port),
+                                   source_address=(SLOW_ADDRESS, 0)) \
+                    as client:
+                client.settimeout(deadline - perf_counter() + 1)
+                if attack(client, kind):
+                    refused.append(1)
+                    sleep(TRICKLE_INTERVAL)
+                    continue
+        except OSError:
+            pass
+        lifetimes.append(perf_counter() - start)
+
+
+def measure(port, clients, duration, slow_clients=0, kinds=SLOW_KINDS):
+    """Run normal clients, and optionally slow clients, for a duration.
+
+    Returns:
+        dict: The normal clients' throughput and latency, and the slow
+            connections' lifetimes and refusals.
+    """
+    latencies, errors, lifetimes, refused = [], [], [], []
+    slow_threads = [Thread(target=run_slow_client,
+                           args=(port, kinds[number % len(kinds)],
+                                 perf_counter() + duration * 2, lifetimes,
+                                 refused), daemon=True)
+                    for number in range(slow_clients)]
+    for thread in slow_threads:
+        thread.start()
+    if slow_clients:
+        sleep(duration / 2)  # let the slow clients take hold
+
+    deadline = perf_counter() + duration
+    threads = [Thread(target=run_normal_client,
+                      args=(port, deadline, latencies, errors))
+               for _ in range(clients)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    return {
+        "requests_per_sec": len(latencies) / elapsed,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": len(errors),
+        "slow_connections": len(lifetimes),
+        "refused": len(refused),
+        "max_slow_s": max(lifetimes) if lifetimes else 0.0
+    }
+
+
+def main():
+    """Measure each serving mode with and without slow clients."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        action="append",
+                        help="serving mode, may be repeated, default is all")
+    parser.add_argument("--kind", choices=SLOW_KINDS, action="append",
+                        help="slow client, may be repeated, default is all")
+    parser.add_argument("--clients", type=int, default=16,
+                        help="normal client threads, enough to load the "
+                             "worker pool's queue")
+    parser.add_argument("--slow-clients", type=int, default=48)
+    parser.add_argument("--duration", type=float, default=4.0,
+                        help="seconds the normal clients are measured for")
+    parser.add_argument("--timeout", type=float, default=2.0,
+                        help="the server's header, body and write deadlines")
+    parser.add_argument("--max-per-ip", type=int,
+                        help="connections open at once from one IP address, "
+                             "default is the server's")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="fraction throughput may fall under attack and "
+                             "still be stable")
+    args = parser.parse_args()
+
+    RequestReader.HEADER_TIMEOUT = RequestReader.BODY_TIMEOUT = args.timeout
+    RequestReader.MAX_HEADER_TIME = RequestReader.MAX_BODY_TIME = \
+        args.timeout * 2
+    WebServer.WRITE_TIMEOUT = args.timeout
+    WebServer.MIN_WRITE_RATE = 1048576
+    if args.max_per_ip is not None:
+        WebServer.connection_limiter.max_per_ip = args.max_per_ip
+
+    results = []
+    for mode in args.mode or WebServer.SERVING_MODES:
+        with quiet():
+            server = start_server(mode=mode, request_queue_size=128)
+            baseline = measure(server.port, args.clients, args.duration)
+            attacked = measure(server.port, args.clients, args.duration,
+                               args.slow_clients, args.kind or SLOW_KINDS)
+        ratio = attacked["requests_per_sec"] / baseline["requests_per_sec"]
+        results.append({
+            "mode": mode,
+            "baseline_rps": baseline["requests_per_sec"],
+            "attacked_rps": attacked["requests_per_sec"],
+            "ratio": ratio,
+            "baseline_p99_ms": baseline["p99_ms"],
+            "attacked_p99_ms": attacked["p99_ms"],
+            "errors": attacked["errors"],
+            "slow_connections": attacked["slow_connections"],
+            "refused": attacked["refused"],
+            "max_slow_s": attacked["max_slow_s"],
+            "stable": "yes" if ratio >= 1 - args.tolerance else "NO"
+        })
+        sleep(args.timeout * 2)  # let the slow connections be cut off
+
+    print_table(results, ["mode", "baseline_rps", "attacked_rps", "ratio",
+                          "baseline_p99_ms", "attacked_p99_ms", "errors",
+                          "slow_connections", "refused", "max_slow_s",
+                          "stable"])
+
+
+if __name__ == "__main__":
+    main()
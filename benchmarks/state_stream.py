@@ -0,0 +1,163 @@
+"""Benchmark propagating device state changes to many clients.
+
+A stream of directives changes a blind's position while clients watch it,
+either subscribed to /smarthome/subscribe (server-sent events) or polling
+/smarthome/status every --interval seconds on new connections. Reports how
+long each change took to reach the clients and how many requests the
+server handled for them.
+
+Usage: python benchmarks/state_stream.py [--changes N] [--interval S]
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from socket import create_connection
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from time import perf_counter, sleep
+from bench_utils import (build_request, fetch, percentile, print_table,
+                         provision_fleet, quiet, start_server)
+from HTTPTools.DeviceRegistry import DeviceRegistry
+from HTTPTools.DeviceStateStore import DeviceStateStore
+from HTTPTools.RequestHandler import RequestHandler
+
+CLIENT_COUNTS = [1, 10, 50]
+ENDPOINT_ID = "bench_device_0"
+
+
+def set_position(port, value):
+    """Send a directive setting the blind's position."""
+    body = {"directive": {
+        "header": {"namespace": "Alexa.RangeController",
+                   "name": "SetRangeValue", "instance": "Blind.Position"},
+        "endpoint": {"endpointId": ENDPOINT_ID},
+        "payload": {"rangeValue": value}
+    }}
+    fetch(port, build_request("POST", "/smarthome/directive",
+                              dumps(body).encode("utf-8")))
+
+
+def make_changes(port, changes, spacing):
+    """Change the blind's position repeatedly.
+
+    Returns:
+        dict: The time each position was set, keyed by position.
+    """
+    set_at = {}
+    for value in range(1, changes + 1):
+        set_at[value] = perf_counter()
+        set_position(port, value)
+        sleep(spacing)
+    return set_at
+
+
+def subscriber(port, seen, ready, done):
+    """Record when each position arrives on an event stream."""
+    with create_connection(("localhost", port)) as client:
+        client.sendall(build_request(
+            "GET", "/smarthome/subscribe?endpoints=" + ENDPOINT_ID,
+            headers={"Connection": "keep-alive"}))
+        reader = client.makefile("rb")
+        ready.set()
+        while not done.is_set():
+            line = reader.readline()
+            if not line:
+                return
+            if line.startswith(b"data: "):
+                event = loads(line[6:])
+                value = event["properties"][0]["value"]
+                seen.setdefault(value, perf_counter())
+
+
+def poller(port, interval, seen, counts, done):
+    """Record when each position is first seen by polling the status."""
+    raw_request = build_request("POST", "/smarthome/status",
+                                ENDPOINT_ID.encode("utf-8"))
+    while not done.is_set():
+        response = fetch(port, raw_request)
+        counts.append(1)
+        status = loads(response.split(b"\r\n\r\n", 1)[1])
+        seen.setdefault(status["properties"][0]["value"], perf_counter())
+        sleep(interval)
+
+
+def run(port, clients, changes, spacing, interval, streaming):
+    """Watch the blind from several clients while it changes.
+
+    Returns:
+        dict: Propagation latency percentiles and requests made.
+    """
+    done = Event()
+    seen = [{} for _ in range(clients)]
+    counts = []
+    threads = []
+    for client_seen in seen:
+        if streaming:
+            ready = Event()
+            thread = Thread(target=subscriber,
+                            args=(port, client_seen, ready, done))
+        else:
+            thread = Thread(target=poller, args=(port, interval, client_seen,
+                                                 counts, done))
+        thread.daemon = True
+        thread.start()
+        if streaming:
+            ready.wait()
+        threads.append(thread)
+    sleep(0.2)
+
+    start = perf_counter()
+    set_at = make_changes(port, changes, spacing)
+    sleep(max(interval, spacing) * 2)
+    elapsed = perf_counter() - start
+    done.set()
+    if streaming:
+        # wake the subscribers, so that they notice they are done
+        set_position(port, 0)
+
+    latencies = [client_seen[value] - set_at[value]
+                 for client_seen in seen for value in set_at
+                 if value in client_seen]
+    return {
+        "clients": clients,
+        "mode": "stream" if streaming else "poll",
+        "delivered": "{}/{}".format(len(latencies), clients * changes),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "requests_per_sec": (clients if streaming else len(counts)) / elapsed
+    }
+
+
+def main():
+    """Compare streaming and polling for each number of clients."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--changes", type=int, default=20,
+                        help="changes made to the blind's position")
+    parser.add_argument("--spacing", type=float, default=0.1,
+                        help="seconds between changes")
+    parser.add_argument("--interval", type=float, default=0.5,
+                        help="seconds between polls of each polling client")
+    args = parser.parse_args()
+
+    with quiet():
+        server = start_server(request_queue_size=128)
+    handler = RequestHandler.smart_device_handler
+
+    results = []
+    with TemporaryDirectory() as directory:
+        devices_file = provision_fleet(1, directory)
+        handler.device_registry = DeviceRegistry(devices_file)
+        handler.device_state_store = DeviceStateStore(directory)
+
+        with quiet():
+            for clients in CLIENT_COUNTS:
+                for streaming in (True, False):
+                    results.append(run(server.port, clients, args.changes,
+                                       args.spacing, args.interval,
+                                       streaming))
+
+    print_table(results, ["clients", "mode", "delivered", "p50_ms",
+                          "p99_ms", "requests_per_sec"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark serving static files from the in-memory cache.
+
+Requests each asset repeatedly over a persistent connection, counting the
+filesystem calls made by the cache, which should stop once it is warm.
+
+Usage: python benchmarks/static_cache.py [--requests N]
+"""
+from argparse import ArgumentParser
+from socket import create_connection
+from time import perf_counter
+from bench_utils import (build_request, print_table, quiet, read_response,
+                         start_server, summarise)
+from HTTPTools import StaticFileCache as cache_module
+from HTTPTools.RequestHandler import RequestHandler
+
+ASSETS = ["/favicon.ico", "/favicon-16x16.png", "/index.html", "/frog.png"]
+
+
+class CallCounter:
+    """Class to count the calls made to a function."""
+
+    def __init__(self, function):
+        """Wrap a function."""
+        self.function = function
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        """Count a call, then make it."""
+        self.calls += 1
+        return self.function(*args, **kwargs)
+
+
+def main():
+    """Fetch each asset repeatedly, reporting throughput and cache usage."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500,
+                        help="requests for each asset")
+    parser.add_argument("--warm", action="store_true",
+                        help="warm the cache before starting")
+    args = parser.parse_args()
+
+    # count the filesystem calls made by the cache
+    stat_calls = CallCounter(cache_module.stat)
+    open_calls = CallCounter(open)
+    cache_module.stat = stat_calls
+    cache_module.open = open_calls
+
+    cache = RequestHandler.static_files
+    if args.warm:
+        cache.warm()
+
+    results = []
+    with quiet():
+        server = start_server(mode="event-loop")
+        for uri in ASSETS:
+            raw_request = build_request(
+                "GET", uri, headers={"Connection": "keep-alive"})
+            before = (stat_calls.calls, open_calls.calls)
+            latencies = []
+            client = None
+            start = perf_counter()
+            for _ in range(args.requests):
+                if client is None:
+                    client = create_connection(("localhost", server.port))
+                    reader = client.makefile("rb")
+                request_start = perf_counter()
+                client.sendall(raw_request)
+                _, headers, _ = read_response(reader)
+                latencies.append(perf_counter() - request_start)
+
+                # reconnect once the server limits the connection
+                if headers.get("connection") == "close":
+                    client.close()
+                    client = None
+            if client is not None:
+                client.close()
+            result = summarise(latencies, perf_counter() - start)
+            result.update(uri=uri,
+                          stat_calls=stat_calls.calls - before[0],
+                          open_calls=open_calls.calls - before[1])
+            results.append(result)
+
+    print_table(results, ["uri", "requests", "requests_per_sec", "p50_ms",
+                          "p99_ms", "stat_calls", "open_calls"])
+    print("Cache: {}".format(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""Load-test and regression benchmark suite for the server.
+
+Runs a set of load scenarios against a WebServer in its own process, serving
+a generated fleet of blinds with fake controllers: static GETs, discovery,
+status and directive calls and a weighted mix of them, over keep-alive and
+new connections, and alongside slow clients which trickle their requests.
+Each scenario gets a fresh server, and reports throughput, latency
+percentiles and the server's resident memory. Micro-benchmarks then time
+HTTPRequest parsing, HTTPResponse.create_http_response and the smart-home
+handler's lookups in this process.
+
+The results are written as JSON with --output. Given a --baseline written
+by an earlier run, every result is compared with it, and any which is worse
+by more than --tolerance is flagged as a regression, making the exit status
+1.
+
+Usage: python benchmarks/suite.py [--mode MODE] [--clients N]
+           [--slow-clients N] [--duration S] [--scenario NAME]
+           [--micro-iterations N] [--output FILE] [--baseline FILE]
+           [--tolerance F] [--port PORT]
+"""
+from argparse import ArgumentParser, SUPPRESS
+from json import dump, dumps, load
+from os import cpu_count, devnull, path
+from platform import platform, python_version
+from random import Random
+from signal import SIGTERM, signal
+from socket import create_connection
+from subprocess import Popen, STDOUT
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+import sys
+from bench_utils import (WebServer, build_request, percentile, print_table,
+                         provision_fleet, read_response)
+from request_parsing import ALEXA_DIRECTIVE, CHROME_GET
+from response_serialization import make_response
+from HTTPTools.DeviceControllerPool import DeviceControllerPool
+from HTTPTools.DeviceRegistry import DeviceRegistry
+from HTTPTools.DeviceStateStore import DeviceStateStore
+from HTTPTools.HTTPRequest import HTTPRequest
+from HTTPTools.RequestHandler import RequestHandler
+
+PORT = 8098  # default port of the server under test
+FLEET_SIZE = 50
+SLOW_BYTE_INTERVAL = 0.01  # seconds between each byte a slow client sends
+
+# scenario name: (weights of each request type, keep-alive)
+SCENARIOS = {
+    "static": ({"static": 1}, False),
+    "static_keep_alive": ({"static": 1}, True),
+    "discovery_keep_alive": ({"discovery": 1}, True),
+    "status_keep_alive": ({"status": 1}, True),
+    "directive_keep_alive": ({"directive": 1}, True),
+    "mixed": ({"static": 50, "discovery": 5, "status": 35,
+               "directive": 10}, False),
+    "mixed_keep_alive": ({"static": 50, "discovery": 5, "status": 35,
+                          "directive": 10}, True),
+}
+SLOW_SCENARIO = "mixed_keep_alive"  # also run alongside slow clients
+
+# result fields compared against a baseline, and whether higher is better
+COMPARED_FIELDS = {
+    "requests_per_sec": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_kb": False,
+    "calls_per_sec": True,
+}
+
+
+def directive(endpoint_id, value):
+    """Build a directive setting the position of a blind."""
+    return {"directive": {
+        "header": {"namespace": "Alexa.RangeController",
+                   "name": "SetRangeValue", "instance": "Blind.Position"},
+        "endpoint": {"endpointId": endpoint_id},
+        "payload": {"rangeValue": value}
+    }}
+
+
+def build_requests(keep_alive):
+    """Build a set of raw requests of each type.
+
+    Args:
+        keep_alive (bool): Whether the requests ask for keep-alive.
+
+    Returns:
+        dict: A list of raw requests (byte string) by request type.
+    """
+    headers = {"Connection": "keep-alive" if keep_alive else "close"}
+    endpoint_ids = ["bench_device_{}".format(number)
+                    for number in range(FLEET_SIZE)]
+    return {
+        "static": [build_request("GET", "/index.html", headers=headers)],
+        "discovery": [build_request("GET", "/smarthome/discover",
+                                    headers=headers)],
+        "status": [build_request("POST", "/smarthome/status",
+                                 endpoint_id.encode("utf-8"), headers)
+                   for endpoint_id in endpoint_ids],
+        "directive": [build_request(
+            "POST", "/smarthome/directive",
+            dumps(directive(endpoint_id, number % 100)).encode("utf-8"),
+            headers) for number, endpoint_id in enumerate(endpoint_ids)]
+    }
+
+
+def serve(port, mode):
+    """Serve a generated fleet until terminated, as the server process."""
+    handler = RequestHandler.smart_device_handler
+    handler.device_controllers = DeviceControllerPool(
+        controller_factory=DeviceControllerPool.FakeController)
+    with TemporaryDirectory() as directory:
+        handler.device_registry = DeviceRegistry(
+            provision_fleet(FLEET_SIZE, directory))
+        handler.device_state_store = DeviceStateStore(directory)
+        server = WebServer(port, mode, 128)
+        signal(SIGTERM, lambda signum, frame: server.shutdown())
+        server.serve_forever()
+
+
+def start_server(port, mode):
+    """Start the server in its own process, waiting until it accepts.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    command = [sys.executable, path.abspath(__file__), "--serve",
+               "--port", str(port), "--mode", mode]
+    with open(devnull, "w") as output:
+        server = Popen(command, stdout=output, stderr=STDOUT)
+    for _ in range(100):
+        try:
+            create_connection(("localhost", port)).close()
+            return server
+        except OSError:
+            sleep(0.1)
+    server.kill()
+    raise Exception("Server did not start!")
+
+
+def read_memory(pid):
+    """Read the resident memory of a process, on Linux.
+
+    Returns:
+        tuple: The current and peak resident memory in kB (int), or Nones
+            if they cannot be read.
+    """
+    fields = {}
+    try:
+        with open("/proc/{}/status".format(pid), "r") as status:
+            for line in status:
+                field, _, value = line.partition(":")
+                fields[field] = value.split()[0] if value.split() else None
+    except OSError:
+        pass
+    return (int(fields["VmRSS"]) if fields.get("VmRSS") else None,
+            int(fields["VmHWM"]) if fields.get("VmHWM") else None)
+
+
+def run_client(port, requests, weights, deadline, seed, latencies,
+               errors):
+    """Send requests drawn from a mix until the deadline.
+
+    A connection is reused until the server closes it, so requests which
+    do not ask for keep-alive are each sent on a new connection.
+
+    Args:
+        port (int): The port of the server.
+        requests (dict): A list of raw requests by request type.
+        weights (dict): The weight of each request type in the mix.
+        deadline (float): The perf_counter() time to stop at.
+        seed (int): Seeds the choice of requests.
+        latencies (list(float)): Appended the latency of each request.
+        errors (list(int)): Appended 1 for each failed request.
+    """
+    random = Random(seed)
+    types = list(weights)
+    type_weights = [weights[request_type] for request_type in types]
+    client = None
+    while perf_counter() < deadline:
+        raw_request = random.choice(
+            requests[random.choices(types, type_weights)[0]])
+        start = perf_counter()
+        try:
+            if client is None:
+                client = create_connection(("localhost", port))
+                reader = client.makefile("rb")
+            client.sendall(raw_request)
+            status_code, headers, _ = read_response(reader)
+            if headers.get("connection") != "keep-alive":
+                client.close()
+                client = None
+        except OSError:
+            errors.append(1)
+            if client is not None:
+                client.close()
+                client = None
+            continue
+        if status_code != 200:
+            errors.append(1)
+            continue
+        latencies.append(perf_counter() - start)
+    if client is not None:
+        client.close()
+
+
+def run_slow_client(port, raw_request, deadline, completed):
+    """Trickle requests to the server one byte at a time until the deadline.
+
+    Args:
+        port (int): The port of the server.
+        raw_request (byte string): The raw request to send.
+        deadline (float): The perf_counter() time to stop at.
+        completed (list(int)): Appended 1 for each response received.
+    """
+    while perf_counter() < deadline:
+        try:
+            with create_connection(("localhost", port)) as client:
+                for index in range(len(raw_request)):
+                    client.sendall(raw_request[index:index + 1])
+                    sleep(SLOW_BYTE_INTERVAL)
+                read_response(client.makefile("rb"))
+                completed.append(1)
+        except OSError:
+            sleep(SLOW_BYTE_INTERVAL)
+
+
+def run_scenario(port, mode, weights, keep_alive, clients, slow_clients,
+                 duration):
+    """Run one load scenario against a fresh server.
+
+    Returns:
+        dict: The throughput, latency percentiles in milliseconds, errors,
+            slow client responses and server memory in kB.
+    """
+    requests = build_requests(keep_alive)
+    latencies = []
+    errors = []
+    slow_completed = []
+    server = start_server(port, mode)
+    try:
+        deadline = perf_counter() + duration
+        threads = [Thread(target=run_client,
+                          args=(port, requests, weights, deadline, seed,
+                                latencies, errors))
+                   for seed in range(clients)]
+        threads += [Thread(target=run_slow_client,
+                           args=(port, requests["static"][0], deadline,
+                                 slow_completed))
+                    for _ in range(slow_clients)]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads[:clients]:
+            thread.join()
+        elapsed = perf_counter() - start
+        rss_kb, peak_rss_kb = read_memory(server.pid)
+        for thread in threads[clients:]:
+            thread.join()
+    finally:
+        server.send_signal(SIGTERM)
+        server.wait()
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "slow_responses": len(slow_completed),
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": percentile(latencies, 1.0) * 1000,
+        "rss_kb": rss_kb,
+        "peak_rss_kb": peak_rss_kb
+    }
+
+
+def time_calls(function, iterations):
+    """Time calling a function repeatedly.
+
+    Returns:
+        float: Calls per second.
+    """
+    start = perf_counter()
+    for _ in range(iterations):
+        function()
+    return iterations / (perf_counter() - start)
+
+
+def run_micro_benchmarks(iterations):
+    """Time the server's hot functions in this process.
+
+    Returns:
+        dict: Calls per second of each micro-benchmark, by name.
+    """
+    response = make_response(b"x" * 4096)
+    handler = RequestHandler.smart_device_handler
+    with TemporaryDirectory() as directory:
+        registry = DeviceRegistry(provision_fleet(FLEET_SIZE, directory))
+        handler.device_registry = registry
+        handler.device_state_store = DeviceStateStore(directory)
+        endpoint_id = "bench_device_{}".format(FLEET_SIZE - 1)
+        status = HTTPRequest(build_request(
+            "POST", "/smarthome/status", endpoint_id.encode("utf-8")))
+        discovery = HTTPRequest(build_request("GET", "/smarthome/discover"))
+        assert handler.handle_request(status).status_code == 200
+        benchmarks = {
+            "http_request_parse": lambda: HTTPRequest(CHROME_GET),
+            "http_request_parse_directive":
+                lambda: HTTPRequest(ALEXA_DIRECTIVE),
+            "create_http_response": response.create_http_response,
+            "registry_find_endpoint":
+                lambda: registry.find_endpoint(endpoint_id),
+            "registry_find_capability": lambda: registry.find_capability(
+                endpoint_id, "Alexa.RangeController", "Blind.Position"),
+            "handler_status": lambda: handler.handle_request(status),
+            "handler_discovery": lambda: handler.handle_request(discovery)
+        }
+        return {name: {"calls_per_sec": time_calls(function, iterations)}
+                for name, function in benchmarks.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Compare results with a baseline, flagging regressions.
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of an earlier run.
+        tolerance (float): The fraction a result may be worse by before it
+            is flagged.
+
+    Returns:
+        list(dict): A row for every result compared, with "regression"
+            set to "REGRESSION" if it is worse than the tolerance allows.
+    """
+    rows = []
+    for section in ("load", "micro"):
+        for name, result in results[section].items():
+            previous = baseline.get(section, {}).get(name, {})
+            for field, higher_is_better in COMPARED_FIELDS.items():
+                if not result.get(field) or not previous.get(field):
+                    continue
+                change = result[field] / previous[field] - 1
+                worse = -change if higher_is_better else change
+                rows.append({
+                    "benchmark": "{}/{}".format(section, name),
+                    "field": field,
+                    "baseline": float(previous[field]),
+                    "current": float(result[field]),
+                    "change": "{:+.1%}".format(change),
+                    "regression": "REGRESSION" if worse > tolerance else ""
+                })
+    return rows
+
+
+def main():
+    """Run the suite, then record and compare the results."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=WebServer.SERVING_MODES,
+                        default="threaded")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="concurrent client threads")
+    parser.add_argument("--slow-clients", type=int, default=4,
+                        help="slow clients alongside the slow scenario")
+    parser.add_argument("--duration", type=float, default=3.0,
+                        help="seconds each scenario runs for")
+    parser.add_argument("--scenario", action="append",
+                        choices=list(SCENARIOS) + ["slow_clients"],
+                        help="run only this scenario, may be repeated")
+    parser.add_argument("--micro-iterations", type=int, default=20000,
+                        help="calls timed by each micro-benchmark, 0 to "
+                             "skip them")
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline",
+                        help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="fraction a result may be worse than the "
+                             "baseline before it is a regression")
+    parser.add_argument("--serve", action="store_true", help=SUPPRESS)
+    parser.add_argument("--port", type=int, default=PORT,
+                        help="port the server under test listens on")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.mode)
+        return
+
+    scenarios = [(name, weights, keep_alive, 0)
+                 for name, (weights, keep_alive) in SCENARIOS.items()]
+    weights, keep_alive = SCENARIOS[SLOW_SCENARIO]
+    scenarios.append(("slow_clients", weights, keep_alive,
+                      args.slow_clients))
+    if args.scenario:
+        scenarios = [scenario for scenario in scenarios
+                     if scenario[0] in args.scenario]
+
+    results = {
+        "environment": {"python": python_version(), "platform": platform(),
+                        "cpus": cpu_count(), "mode": args.mode,
+                        "clients": args.clients,
+                        "duration": args.duration},
+        "load": {},
+        "micro": {}
+    }
+    for name, weights, keep_alive, slow_clients in scenarios:
+        results["load"][name] = run_scenario(
+            args.port, args.mode, weights, keep_alive, args.clients,
+            slow_clients, args.duration)
+    if args.micro_iterations:
+        results["micro"] = run_micro_benchmarks(args.micro_iterations)
+
+    print_table([dict(result, scenario=name)
+                 for name, result in results["load"].items()],
+                ["scenario", "requests", "errors", "slow_responses",
+                 "requests_per_sec", "p50_ms", "p90_ms", "p99_ms", "max_ms",
+                 "peak_rss_kb"])
+    if results["micro"]:
+        print()
+        print_table([dict(result, benchmark=name)
+                     for name, result in results["micro"].items()],
+                    ["benchmark", "calls_per_sec"])
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            rows = compare(results, load(baseline_file), args.tolerance)
+        print()
+        print_table(rows, ["benchmark", "field", "baseline", "current",
+                           "change", "regression"])
+        regressions = sum(1 for row in rows if row["regression"])
+        print("{} regression(s) beyond {:.0%}".format(
+            regressions, args.tolerance))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
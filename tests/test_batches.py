@@ -0,0 +1,53 @@
+"""Tests that batched status and directive requests answer every item.
+
+Run from the repository root: python -m pytest tests
+"""
+from .utils import SmartHomeTestCase
+
+
+class BatchTest(SmartHomeTestCase):
+    """Send batches mixing valid and invalid items."""
+
+    def test_status_batch(self):
+        status_code, results = self.post(
+            "status_batch", ["smart_blind_01", "missing", 7])
+        self.assertEqual(status_code, 200)
+        self.assertEqual([result["status"] for result in results],
+                         [200, 404, 404])
+        self.assertEqual(results[0]["result"]["properties"][0]["value"], 50)
+
+    def test_directive_batch_in_order(self):
+        status_code, results = self.post("directive_batch", [
+            self.directive("SetRangeValue", {"rangeValue": 10}),
+            self.directive("AdjustRangeValue", {"rangeValueDelta": 5}),
+            self.directive("AdjustRangeValue", {"rangeValueDelta": 5})
+        ])
+        self.assertEqual(status_code, 200)
+        self.assertEqual([result["status"] for result in results],
+                         [200, 200, 200])
+        self.assertEqual(self.position(), 20)
+
+    def test_bad_items_fail_alone(self):
+        status_code, results = self.post("directive_batch", [
+            self.directive("SetRangeValue", {"rangeValue": 30}),
+            self.directive("SetRangeValue", {"rangeValue": 500}),
+            self.directive("SetRangeValue", {"rangeValue": 1}, "missing"),
+            "not a directive",
+            self.directive("SetRangeValue", {"rangeValue": 1},
+                           instance="Blind.Tilt")
+        ])
+        self.assertEqual(status_code, 200)
+        self.assertEqual([(result["endpointId"], result["status"])
+                          for result in results],
+                         [("smart_blind_01", 200), ("smart_blind_01", 422),
+                          ("missing", 404), (None, 400),
+                          ("smart_blind_01", 400)])
+        self.assertEqual(self.position(), 30)
+
+    def test_malformed_batches(self):
+        for command in ("status_batch", "directive_batch"):
+            with self.subTest(command=command):
+                self.assertEqual(self.post(command, {"not": "a list"})[0],
+                                 400)
+                response = self.request("POST", command, b"[")
+                self.assertEqual(response.status_code, 400)
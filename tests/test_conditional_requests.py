@@ -0,0 +1,77 @@
+"""Tests that conditional requests are answered without reading files.
+
+Run from the repository root: python -m pytest tests
+"""
+from .utils import StaticFilesTestCase
+
+
+class ConditionalRequestTest(StaticFilesTestCase):
+    """Revalidate copies of files against a cold cache."""
+
+    def validators(self, uri, headers=None):
+        """Find the validators sent with a file, then clear the cache.
+
+        Returns:
+            dict: The response's header fields.
+        """
+        response, _ = self.respond("GET", uri, headers)
+        self.clear_cache()
+        return response.headers
+
+    def test_if_none_match_reads_nothing(self):
+        etag = self.validators("/frog.png")["ETag"]
+        response, reads = self.respond("GET", "/frog.png",
+                                       {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(reads, 0)
+
+    def test_if_modified_since_reads_nothing(self):
+        last_modified = self.validators("/frog.png")["Last-Modified"]
+        response, reads = self.respond("GET", "/frog.png",
+                                       {"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(reads, 0)
+
+    def test_compressed_etag_reads_nothing(self):
+        headers = {"Accept-Encoding": "gzip"}
+        validators = self.validators("/index.html", headers)
+        headers["If-None-Match"] = validators["ETag"]
+        response, reads = self.respond("GET", "/index.html", headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], validators["ETag"])
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(reads, 0)
+
+    def test_stale_etag_reads_file(self):
+        response, reads = self.respond("GET", "/frog.png",
+                                       {"If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.content),
+                         int(response.headers["Content-Length"]))
+        self.assertEqual(reads, 1)
+
+    def test_etag_lists_and_weak_tags(self):
+        etag = self.validators("/frog.png")["ETag"]
+        for if_none_match in ('"stale", ' + etag, "W/" + etag, "*"):
+            with self.subTest(if_none_match=if_none_match):
+                response, _ = self.respond("GET", "/frog.png",
+                                           {"If-None-Match": if_none_match})
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.content)
+
+    def test_if_none_match_overrides_if_modified_since(self):
+        last_modified = self.validators("/frog.png")["Last-Modified"]
+        response, _ = self.respond("GET", "/frog.png",
+                                   {"If-None-Match": '"stale"',
+                                    "If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 200)
+
+    def test_old_or_invalid_dates_send_file(self):
+        for if_modified_since in ("Thu, 01 Jan 1970 00:00:00 GMT",
+                                  "yesterday"):
+            with self.subTest(if_modified_since=if_modified_since):
+                response, _ = self.respond(
+                    "GET", "/frog.png",
+                    {"If-Modified-Since": if_modified_since})
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,100 @@
+"""Tests that controller commands run in order, per device, latest first.
+
+Run from the repository root: python -m pytest tests
+"""
+from threading import Event
+from time import sleep
+from unittest import TestCase
+from HTTPTools.DeviceControllerPool import DeviceControllerPool
+
+SPEC = {"eval": "Blind({})", "params": {}, "setter": "set_percentage({})"}
+
+
+class BlockingController:
+    """Controller whose setter waits until it is released."""
+
+    def __init__(self):
+        """Initialise a BlockingController, held until released."""
+        self.values = []
+        self.started = Event()
+        self.released = Event()
+
+    def set_percentage(self, value):
+        """Record a value, once released."""
+        self.started.set()
+        self.released.wait(5)
+        if value < 0:
+            raise ValueError("negative percentage")
+        self.values.append(value)
+
+
+class DeviceControllerPoolTest(TestCase):
+    """Submit commands to a pool of blocking controllers."""
+
+    def setUp(self):
+        """Make a pool constructing blocking controllers."""
+        self.controllers = []
+        self.pool = DeviceControllerPool(workers=2,
+                                         controller_factory=self.build)
+
+    def build(self, spec):
+        """Construct a controller, recording it.
+
+        Returns:
+            BlockingController: The controller.
+        """
+        controller = BlockingController()
+        self.controllers.append(controller)
+        return controller
+
+    def wait_for_controller(self, number):
+        """Wait until a controller has been constructed.
+
+        Returns:
+            BlockingController: The controller.
+        """
+        for _ in range(500):
+            if len(self.controllers) > number:
+                return self.controllers[number]
+            sleep(0.01)
+        self.fail("controller {} never constructed".format(number))
+
+    def test_latest_setpoint_replaces_queued_ones(self):
+        self.pool.submit("blind", "position", SPEC, 1)
+        self.assertTrue(self.wait_for_controller(0).started.wait(5))
+        for value in (2, 3, 4):
+            self.pool.submit("blind", "position", SPEC, value)
+        self.controllers[0].released.set()
+        self.pool.wait()
+        self.assertEqual(self.controllers[0].values, [1, 4])
+        self.assertEqual(len(self.controllers), 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats["submitted"], stats["coalesced"],
+                          stats["executed"]), (4, 2, 2))
+
+    def test_devices_run_concurrently(self):
+        self.pool.submit("slow blind", "position", SPEC, 1)
+        self.assertTrue(self.wait_for_controller(0).started.wait(5))
+        self.pool.submit("blind", "position", SPEC, 2)
+        fast = self.wait_for_controller(1)
+        fast.released.set()
+        self.assertTrue(fast.started.wait(5))
+        self.controllers[0].released.set()
+        self.pool.wait()
+        self.assertEqual(fast.values, [2])
+
+    def test_controller_rebuilt_when_spec_changes(self):
+        self.pool.submit("blind", "position", SPEC, 1)
+        self.wait_for_controller(0).released.set()
+        self.pool.wait()
+        self.pool.submit("blind", "position", dict(SPEC, params={"a": 1}), 2)
+        self.wait_for_controller(1).released.set()
+        self.pool.wait()
+        self.assertEqual([controller.values for controller
+                          in self.controllers], [[1], [2]])
+
+    def test_failed_command_counted(self):
+        self.pool.submit("blind", "position", SPEC, -1)
+        self.wait_for_controller(0).released.set()
+        self.pool.wait()
+        self.assertEqual(self.pool.stats()["failed"], 1)
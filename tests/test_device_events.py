@@ -0,0 +1,158 @@
+"""Tests that device changes are fanned out to streams and long polls.
+
+Run from the repository root: python -m pytest tests
+"""
+from json import loads
+from threading import Timer
+from unittest import TestCase
+from HTTPTools.DeviceEventHub import DeviceEventHub
+from HTTPTools.HTTPResponse import HTTPResponse
+from .utils import SmartHomeTestCase
+
+POSITION = [{"name": "rangeValue", "instance": "Blind.Position",
+             "value": 10}]
+
+
+class DeviceEventHubTest(TestCase):
+    """Publish changes to a hub, and read them back."""
+
+    def setUp(self):
+        """Make a hub which keeps four changes."""
+        self.hub = DeviceEventHub(history_size=4, heartbeat_interval=0.05)
+
+    def test_wait_returns_changes_after_last_seen(self):
+        for endpoint_id in ("a", "b", "a"):
+            self.hub.publish(endpoint_id, POSITION)
+        events, last_id = self.hub.wait(1)
+        self.assertEqual([event.id for event in events], [2, 3])
+        self.assertEqual(last_id, 3)
+        events, last_id = self.hub.wait(0, {"b"})
+        self.assertEqual([event.endpoint_id for event in events], ["b"])
+        self.assertEqual(last_id, 3)
+
+    def test_wait_times_out(self):
+        self.hub.publish("a", POSITION)
+        self.assertEqual(self.hub.wait(1, timeout=0.01), ([], 1))
+        # changes to other devices are seen, but not returned
+        self.hub.publish("b", POSITION)
+        self.assertEqual(self.hub.wait(1, {"a"}, timeout=0.01), ([], 2))
+
+    def test_wait_is_woken_by_publish(self):
+        timer = Timer(0.05, self.hub.publish, ("a", POSITION))
+        timer.start()
+        events, last_id = self.hub.wait(0, timeout=5)
+        timer.join()
+        self.assertEqual(last_id, 1)
+        self.assertEqual(events[0].data,
+                         {"endpointId": "a", "properties": POSITION})
+
+    def test_resume_id(self):
+        for _ in range(6):
+            self.hub.publish("a", POSITION)
+        self.assertEqual(self.hub.resume_id(), 6)
+        self.assertEqual(self.hub.resume_id(4), 4)
+        self.assertEqual(self.hub.resume_id(-1), 6)
+        self.assertEqual(self.hub.resume_id(7), 6)
+        # only the changes kept are caught up on
+        events, _ = self.hub.wait(0)
+        self.assertEqual([event.id for event in events], [3, 4, 5, 6])
+
+    def test_receive_renumbers_history(self):
+        self.hub.publish("a", POSITION)
+        self.hub.receive(5, {"endpointId": "b", "properties": POSITION})
+        self.assertEqual(self.hub.last_id, 5)
+        events, _ = self.hub.wait(0)
+        self.assertEqual([event.id for event in events], [5])
+
+    def test_relay_numbers_nothing(self):
+        relayed = []
+        self.hub.relay = relayed.append
+        self.assertIsNone(self.hub.publish("a", POSITION))
+        self.assertEqual(self.hub.last_id, 0)
+        self.assertEqual(relayed,
+                         [{"endpointId": "a", "properties": POSITION}])
+
+    def test_subscribe_streams_frames(self):
+        self.hub.publish("a", POSITION)
+        self.hub.publish("b", POSITION)
+        stream = self.hub.subscribe(0, {"b"})
+        self.assertEqual(next(stream), b"retry: 1000\n\n")
+        frame = next(stream)
+        self.assertTrue(frame.startswith(b"id: 2\nevent: change\ndata: "))
+        self.assertTrue(frame.endswith(b"\n\n"))
+        self.assertEqual(next(stream), b": keep-alive\n\n")
+        stream.close()
+
+    def test_subscribers_are_limited(self):
+        self.hub.MAX_SUBSCRIBERS = 2
+        self.assertTrue(self.hub.try_subscribe())
+        self.assertTrue(self.hub.try_subscribe())
+        self.assertFalse(self.hub.try_subscribe())
+        self.hub.release()
+        self.assertTrue(self.hub.try_subscribe())
+
+
+class DeviceEventEndpointTest(SmartHomeTestCase):
+    """Follow the blind's changes through the subscribe and poll commands."""
+
+    def poll(self, query):
+        """Long poll for changes, reading the whole response.
+
+        Returns:
+            tuple: The response's status code (int), and its parsed body, or
+                None if it is not JSON.
+        """
+        response = self.request("GET", "poll?" + query)
+        if not isinstance(response.content, HTTPResponse.StreamContent):
+            return response.status_code, None
+        try:
+            body = b"".join(response.content.chunks)
+        finally:
+            response.content.close()
+        return response.status_code, loads(body)
+
+    def test_poll_returns_directive_changes(self):
+        self.post("directive", self.directive("SetRangeValue",
+                                              {"rangeValue": 20}))
+        status_code, body = self.poll("after=0&timeout=0")
+        self.assertEqual(status_code, 200)
+        self.assertEqual(body["lastEventId"], 1)
+        self.assertEqual(body["events"][0]["id"], 1)
+        self.assertEqual(body["events"][0]["endpointId"], "smart_blind_01")
+        self.assertEqual(body["events"][0]["properties"][0]["value"], 20)
+        self.assertEqual(self.handler.device_events.subscribers, 0)
+
+    def test_poll_filters_endpoints(self):
+        self.post("directive", self.directive("SetRangeValue",
+                                              {"rangeValue": 20}))
+        self.assertEqual(self.poll("after=0&timeout=0&endpoints=other"),
+                         (200, {"lastEventId": 1, "events": []}))
+
+    def test_poll_rejects_bad_query(self):
+        self.assertEqual(self.poll("timeout=soon"), (400, None))
+        self.assertEqual(self.handler.device_events.subscribers, 0)
+
+    def test_subscribe_resumes_from_last_event_id(self):
+        for value in (20, 30):
+            self.post("directive", self.directive("SetRangeValue",
+                                                  {"rangeValue": value}))
+        response = self.request("GET", "subscribe",
+                                headers={"Last-Event-ID": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.handler.device_events.subscribers, 1)
+        chunks = iter(response.content.chunks)
+        next(chunks)
+        self.assertTrue(next(chunks).startswith(b"id: 2\n"))
+        response.content.close()
+        self.assertEqual(self.handler.device_events.subscribers, 0)
+
+    def test_full_hub_is_refused(self):
+        self.handler.device_events.MAX_SUBSCRIBERS = 1
+        stream = self.request("GET", "subscribe")
+        for command in ("subscribe", "poll?timeout=0"):
+            with self.subTest(command=command):
+                response = self.request("GET", command)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.headers["Retry-After"], "1")
+        stream.content.close()
+        self.assertEqual(self.poll("timeout=0")[0], 200)
@@ -0,0 +1,158 @@
+"""Tests that devices are stamped from a template, checked and registered.
+
+Run from the repository root: python -m pytest tests
+"""
+from json import loads
+from os import listdir, path
+from shutil import copy, rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from HTTPTools.DeviceProvisioner import DeviceProvisioner
+
+
+def blind(number, **parameters):
+    """Make the parameters of a valid blind.
+
+    Returns:
+        dict: The parameters, with any given ones overriding the defaults.
+    """
+    row = {
+        "endpointId": "smart_blind_{:02}".format(number),
+        "friendlyName": "Blind {}".format(number),
+        "mac_address": "24:62:AB:BA:0C:{:02X}".format(number),
+        "characteristic": "fd5db22e-cb57-11ea-87d0-0242ac130003",
+        "max_angle": "360"
+    }
+    row.update(parameters)
+    return row
+
+
+class DeviceProvisionerTest(TestCase):
+    """Provision blinds into a copy of the devices file."""
+
+    def setUp(self):
+        """Copy the devices file, and load the blind template."""
+        self.directory = mkdtemp()
+        copy(path.join("Smart_Devices", "Smart_Devices.json"),
+             self.directory)
+        self.devices_file = path.join(self.directory, "Smart_Devices.json")
+        self.provisioner = DeviceProvisioner()
+
+    def tearDown(self):
+        """Remove the copied files."""
+        rmtree(self.directory)
+
+    def provision(self, rows, **options):
+        """Provision devices into the copied devices file.
+
+        Returns:
+            dict: The number of devices added and replaced.
+        """
+        return self.provisioner.provision(rows, self.devices_file,
+                                          self.directory, **options)
+
+    def endpoint_ids(self):
+        """List the devices in the copied devices file.
+
+        Returns:
+            list(string): Their endpointIds, in order.
+        """
+        with open(self.devices_file, "r") as input_file:
+            return [endpoint["endpointId"] for endpoint
+                    in loads(input_file.read())["endpoints"]]
+
+    def assert_problems(self, rows, *problems, **options):
+        """Check that provisioning fails, writing nothing."""
+        before = sorted(listdir(self.directory))
+        with self.assertRaises(DeviceProvisioner.ProvisioningError) as \
+                context:
+            self.provision(rows, **options)
+        self.assertEqual(context.exception.problems, list(problems))
+        self.assertEqual(sorted(listdir(self.directory)), before)
+        self.assertEqual(self.endpoint_ids(), ["smart_blind_01"])
+
+    def test_stamp(self):
+        device = self.provisioner.stamp(blind(2, description=""))
+        self.assertEqual(device["endpoint"]["friendlyName"], "Blind 2")
+        self.assertEqual(device["endpoint"]["description"],
+                         "A custom smart blind.")
+        params = device["properties"][0]["controller"]["params"]
+        self.assertEqual(params["max_angle"], 360)
+        self.assertEqual(params["mac_address"], "24:62:AB:BA:0C:02")
+        self.assertEqual(self.provisioner.validate(device), [])
+
+    def test_stamp_rejects_parameters(self):
+        for row, problem in ((blind(2, colour="red"),
+                              "unknown parameter: colour"),
+                             (blind(2, max_angle="wide"),
+                              "invalid max_angle: wide")):
+            with self.subTest(problem=problem):
+                with self.assertRaises(
+                        DeviceProvisioner.ProvisioningError) as context:
+                    self.provisioner.stamp(row)
+                self.assertEqual(context.exception.problems, [problem])
+
+    def test_validate(self):
+        device = self.provisioner.stamp(blind(2, endpointId="../blind",
+                                              mac_address="24:62"))
+        del device["properties"][0]["controller"]["params"]["characteristic"]
+        device["properties"][0]["value"]["current"] = 101
+        self.assertEqual(self.provisioner.validate(device), [
+            "endpointId must be a plain file name",
+            "property Blind.Position is out of range",
+            "invalid mac_address: 24:62"])
+        self.assertEqual(self.provisioner.validate(
+            self.provisioner.stamp({})), [
+            "device.endpoint.endpointId is not set",
+            "device.endpoint.friendlyName is not set",
+            "device.properties.0.controller.params.mac_address is not set",
+            "device.properties.0.controller.params.characteristic is not "
+            "set",
+            "invalid mac_address: INVALID"])
+
+    def test_provision(self):
+        self.assertEqual(self.provision([blind(2), blind(3)]),
+                         {"added": 2, "replaced": 0})
+        self.assertEqual(self.endpoint_ids(),
+                         ["smart_blind_01", "smart_blind_02",
+                          "smart_blind_03"])
+        with open(path.join(self.directory, "smart_blind_03.json"), "r") \
+                as input_file:
+            properties = loads(input_file.read())["properties"]
+        self.assertEqual(properties[0]["controller"]["params"]["mac_address"],
+                         "24:62:AB:BA:0C:03")
+
+    def test_replace(self):
+        self.assertEqual(self.provision([blind(1)], replace=True),
+                         {"added": 0, "replaced": 1})
+        self.assertEqual(self.endpoint_ids(), ["smart_blind_01"])
+        self.assertTrue(path.exists(path.join(self.directory,
+                                              "smart_blind_01.json")))
+
+    def test_dry_run_writes_nothing(self):
+        self.assertEqual(self.provision([blind(2)], dry_run=True),
+                         {"added": 1, "replaced": 0})
+        self.assertEqual(listdir(self.directory), ["Smart_Devices.json"])
+        self.assertEqual(self.endpoint_ids(), ["smart_blind_01"])
+
+    def test_invalid_rows_write_nothing(self):
+        self.assert_problems(
+            [blind(2), blind(2), blind(1),
+             blind(3, endpointId="Smart_Devices"), blind(4, colour="red")],
+            "row 2 (smart_blind_02): duplicate endpointId",
+            "row 3 (smart_blind_01): endpointId already registered",
+            "row 4 (Smart_Devices): endpointId names the devices file",
+            "row 5: unknown parameter: colour")
+
+    def test_read_parameters(self):
+        csv_file = path.join(self.directory, "blinds.csv")
+        with open(csv_file, "w") as output_file:
+            output_file.write("endpointId,max_angle\nsmart_blind_02,90\n")
+        json_file = path.join(self.directory, "blinds.jsonl")
+        with open(json_file, "w") as output_file:
+            output_file.write('{"endpointId": "smart_blind_02"}\n\n')
+        self.assertEqual(DeviceProvisioner.read_parameters(csv_file),
+                         [{"endpointId": "smart_blind_02",
+                           "max_angle": "90"}])
+        self.assertEqual(DeviceProvisioner.read_parameters(json_file),
+                         [{"endpointId": "smart_blind_02"}])
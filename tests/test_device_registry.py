@@ -0,0 +1,81 @@
+"""Tests that the device registry indexes, reloads and serialises devices.
+
+Run from the repository root: python -m pytest tests
+"""
+from json import dumps, loads
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from HTTPTools.DeviceRegistry import DeviceRegistry
+
+
+class DeviceRegistryTest(TestCase):
+    """Reload a copy of the devices file, checked on every lookup."""
+
+    def setUp(self):
+        """Copy the devices file, and make a registry of the copy."""
+        with open("Smart_Devices/Smart_Devices.json", "r") as input_file:
+            self.devices = loads(input_file.read())
+        self.directory = mkdtemp()
+        self.devices_file = path.join(self.directory, "Smart_Devices.json")
+        self.registry = DeviceRegistry(self.devices_file, check_interval=0)
+
+    def tearDown(self):
+        """Remove the copy of the devices file."""
+        rmtree(self.directory)
+
+    def rename(self, friendly_name):
+        """Change the first endpoint's name, changing the file's size."""
+        self.devices["endpoints"][0]["friendlyName"] = friendly_name
+        with open(self.devices_file, "w") as output_file:
+            output_file.write(dumps(self.devices))
+
+    def test_lookups(self):
+        self.rename("blind")
+        self.assertIsNone(self.registry.find_endpoint("missing"))
+        capability = self.registry.find_capability(
+            "smart_blind_01", "Alexa.RangeController", "Blind.Position")
+        self.assertEqual(capability["instance"], "Blind.Position")
+        self.assertIsNone(self.registry.find_capability(
+            "smart_blind_01", "Alexa.RangeController", "Blind.Tilt"))
+        self.assertTrue(self.registry.has_interface(
+            "smart_blind_01", "Alexa.RangeController"))
+        self.assertFalse(self.registry.has_interface(
+            "smart_blind_01", "Alexa.PowerController"))
+
+    def test_lookups_do_not_reload_unchanged_file(self):
+        self.rename("blind")
+        index = self.registry.get_index()
+        for _ in range(3):
+            self.registry.find_endpoint("smart_blind_01")
+        self.assertIs(self.registry.get_index(), index)
+        self.assertEqual(self.registry.version, 1)
+
+    def test_reloads_changed_file(self):
+        self.rename("blind")
+        endpoint_id = self.devices["endpoints"][0]["endpointId"]
+        self.assertEqual(self.registry.find_endpoint(endpoint_id)
+                         ["friendlyName"], "blind")
+        version = self.registry.version
+        self.rename("kitchen blind")
+        self.assertEqual(self.registry.find_endpoint(endpoint_id)
+                         ["friendlyName"], "kitchen blind")
+        self.assertEqual(self.registry.version, version + 1)
+
+    def test_discovery_follows_reloads(self):
+        self.rename("blind")
+        payload, etag = self.registry.get_discovery()
+        self.rename("kitchen blind")
+        new_payload, new_etag = self.registry.get_discovery()
+        self.assertNotEqual(etag, new_etag)
+        self.assertEqual(loads(new_payload), self.devices)
+
+    def test_reloads_keep_one_previous_index(self):
+        self.rename("blind")
+        self.registry.get_discovery()
+        for number in range(5):
+            self.rename("blind " + "x" * number)
+            index = self.registry.get_index()
+        self.assertIsNotNone(index.previous.fragments)
+        self.assertIsNone(index.previous.previous)
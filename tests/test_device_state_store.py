@@ -0,0 +1,125 @@
+"""Tests that device state is read concurrently and persisted atomically.
+
+Run from the repository root: python -m pytest tests
+"""
+from json import loads
+from os import listdir, path
+from shutil import copy, rmtree
+from tempfile import mkdtemp
+from threading import Event, Thread
+from unittest import TestCase
+from HTTPTools.DeviceStateStore import DeviceStateStore
+
+
+def set_position(position):
+    """Make an update setting a blind's position.
+
+    Returns:
+        function: The update.
+    """
+    def update(state):
+        state["properties"][0]["value"]["current"] = position
+    return update
+
+
+class DeviceStateStoreTest(TestCase):
+    """Read and update a copy of the smart blind's state file."""
+
+    def setUp(self):
+        """Copy the devices and state files into a new directory."""
+        self.directory = mkdtemp()
+        for name in ("Smart_Devices.json", "smart_blind_01.json"):
+            copy(path.join("Smart_Devices", name), self.directory)
+        self.devices_file = path.join(self.directory, "Smart_Devices.json")
+        self.store = self.make_store()
+
+    def tearDown(self):
+        """Remove the copied files."""
+        rmtree(self.directory)
+
+    def make_store(self, shared=False):
+        """Make a store of the copied state files.
+
+        Returns:
+            DeviceStateStore: The store.
+        """
+        return DeviceStateStore(self.directory, shared,
+                                reserved_files=[self.devices_file])
+
+    def position(self, store=None):
+        """Find the blind's position, as read by a store."""
+        state = (store or self.store).get_state("smart_blind_01")
+        return state["properties"][0]["value"]["current"]
+
+    def test_update_is_persisted(self):
+        updated = self.store.update("smart_blind_01", set_position(20))
+        self.assertEqual(updated["properties"][0]["value"]["current"], 20)
+        self.assertEqual(self.position(), 20)
+        with open(path.join(self.directory, "smart_blind_01.json")) as file:
+            self.assertEqual(loads(file.read()), updated)
+        self.assertFalse([name for name in listdir(self.directory)
+                          if name.endswith(".tmp")])
+
+    def test_reads_are_copies(self):
+        state = self.store.get_state("smart_blind_01")
+        state["properties"][0]["value"]["current"] = 99
+        self.assertEqual(self.position(), 50)
+
+    def test_failed_update_changes_nothing(self):
+        def update(state):
+            state["properties"][0]["value"]["current"] = 10
+            raise ValueError("bad update")
+
+        with self.assertRaises(ValueError):
+            self.store.update("smart_blind_01", update)
+        self.assertEqual(self.position(), 50)
+        self.assertEqual(self.position(self.make_store()), 50)
+
+    def test_missing_and_invalid_devices(self):
+        self.assertIsNone(self.store.get_state("missing"))
+        self.assertIsNone(self.store.update("missing", set_position(1)))
+        for endpoint_id in ("../smart_blind_01", ".hidden", "",
+                            "Smart_Devices"):
+            with self.subTest(endpoint_id=endpoint_id):
+                with self.assertRaises(Exception):
+                    self.store.get_state(endpoint_id)
+
+    def test_reads_not_blocked_while_update_flushed(self):
+        flushing, finish = Event(), Event()
+        write_temporary = DeviceStateStore._write_temporary
+
+        def slow_write(file_path, data):
+            flushing.set()
+            finish.wait(5)
+            return write_temporary(file_path, data)
+
+        self.store._write_temporary = slow_write
+        updater = Thread(target=self.store.update,
+                         args=("smart_blind_01", set_position(20)))
+        updater.start()
+        self.assertTrue(flushing.wait(5))
+        self.assertEqual(self.position(), 50)
+        finish.set()
+        updater.join()
+        self.assertEqual(self.position(), 20)
+
+    def test_concurrent_updates_are_serialised(self):
+        def increment(state):
+            state["properties"][0]["value"]["current"] += 1
+
+        threads = [Thread(target=self.store.update,
+                          args=("smart_blind_01", increment))
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.position(), 70)
+
+    def test_shared_stores_see_each_others_updates(self):
+        first, second = self.make_store(True), self.make_store(True)
+        self.assertEqual(self.position(second), 50)
+        first.update("smart_blind_01", set_position(30))
+        self.assertEqual(self.position(second), 30)
+        second.update("smart_blind_01", set_position(40))
+        self.assertEqual(self.position(first), 40)
@@ -0,0 +1,124 @@
+"""Tests that directives are checked against the devices' capabilities.
+
+Run from the repository root: python -m pytest tests
+"""
+from unittest import TestCase
+from HTTPTools.DirectiveSchema import DirectiveSchema
+from .utils import SmartHomeTestCase
+
+BLIND = {
+    "type": "AlexaInterface",
+    "interface": "Alexa.RangeController",
+    "version": "3",
+    "instance": "Blind.Position",
+    "configuration": {
+        "supportedRange": {"minimumValue": 0, "maximumValue": 100,
+                           "precision": 5}
+    }
+}
+
+
+class DirectiveSchemaTest(TestCase):
+    """Validate payloads with a compiled RangeController validator."""
+
+    def setUp(self):
+        """Compile the validator of a blind moving in steps of five."""
+        self.validator = DirectiveSchema.compile(BLIND)
+
+    def check(self, name, payload):
+        """Validate a directive to the blind.
+
+        Returns:
+            int: The status code it is rejected with, or None if it is valid.
+        """
+        error = self.validator({"name": name}, payload)
+        return None if error is None else error[0]
+
+    def test_valid_directives(self):
+        self.assertIsNone(self.check("SetRangeValue", {"rangeValue": 35}))
+        self.assertIsNone(self.check("AdjustRangeValue",
+                                     {"rangeValueDelta": -100}))
+
+    def test_invalid_directives(self):
+        for status_code, name, payload in (
+                (422, "SetRangeValue", {"rangeValue": 101}),
+                (422, "SetRangeValue", {"rangeValue": 33}),
+                (422, "AdjustRangeValue", {"rangeValueDelta": 105}),
+                (422, "AdjustRangeValue", {"rangeValueDelta": 2.5}),
+                (422, "SetModeValue", {"rangeValue": 50}),
+                (400, "SetRangeValue", {"rangeValue": float("nan")}),
+                (400, "SetRangeValue", {"rangeValue": float("inf")}),
+                (400, "SetRangeValue", {"rangeValue": True}),
+                (400, "SetRangeValue", {"rangeValue": "50"}),
+                (400, "AdjustRangeValue", {})):
+            with self.subTest(name=name, payload=payload):
+                self.assertEqual(self.check(name, payload), status_code)
+
+    def test_interfaces_without_validators(self):
+        self.assertIsNone(DirectiveSchema.compile(
+            {"type": "AlexaInterface", "interface": "Alexa",
+             "version": "3"}))
+
+    def test_check_capability(self):
+        self.assertEqual(DirectiveSchema.check_capability(BLIND), [])
+        broken = dict(BLIND, version=3, configuration={"supportedRange": {
+            "minimumValue": 10, "maximumValue": 0, "precision": 0}})
+        self.assertEqual(DirectiveSchema.check_capability(broken), [
+            "capability has no version",
+            "supportedRange minimumValue exceeds maximumValue",
+            "supportedRange precision must be positive"])
+        self.assertEqual(DirectiveSchema.check_capability([]),
+                         ["capability must be an object"])
+
+    def test_check_structure(self):
+        directive = SmartHomeTestCase.directive(
+            "SetRangeValue", {"rangeValue": 10})["directive"]
+        self.assertIsNone(DirectiveSchema.check_structure(directive))
+        for broken in (None, dict(directive, header=[]),
+                       dict(directive, payload="10"),
+                       dict(directive, endpoint={"endpointId": 1})):
+            with self.subTest(broken=broken):
+                self.assertEqual(DirectiveSchema.check_structure(broken)[0],
+                                 400)
+
+
+class DirectiveRequestTest(SmartHomeTestCase):
+    """Post directives to the blind, which may not change its position."""
+
+    def assert_rejected(self, status_code, body):
+        """Check that a directive is rejected, leaving the blind still."""
+        self.assertEqual(self.post("directive", body)[0], status_code)
+        self.assertEqual(self.position(), 50)
+
+    def test_valid_directive(self):
+        self.assertEqual(self.post("directive", self.directive(
+            "SetRangeValue", {"rangeValue": 20})), (200, "Directive"))
+        self.assertEqual(self.position(), 20)
+
+    def test_out_of_range(self):
+        self.assert_rejected(422, self.directive(
+            "SetRangeValue", {"rangeValue": 150}))
+        self.assert_rejected(422, self.directive(
+            "AdjustRangeValue", {"rangeValueDelta": 0.5}))
+
+    def test_not_finite(self):
+        self.assert_rejected(400, self.directive(
+            "SetRangeValue", {"rangeValue": float("nan")}))
+        self.assert_rejected(400, self.directive(
+            "AdjustRangeValue", {"rangeValueDelta": float("-inf")}))
+
+    def test_malformed(self):
+        self.assert_rejected(400, [])
+        self.assert_rejected(400, {"directive": {"header": {}}})
+        self.assertEqual(self.request("POST", "directive", b"{").status_code,
+                         400)
+
+    def test_wrong_target(self):
+        self.assert_rejected(404, self.directive(
+            "SetRangeValue", {"rangeValue": 20}, endpoint_id="missing"))
+        self.assert_rejected(400, self.directive(
+            "SetRangeValue", {"rangeValue": 20}, instance="Blind.Tilt"))
+        wrong_interface = self.directive("SetRangeValue", {"rangeValue": 20})
+        wrong_interface["directive"]["header"]["namespace"] = \
+            "Alexa.ModeController"
+        self.assert_rejected(405, wrong_interface)
@@ -0,0 +1,51 @@
+"""Tests that the discovery response is cached and revalidated by ETag.
+
+Run from the repository root: python -m pytest tests
+"""
+from json import dumps, loads
+from .utils import SmartHomeTestCase
+
+
+class DiscoveryTest(SmartHomeTestCase):
+    """Discover the copied devices, and change them."""
+
+    def discover(self, headers=None):
+        """Request the discovery response.
+
+        Returns:
+            HTTPResponse: The response.
+        """
+        return self.request("POST", "discover", headers=headers)
+
+    def test_discovery_lists_devices(self):
+        response = self.discover()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads(response.content),
+                         self.handler.device_registry.get_devices())
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+
+    def test_cached_until_file_changes(self):
+        first = self.discover()
+        self.assertIs(self.discover().content, first.content)
+
+        devices_file = self.handler.device_registry.devices_file
+        with open(devices_file, "r") as input_file:
+            devices = loads(input_file.read())
+        devices["endpoints"][0]["friendlyName"] = "Kitchen blind"
+        with open(devices_file, "w") as output_file:
+            output_file.write(dumps(devices))
+        changed = self.discover()
+        self.assertNotEqual(changed.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(loads(changed.content)["endpoints"][0]
+                         ["friendlyName"], "Kitchen blind")
+
+    def test_revalidated_by_etag(self):
+        etag = self.discover().headers["ETag"]
+        for if_none_match in (etag, "W/" + etag, '"stale", ' + etag, "*"):
+            with self.subTest(if_none_match=if_none_match):
+                response = self.discover({"If-None-Match": if_none_match})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers["ETag"], etag)
+                self.assertNotIn("Content-Length", response.headers)
+        response = self.discover({"If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
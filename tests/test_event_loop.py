@@ -0,0 +1,32 @@
+"""Tests that the event loop serves many connections from one thread.
+
+Run from the repository root: python -m pytest tests
+"""
+from .utils import ServerTestCase
+
+REQUEST = b"GET /index.html HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+class EventLoopTest(ServerTestCase):
+    """Talk to a server in event-loop mode."""
+
+    MODE = "event-loop"
+
+    def test_serves_concurrent_connections(self):
+        connections = [self.connect() for _ in range(20)]
+        for client, _ in connections:
+            client.sendall(REQUEST)
+        for _, responses in connections:
+            status_code, _, body = self.read_response(responses)
+            self.assertEqual(status_code, 200)
+            self.assertTrue(body)
+
+    def test_partial_request_blocks_nothing(self):
+        slow, _ = self.connect()
+        slow.sendall(REQUEST[:20])
+        client, responses = self.connect()
+        client.sendall(REQUEST)
+        self.assertEqual(self.read_response(responses)[0], 200)
+
+        slow.sendall(REQUEST[20:])
+        self.assertEqual(self.read_response(slow.makefile("rb"))[0], 200)
@@ -0,0 +1,65 @@
+"""Tests that HEAD responses match GET without reading files.
+
+Run from the repository root: python -m pytest tests
+"""
+from .utils import StaticFilesTestCase
+
+
+class HeadRequestTest(StaticFilesTestCase):
+    """Compare HEAD responses with GET responses to a cold cache."""
+
+    def assert_matches_get(self, uri, headers=None):
+        """Check a HEAD response against the GET response to a cold cache.
+
+        Returns:
+            int: The files read for the HEAD request.
+        """
+        head, head_reads = self.respond("HEAD", uri, headers)
+        self.clear_cache()
+        get, _ = self.respond("GET", uri, headers)
+        self.assertEqual(head.status_code, get.status_code)
+        self.assertEqual(head.headers, get.headers)
+        self.assertIsNone(head.content)
+        return head_reads
+
+    def test_headers_match_get(self):
+        for uri in ("/", "/index.html", "/frog.png"):
+            for headers in (None, {"Accept-Encoding": "gzip"}):
+                with self.subTest(uri=uri, headers=headers):
+                    self.assert_matches_get(uri, headers)
+
+    def test_compressed_headers_match_get(self):
+        self.assert_matches_get("/index.html", {"Accept-Encoding": "gzip"})
+        head, _ = self.respond("HEAD", "/index.html",
+                               {"Accept-Encoding": "gzip"})
+        self.assertEqual(head.headers["Content-Encoding"], "gzip")
+
+    def test_no_reads_without_accept_encoding(self):
+        for uri in ("/index.html", "/frog.png"):
+            with self.subTest(uri=uri):
+                self.assertEqual(self.assert_matches_get(uri), 0)
+
+    def test_no_reads_for_uncompressible_files(self):
+        self.assertEqual(self.assert_matches_get(
+            "/frog.png", {"Accept-Encoding": "gzip"}), 0)
+
+    def test_missing_file(self):
+        head, reads = self.respond("HEAD", "/missing.html")
+        self.assertEqual(head.status_code, 404)
+        self.assertEqual(reads, 0)
+
+    def test_metrics_match_get(self):
+        head, _ = self.respond("HEAD", "/metrics")
+        get, _ = self.respond("GET", "/metrics")
+        self.assertEqual(head.status_code, 200)
+        self.assertEqual(head.headers, get.headers)
+        self.assertIsNone(head.content)
+
+    def test_smart_home_not_allowed(self):
+        for uri in ("/smarthome/subscribe", "/%73marthome/poll"):
+            with self.subTest(uri=uri):
+                head, reads = self.respond("HEAD", uri)
+                self.assertEqual(head.status_code, 405)
+                self.assertEqual(head.headers["Allow"], "GET, POST")
+                self.assertIsNone(head.content)
+                self.assertEqual(reads, 0)
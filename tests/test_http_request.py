@@ -0,0 +1,60 @@
+"""Tests that requests are parsed, with their headers found lazily.
+
+Run from the repository root: python -m pytest tests
+"""
+from unittest import TestCase
+from HTTPTools.HTTPRequest import HTTPRequest
+
+REQUEST = (b"POST /smarthome/status?pretty=1 HTTP/1.1\r\n"
+           b"Host: localhost\r\n"
+           b"Content-Type:  text/json \r\n"
+           b"X-Note: caf\xc3\xa9\r\n"
+           b"\r\n"
+           b'"smart_blind_01"')
+
+
+class HTTPRequestTest(TestCase):
+    """Parse raw requests, as framed by the RequestReader."""
+
+    def test_request_line(self):
+        request = HTTPRequest(REQUEST)
+        self.assertIs(request.method, HTTPRequest.HTTPMethod.POST)
+        self.assertEqual(request.request_uri, "/smarthome/status?pretty=1")
+        self.assertEqual(request.path, "/smarthome/status")
+        self.assertEqual(request.query, "pretty=1")
+        self.assertEqual(request.http_version, "HTTP/1.1")
+        self.assertEqual(request.body, b'"smart_blind_01"')
+
+    def test_get_header_ignores_case(self):
+        request = HTTPRequest(REQUEST)
+        self.assertEqual(request.get_header("content-type"), "text/json")
+        self.assertEqual(request.get_header("CONTENT-TYPE"), "text/json")
+        self.assertEqual(request.get_header("x-note"), "café")
+        self.assertIsNone(request.get_header("Accept"))
+        self.assertEqual(request.get_header("Accept", "*/*"), "*/*")
+        # a field's name must match whole, up to its colon
+        self.assertIsNone(request.get_header("Content"))
+
+    def test_headers(self):
+        self.assertEqual(HTTPRequest(REQUEST).headers, {
+            "Host": "localhost",
+            "Content-Type": "text/json",
+            "X-Note": "café"
+        })
+
+    def test_bare_newlines(self):
+        request = HTTPRequest(b"GET / HTTP/1.1\nHost: localhost\n\n")
+        self.assertEqual(request.get_header("host"), "localhost")
+        self.assertEqual(request.body, b"")
+        self.assertEqual(HTTPRequest(b"GET / HTTP/1.1\r\n\r\n").headers, {})
+
+    def test_invalid_requests(self):
+        for request_data in (
+                b"GET / HTTP/1.1\r\nHost: localhost\r\n",
+                b"GET /\r\n\r\n",
+                b"FETCH / HTTP/1.1\r\n\r\n",
+                b"GET / HTTP/1.1\r\nHost: localhost\r\nbroken\r\n\r\n",
+                b"GET / HTTP/1.1\r\nbroken\r\nHost: localhost\r\n\r\n"):
+            with self.subTest(request_data=request_data):
+                with self.assertRaises(Exception):
+                    HTTPRequest(request_data)
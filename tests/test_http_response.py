@@ -0,0 +1,132 @@
+"""Tests that responses are serialised from cached headers and buffers.
+
+Run from the repository root: python -m pytest tests
+"""
+from os import path
+from socket import SHUT_WR, socketpair
+from threading import Thread
+from time import monotonic
+from unittest import TestCase
+from HTTPTools.HTTPResponse import HTTPResponse
+
+FILE = path.join("www_root", "frog.png")
+
+
+class PartialSocket:
+    """A socket which accepts at most a few bytes of each call."""
+
+    def __init__(self, limit):
+        """Initialise a socket accepting limit bytes at a time."""
+        self.limit = limit
+        self.sent = b""
+
+    def sendmsg(self, buffers):
+        """Accept the first limit bytes of the buffers.
+
+        Returns:
+            int: The number of bytes accepted.
+        """
+        data = b"".join(bytes(buffer) for buffer in buffers)[:self.limit]
+        self.sent += data
+        return len(data)
+
+
+class HTTPResponseTest(TestCase):
+    """Serialise responses, and send them over sockets."""
+
+    @staticmethod
+    def read_all(client, received):
+        """Read from a socket until the other end stops sending."""
+        data = client.recv(65536)
+        while data:
+            received.append(data)
+            data = client.recv(65536)
+
+    def test_create_http_response(self):
+        response = HTTPResponse(200, "café", "text/plain")
+        response.add_header("Cache-Control", "no-cache")
+        self.assertEqual(response.create_http_response(),
+                         b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/plain\r\n"
+                         b"Content-Length: 5\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"\r\n"
+                         b"caf\xc3\xa9")
+        self.assertIn((200, "text/plain"), HTTPResponse.HEADER_PREFIXES)
+
+    def test_headers_without_content_type(self):
+        response = HTTPResponse(404, b"")
+        response.remove_header("Content-Type")
+        response.remove_header("Content-Length")
+        response.remove_header("Missing")
+        self.assertEqual(response.create_http_response(),
+                         b"HTTP/1.1 404 Not Found\r\n\r\n")
+
+    def test_unknown_status_code(self):
+        with self.assertRaises(Exception):
+            HTTPResponse(299, "")
+
+    def test_buffers_are_not_copied(self):
+        content = b"x" * 1024
+        buffers = HTTPResponse(200, content).create_http_buffers()
+        self.assertEqual(len(buffers), 2)
+        self.assertIs(buffers[1], content)
+        response = HTTPResponse(200, content)
+        response.remove_content()
+        self.assertEqual(len(response.create_http_buffers()), 1)
+        self.assertIn(b"Content-Length: 1024\r\n",
+                      response.create_http_buffers()[0])
+
+    def test_file_and_stream_content(self):
+        response = HTTPResponse(200, HTTPResponse.FileContent(
+            FILE, path.getsize(FILE)))
+        with open(FILE, "rb") as input_file:
+            self.assertTrue(response.create_http_response().endswith(
+                input_file.read()))
+        closed = []
+        response = HTTPResponse(200, HTTPResponse.StreamContent(
+            iter((b"a", b"b")), lambda: closed.append(True)))
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertTrue(response.create_http_response().endswith(
+            b"\r\n\r\nab"))
+        response.content.close()
+        response.content.close()
+        self.assertEqual(closed, [True])
+
+    def test_send_buffers_keeps_unsent_bytes(self):
+        response = HTTPResponse(200, b"0123456789")
+        buffers = response.create_http_buffers()
+        expected = b"".join(buffers)
+        client = PartialSocket(len(buffers[0]) + 4)
+        self.assertEqual(HTTPResponse.send_buffers(client, buffers),
+                         len(client.sent))
+        self.assertEqual(len(buffers), 1)
+        self.assertEqual(bytes(buffers[0]), b"456789")
+        client.limit = 100
+        HTTPResponse.send_buffers(client, buffers)
+        self.assertEqual(buffers, [])
+        self.assertEqual(client.sent, expected)
+
+    def test_send(self):
+        server_end, client_end = socketpair()
+        with server_end, client_end:
+            response = HTTPResponse(200, HTTPResponse.FileContent(
+                FILE, path.getsize(FILE)))
+            expected = response.create_http_response()
+            # the file is larger than the socket's buffers, so it is read
+            # while it is sent
+            received = []
+            reader = Thread(target=self.read_all, args=(client_end,
+                                                        received))
+            reader.start()
+            response.send(server_end, deadline=monotonic() + 5)
+            server_end.shutdown(SHUT_WR)
+            reader.join()
+            self.assertEqual(b"".join(received), expected)
+
+    def test_send_after_deadline(self):
+        server_end, client_end = socketpair()
+        with server_end, client_end:
+            with self.assertRaises(TimeoutError):
+                HTTPResponse(200, "late").send(server_end,
+                                               deadline=monotonic() - 1)
@@ -0,0 +1,69 @@
+"""Tests that connections persist between requests, and pipeline them.
+
+Run from the repository root: python -m pytest tests
+"""
+from .utils import ServerTestCase
+
+
+def build_request(uri, version="HTTP/1.1", connection=None):
+    """Build a raw GET request.
+
+    Returns:
+        byte string: The request.
+    """
+    request = "GET {} {}\r\nHost: localhost\r\n".format(uri, version)
+    if connection is not None:
+        request += "Connection: {}\r\n".format(connection)
+    return (request + "\r\n").encode("utf-8")
+
+
+class KeepAliveTest(ServerTestCase):
+    """Send several requests on one connection to a threaded server."""
+
+    def test_connection_persists(self):
+        client, responses = self.connect()
+        for _ in range(3):
+            client.sendall(build_request("/index.html"))
+            status_code, headers, _ = self.read_response(responses)
+            self.assertEqual(status_code, 200)
+            self.assertEqual(headers["Connection"], "keep-alive")
+
+    def test_pipelined_requests_answered_in_order(self):
+        client, responses = self.connect()
+        client.sendall(build_request("/index.html") +
+                       build_request("/missing.html") +
+                       build_request("/index.html", connection="close"))
+        self.assertEqual([self.read_response(responses)[0]
+                          for _ in range(3)], [200, 404, 200])
+        self.assertIsNone(self.read_response(responses))
+
+    def test_close_requested(self):
+        for request in (build_request("/index.html", connection="close"),
+                        build_request("/index.html", "HTTP/1.0")):
+            with self.subTest(request=request):
+                client, responses = self.connect()
+                client.sendall(request)
+                status_code, headers, _ = self.read_response(responses)
+                self.assertEqual(status_code, 200)
+                self.assertEqual(headers["Connection"], "close")
+                self.assertIsNone(self.read_response(responses))
+
+    def test_http_1_0_keep_alive(self):
+        client, responses = self.connect()
+        for _ in range(2):
+            client.sendall(build_request("/index.html", "HTTP/1.0",
+                                         "keep-alive"))
+            self.assertEqual(self.read_response(responses)[1]["Connection"],
+                             "keep-alive")
+
+
+class EventLoopKeepAliveTest(KeepAliveTest):
+    """Send several requests on one connection to an event-loop server."""
+
+    MODE = "event-loop"
+
+
+class WorkerPoolKeepAliveTest(KeepAliveTest):
+    """Send several requests on one connection to a worker-pool server."""
+
+    MODE = "worker-pool"
@@ -0,0 +1,56 @@
+"""Tests that files too large to cache are sent straight from disk.
+
+Run from the repository root: python -m pytest tests
+"""
+from os import path
+from socket import socketpair
+from threading import Thread
+from HTTPTools.HTTPResponse import HTTPResponse
+from .utils import FILES, StaticFilesTestCase
+
+
+class LargeFileTest(StaticFilesTestCase):
+    """Serve files larger than the cache's file size limit."""
+
+    def clear_cache(self):
+        """Serve the files from a new cache, which keeps up to 1 KiB files."""
+        StaticFilesTestCase.clear_cache(self)
+        self.handler.static_files.MAX_FILE_SIZE = 1024
+
+    def test_sent_from_file(self):
+        response, reads = self.respond("GET", "/frog.png")
+        self.assertTrue(response.is_file())
+        self.assertEqual(reads, 0)
+        self.assertEqual(self.handler.static_files.stats()["bytes"], 0)
+
+        server_end, client_end = socketpair()
+        received = bytearray()
+
+        def receive():
+            """Read the response until the connection closes."""
+            data = client_end.recv(65536)
+            while data:
+                received.extend(data)
+                data = client_end.recv(65536)
+
+        reader = Thread(target=receive)
+        reader.start()
+        with server_end, client_end:
+            response.send(server_end)
+            server_end.close()
+            reader.join()
+        head, _, body = bytes(received).partition(b"\r\n\r\n")
+        self.assertIn(b"Content-Length: 16384", head)
+        self.assertEqual(body, FILES["frog.png"])
+
+    def test_not_sent_by_head(self):
+        response, reads = self.respond("HEAD", "/frog.png")
+        self.assertEqual(response.headers["Content-Length"], "16384")
+        self.assertIsNone(response.content)
+        self.assertEqual(reads, 0)
+
+    def test_file_content_has_size(self):
+        content = HTTPResponse.FileContent(path.join(self.root, "frog.png"),
+                                           16384)
+        self.assertEqual(len(content), 16384)
+        self.assertEqual(content.read(), FILES["frog.png"])
@@ -0,0 +1,141 @@
+"""Tests that requests are counted, timed, exported and logged.
+
+Run from the repository root: python -m pytest tests
+"""
+from json import loads
+from threading import Event
+from unittest import TestCase
+from HTTPTools.AccessLog import AccessLog
+from HTTPTools.Metrics import Metrics
+
+
+def timing(uri, status_code=200, method="GET", receive=0.0003):
+    """Make the timing of a served request.
+
+    Returns:
+        Metrics.RequestTiming: The timing, sent from 127.0.0.1:5000.
+    """
+    request_timing = Metrics.RequestTiming(("127.0.0.1", 5000))
+    request_timing.started_at = 1600000000.25
+    request_timing.method = method
+    request_timing.uri = uri
+    request_timing.status_code = status_code
+    request_timing.bytes_sent = 12
+    request_timing.receive = receive
+    return request_timing
+
+
+class Stream:
+    """A stream which can hold the access log's writer in write()."""
+
+    def __init__(self):
+        """Initialise a stream which lets every write through."""
+        self.lines = []
+        self.writing = Event()
+        self.release = Event()
+        self.release.set()
+        self.flushed = Event()
+
+    def write(self, text):
+        """Keep the lines written, once released."""
+        self.writing.set()
+        self.release.wait(5)
+        self.lines += text.splitlines()
+
+    def flush(self):
+        """Signal that everything queued has been written."""
+        self.flushed.set()
+
+
+class MetricsTest(TestCase):
+    """Record requests, and render them in the Prometheus text format."""
+
+    def setUp(self):
+        """Make metrics with two histogram buckets."""
+        self.metrics = Metrics(buckets=(0.001, 0.01))
+
+    def test_classify(self):
+        for uri, uri_class in (("/smarthome/poll", "smarthome/poll"),
+                               ("/smarthome/reboot", "smarthome/other"),
+                               ("/metrics", "metrics"),
+                               ("/index.html", "static"),
+                               (None, "invalid")):
+            with self.subTest(uri=uri):
+                self.assertEqual(self.metrics.classify(uri), uri_class)
+
+    def test_render(self):
+        recorded = []
+        self.metrics.add_hook(recorded.append)
+        for receive in (0.0005, 0.005, 0.5):
+            self.metrics.record(timing("/smarthome/status", receive=receive))
+        self.metrics.record(timing(None, 400, None))
+        self.assertEqual(len(recorded), 4)
+
+        lines = self.metrics.render().splitlines()
+        self.assertIn('http_requests_total{method="GET",uri_class='
+                      '"smarthome/status",status="200"} 3', lines)
+        self.assertIn('http_requests_total{method="invalid",uri_class='
+                      '"invalid",status="400"} 1', lines)
+        labels = 'phase="receive",uri_class="smarthome/status"'
+        for bound, count in (("0.001", 1), ("0.01", 2), ("+Inf", 3)):
+            self.assertIn('http_request_phase_seconds_bucket{{{},le="{}"}} '
+                          '{}'.format(labels, bound, count), lines)
+        self.assertIn("http_request_phase_seconds_count{{{}}} 3".format(
+            labels), lines)
+
+    def test_counters_and_gauges(self):
+        depth = [3]
+        self.metrics.add_gauge("queue_depth", "Waiting.", lambda: depth[0])
+        self.metrics.add_counter("dropped_total", "Dropped.", lambda: 1)
+        self.metrics.add_counter("dropped_total", "Lost.", lambda: 2)
+        depth[0] = 4
+        text = self.metrics.render()
+        self.assertIn("# HELP queue_depth Waiting.\n"
+                      "# TYPE queue_depth gauge\n"
+                      "queue_depth 4\n", text)
+        self.assertIn("# HELP dropped_total Lost.\n"
+                      "# TYPE dropped_total counter\n"
+                      "dropped_total 2\n", text)
+        self.assertNotIn("Dropped.", text)
+
+
+class AccessLogTest(TestCase):
+    """Log requests through a stream which is checked once flushed."""
+
+    def setUp(self):
+        """Make an access log with room for one waiting entry."""
+        self.stream = Stream()
+        self.access_log = AccessLog(self.stream, 1.0, queue_size=1)
+
+    def tearDown(self):
+        """Let the writer finish with any held entries."""
+        self.stream.release.set()
+
+    def test_entry(self):
+        self.access_log(timing("/index.html"))
+        self.assertTrue(self.stream.flushed.wait(5))
+        entry = loads(self.stream.lines[0])
+        self.assertEqual(entry["time"], "2020-09-13T12:26:40.250Z")
+        self.assertEqual(entry["client"], "127.0.0.1:5000")
+        self.assertEqual((entry["method"], entry["uri"], entry["status"],
+                          entry["bytes"]), ("GET", "/index.html", 200, 12))
+        self.assertEqual(entry["ms"], 0.3)
+        self.assertEqual(entry["phases_ms"]["receive"], 0.3)
+
+    def test_sampling_keeps_server_errors(self):
+        self.access_log.sample_rate = 0
+        self.access_log(timing("/index.html"))
+        self.access_log(timing("/smarthome/status", 500))
+        self.assertTrue(self.stream.flushed.wait(5))
+        self.assertEqual([loads(line)["status"] for line
+                          in self.stream.lines], [500])
+
+    def test_full_queue_drops_entries(self):
+        self.stream.release.clear()
+        self.access_log(timing("/index.html"))
+        # the writer holds the first entry, so one more can wait
+        self.assertTrue(self.stream.writing.wait(5))
+        for _ in range(3):
+            self.access_log(timing("/index.html"))
+        self.assertEqual(self.access_log.dropped, 2)
+        self.stream.release.set()
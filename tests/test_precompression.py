@@ -0,0 +1,44 @@
+"""Tests that text files are compressed before they are requested.
+
+Run from the repository root: python -m pytest tests
+"""
+from .utils import StaticFilesTestCase
+
+
+class PrecompressionTest(StaticFilesTestCase):
+    """Precompress a cold cache, then request its files."""
+
+    def test_precompress_loads_text_files(self):
+        self.assertEqual(self.handler.static_files.precompress(), 1)
+        stats = self.handler.static_files.stats()
+        self.assertEqual(stats["files"], 1)
+        self.assertEqual(stats["reads"], 1)
+
+    def test_compressed_response_reads_nothing(self):
+        self.handler.static_files.precompress()
+        response, reads = self.respond("GET", "/index.html",
+                                       {"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(reads, 0)
+
+    def test_accept_encoding_negotiated(self):
+        for accept_encoding, encoding in (("gzip", "gzip"),
+                                          ("gzip;q=0", None),
+                                          ("identity", None),
+                                          ("deflate, GZIP;q=0.5", "gzip")):
+            with self.subTest(accept_encoding=accept_encoding):
+                response, _ = self.respond(
+                    "GET", "/index.html",
+                    {"Accept-Encoding": accept_encoding})
+                self.assertEqual(response.headers.get("Content-Encoding"),
+                                 encoding)
+                self.assertEqual(response.headers["Vary"],
+                                 "Accept-Encoding")
+
+    def test_images_not_compressed(self):
+        response, _ = self.respond("GET", "/frog.png",
+                                   {"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(len(response.content),
+                         int(response.headers["Content-Length"]))
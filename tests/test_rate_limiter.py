@@ -0,0 +1,100 @@
+"""Tests that each client's requests are limited by token buckets.
+
+Run from the repository root: python -m pytest tests
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from HTTPTools.RateLimiter import RateLimiter
+from HTTPTools.RequestHandler import RequestHandler
+from WebServer import WebServer
+
+
+class RateLimiterTest(TestCase):
+    """Check requests against rules, at fixed times."""
+
+    def setUp(self):
+        """Limit smart home requests, and the directives among them."""
+        self.limiter = RateLimiter([
+            RateLimiter.Rule.parse("/smarthome/=2/4"),
+            RateLimiter.Rule.parse("/smarthome/directive=1")
+        ])
+        self.now = 100.0
+        clock = patch("HTTPTools.RateLimiter.monotonic",
+                      lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_parse(self):
+        rule = RateLimiter.Rule.parse("/a=b/=0.5")
+        self.assertEqual((rule.prefix, rule.rate, rule.burst),
+                         ("/a=b/", 0.5, 1))
+        rule = RateLimiter.Rule.parse("/=10/20")
+        self.assertEqual((rule.rate, rule.burst, rule.refill_time),
+                         (10, 20, 2))
+        for spec in ("/=fast", "/=0", "/=1/0.5", "/"):
+            with self.subTest(spec=spec):
+                with self.assertRaises(Exception):
+                    RateLimiter.Rule.parse(spec)
+
+    def test_longest_prefix_wins(self):
+        self.assertEqual(self.limiter.find_rule(
+            "/smarthome/directive_batch").prefix, "/smarthome/directive")
+        self.assertEqual(self.limiter.find_rule("/smarthome/status").prefix,
+                         "/smarthome/")
+        self.assertIsNone(self.limiter.find_rule("/index.html"))
+        self.assertEqual(self.limiter.check("10.0.0.1", "/index.html"), 0)
+
+    def test_burst_then_refill(self):
+        waits = [self.limiter.check("10.0.0.1", "/smarthome/status")
+                 for _ in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 0, 0.5])
+        # other clients and rules have their own buckets
+        self.assertEqual(self.limiter.check("10.0.0.2", "/smarthome/status"),
+                         0)
+        self.assertEqual(self.limiter.check("10.0.0.1",
+                                            "/smarthome/directive"), 0)
+        self.assertEqual(self.limiter.check("10.0.0.1",
+                                            "/smarthome/directive"), 1)
+        self.now += 0.5
+        self.assertEqual(self.limiter.check("10.0.0.1", "/smarthome/status"),
+                         0)
+        self.assertEqual(self.limiter.limited, 2)
+
+    def test_refilled_buckets_expire(self):
+        for number in range(3):
+            self.limiter.check("10.0.0.{}".format(number),
+                               "/smarthome/status")
+        self.now += 1.5
+        self.limiter.check("10.0.0.3", "/smarthome/directive")
+        self.assertEqual(len(self.limiter.buckets), 4)
+        self.now += 0.5
+        self.limiter.check("10.0.0.3", "/smarthome/status")
+        self.assertEqual([ip for ip, _ in self.limiter.buckets],
+                         ["10.0.0.3", "10.0.0.3"])
+
+
+class RateLimitedResponseTest(TestCase):
+    """Create responses to a client which has used up its budget."""
+
+    def setUp(self):
+        """Allow each client one static file request at once."""
+        self.handler = RequestHandler()
+        self.handler.rate_limiter = RateLimiter(
+            [RateLimiter.Rule.parse("/=0.5")])
+
+    def test_too_many_requests(self):
+        request = (b"GET /missing.html HTTP/1.1\r\nHost: localhost\r\n"
+                   b"\r\n")
+        response, keep_alive = WebServer.create_response(
+            request, self.handler, True, client_address=("10.0.0.1", 1))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(keep_alive)
+        response, keep_alive = WebServer.create_response(
+            request, self.handler, True, client_address=("10.0.0.1", 2))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "2")
+        self.assertEqual(response.headers["Connection"], "close")
+        self.assertFalse(keep_alive)
+        # requests are not limited without the client's address
+        response, _ = WebServer.create_response(request, self.handler)
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,78 @@
+"""Tests that requests are framed by Content-Length or chunked encoding.
+
+Run from the repository root: python -m pytest tests
+"""
+from unittest import TestCase
+from HTTPTools.RequestReader import RequestReader
+
+HEAD = b"POST /smarthome/status HTTP/1.1\r\nHost: localhost\r\n"
+
+
+class RequestReaderTest(TestCase):
+    """Feed a RequestReader bytes, and take the requests it frames."""
+
+    def setUp(self):
+        """Make a reader with small limits."""
+        self.reader = RequestReader(max_header_size=256, max_body_size=16)
+
+    def read(self, *pieces):
+        """Feed bytes a piece at a time, taking every complete request.
+
+        Returns:
+            list(byte string): The requests framed.
+        """
+        requests = []
+        for piece in pieces:
+            self.reader.feed(piece)
+            request = self.reader.next_request()
+            while request is not None:
+                requests.append(request)
+                request = self.reader.next_request()
+        return requests
+
+    def assert_rejected(self, status_code, *pieces):
+        """Check that feeding bytes is rejected with a status code."""
+        with self.assertRaises(RequestReader.RequestError) as context:
+            self.read(*pieces)
+        self.assertEqual(context.exception.status_code, status_code)
+
+    def test_content_length(self):
+        request = HEAD + b"Content-Length: 5\r\n\r\nhello"
+        self.assertEqual(self.read(request[:-3], request[-3:]), [request])
+        self.assertFalse(self.reader.pending())
+
+    def test_pipelined_requests(self):
+        first = HEAD + b"Content-Length: 2\r\n\r\nhi"
+        second = b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        self.assertEqual(self.read(first + second + second[:5]),
+                         [first, second])
+        self.assertTrue(self.reader.pending())
+
+    def test_chunked_body_is_decoded(self):
+        head = HEAD + b"Transfer-Encoding: chunked\r\n\r\n"
+        requests = self.read(head, b"5;ext=1\r\nhel", b"lo\r\n4\r\nfro",
+                             b"g\r\n0\r\n", b"\r\n")
+        self.assertEqual(requests, [head + b"hellofrog"])
+
+    def test_chunked_trailers_are_ignored(self):
+        head = HEAD + b"Transfer-Encoding: chunked\r\n\r\n"
+        requests = self.read(head + b"2\r\nhi\r\n0\r\nX-Trailer: 1\r\n\r\n"
+                             b"GET / HTTP/1.1\r\n\r\n")
+        self.assertEqual(requests, [head + b"hi",
+                                    b"GET / HTTP/1.1\r\n\r\n"])
+
+    def test_framing_errors(self):
+        chunked = b"Transfer-Encoding: chunked\r\n\r\n"
+        for status_code, rest in (
+                (400, b"Content-Length: 1\r\n" + chunked),
+                (400, b"Content-Length: 1\r\nContent-Length: 2\r\n\r\n"),
+                (400, b"Content-Length: -1\r\n\r\n"),
+                (501, b"Transfer-Encoding: gzip\r\n\r\n"),
+                (413, b"Content-Length: 17\r\n\r\n"),
+                (431, b"X-Padding: " + b"a" * 256 + b"\r\n\r\n"),
+                (400, chunked + b"zz\r\n"),
+                (400, chunked + b"2\r\nhiX\r\n"),
+                (413, chunked + b"11\r\n")):
+            with self.subTest(rest=rest):
+                self.setUp()
+                self.assert_rejected(status_code, HEAD + rest)
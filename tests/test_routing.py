@@ -0,0 +1,103 @@
+"""Tests that request paths are normalised, then routed by the route table.
+
+Run from the repository root: python -m pytest tests
+"""
+from unittest import TestCase
+from HTTPTools.HTTPRequest import HTTPRequest
+from HTTPTools.RequestHandler import RequestHandler
+from HTTPTools.Router import Router
+from .utils import make_request
+
+GET = HTTPRequest.HTTPMethod.GET
+HEAD = HTTPRequest.HTTPMethod.HEAD
+POST = HTTPRequest.HTTPMethod.POST
+
+
+class NormaliseURITest(TestCase):
+    """Normalise Request-URIs spelt in different ways."""
+
+    def test_normalised_paths(self):
+        for request_uri, normalised in (
+                ("/", ("/", "")),
+                ("/smarthome/poll?after=3", ("/smarthome/poll", "after=3")),
+                ("/%73marthome/%70oll", ("/smarthome/poll", "")),
+                ("//smarthome//status", ("/smarthome/status", "")),
+                ("/a/../smarthome/./status", ("/smarthome/status", "")),
+                ("/CustomSmartHome/.", ("/CustomSmartHome/", "")),
+                ("/a/b/..", ("/a/", "")),
+                ("/.hidden", ("/.hidden", "")),
+                ("/a?b=/../c", ("/a", "b=/../c")),
+                ("http://localhost:8080/metrics?x", ("/metrics", "x")),
+                ("https://localhost", ("/", "")),
+                ("*", ("*", ""))):
+            with self.subTest(request_uri=request_uri):
+                self.assertEqual(HTTPRequest._normalise_uri(request_uri),
+                                 normalised)
+
+    def test_invalid_paths(self):
+        for request_uri in ("/..", "/a/../../b", "/%2e%2e/etc/passwd",
+                            "/..%2f", "index.html", "/%ff", "/a%00"):
+            with self.subTest(request_uri=request_uri):
+                with self.assertRaises(Exception):
+                    HTTPRequest._normalise_uri(request_uri)
+
+
+class RouterTest(TestCase):
+    """Route paths to placeholder functions."""
+
+    def setUp(self):
+        """Route a few exact paths and prefixes."""
+        self.router = Router()
+        self.router.add("/metrics", "metrics", (GET,))
+        self.router.add_prefix("/smarthome/", "smart home", (GET, POST))
+        self.router.add_prefix("/", "static", (GET, HEAD))
+
+    def test_find(self):
+        for method, path, function in (
+                (GET, "/metrics", "metrics"),
+                (HEAD, "/metrics", "static"),
+                (GET, "/metrics/", "static"),
+                (POST, "/smarthome/directive", "smart home"),
+                (GET, "/smarthome/a/b", "smart home"),
+                (GET, "/smarthome", "static"),
+                (POST, "/index.html", None)):
+            with self.subTest(method=method, path=path):
+                self.assertEqual(self.router.find(method, path), function)
+
+    def test_allowed_methods(self):
+        self.assertEqual(set(self.router.allowed_methods("/smarthome/poll")),
+                         {GET, HEAD, POST})
+        self.assertEqual(set(self.router.allowed_methods("/index.html")),
+                         {GET, HEAD})
+        self.assertEqual(Router().allowed_methods("/"), [])
+
+    def test_prefix_must_end_in_slash(self):
+        with self.assertRaises(Exception):
+            self.router.add_prefix("/smarthome", "smart home", (GET,))
+
+
+class DispatchTest(TestCase):
+    """Route requests through the RequestHandler's route table."""
+
+    def test_normalised_paths_are_routed(self):
+        for uri, function in (
+                ("/%73marthome/status", RequestHandler._do_smart_home),
+                ("/static/..//smarthome/status",
+                 RequestHandler._do_smart_home),
+                ("/metrics", RequestHandler._do_metrics),
+                ("/./metrics", RequestHandler._do_metrics),
+                ("/smarthome", RequestHandler._do_GET)):
+            with self.subTest(uri=uri):
+                request = make_request("GET", uri)
+                self.assertIs(RequestHandler.ROUTES.find(request.method,
+                                                         request.path),
+                              function)
+
+    def test_unrouted_methods(self):
+        handler = RequestHandler()
+        response = handler.generate_response(make_request("POST",
+                                                          "/index.html"))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.headers["Allow"], "GET, HEAD")
+        response = handler.generate_response(make_request("DELETE", "/"))
+        self.assertEqual(response.status_code, 501)
@@ -0,0 +1,136 @@
+"""Tests that slow clients are timed out, and capped per IP address.
+
+Run from the repository root: python -m pytest tests
+"""
+from socket import socketpair
+from unittest import TestCase
+from unittest.mock import patch
+from HTTPTools.RequestReader import RequestReader
+from WebServer import WebServer
+from .utils import ServerTestCase
+
+HEAD = b"POST /smarthome/status HTTP/1.1\r\nContent-Length: 1000\r\n\r\n"
+
+
+class RequestDeadlineTest(TestCase):
+    """Find the time left to read a request, at fixed times."""
+
+    def setUp(self):
+        """Make a reader, with the clock stopped at 100 seconds."""
+        self.now = 100.0
+        clock = patch("HTTPTools.RequestReader.perf_counter",
+                      lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.reader = RequestReader()
+
+    def test_no_deadline_until_first_byte(self):
+        self.assertIsNone(self.reader.time_left())
+        self.reader.feed(b"GET / HT")
+        self.now += 4
+        self.assertAlmostEqual(self.reader.time_left(),
+                               RequestReader.HEADER_TIMEOUT + 8 / 500 - 4)
+
+    def test_header_deadline_is_capped(self):
+        self.reader.feed(b"GET / HTTP/1.1\r\nX-Padding: " + b"a" * 15000)
+        self.assertEqual(self.reader.time_left(),
+                         RequestReader.MAX_HEADER_TIME)
+
+    def test_body_deadline(self):
+        self.reader.feed(HEAD[:10])
+        self.now += 8
+        self.reader.feed(HEAD[10:])
+        self.assertIsNone(self.reader.next_request())
+        # the body has its own deadline, from the end of the headers
+        self.now += 1
+        self.assertEqual(self.reader.time_left(),
+                         RequestReader.BODY_TIMEOUT - 1)
+        self.reader.feed(b"a" * 500)
+        self.assertIsNone(self.reader.next_request())
+        # each MIN_RATE bytes recieved extend the deadline by a second
+        self.now += 9.5
+        self.assertEqual(self.reader.time_left(), 0.5)
+        self.now += 1
+        self.assertLess(self.reader.time_left(), 0)
+
+    def test_receive_time(self):
+        self.reader.feed(HEAD)
+        self.now += 2.5
+        self.reader.feed(b"a" * 1000)
+        self.assertIsNotNone(self.reader.next_request())
+        self.assertEqual(self.reader.receive_time, 2.5)
+        self.assertIsNone(self.reader.time_left())
+
+
+class ConnectionLimiterTest(TestCase):
+    """Open and close connections from a few IP addresses."""
+
+    def test_cap_per_ip(self):
+        limiter = WebServer.ConnectionLimiter(max_per_ip=2)
+        self.assertTrue(limiter.acquire(("10.0.0.1", 1)))
+        self.assertTrue(limiter.acquire(("10.0.0.1", 2)))
+        self.assertFalse(limiter.acquire(("10.0.0.1", 3)))
+        self.assertTrue(limiter.acquire(("10.0.0.2", 1)))
+        self.assertEqual(limiter.rejected, 1)
+        limiter.release(("10.0.0.1", 1))
+        self.assertTrue(limiter.acquire(("10.0.0.1", 4)))
+        for port in (2, 4):
+            limiter.release(("10.0.0.1", port))
+        limiter.release(("10.0.0.2", 1))
+        # closed clients take up no memory
+        self.assertEqual(limiter.counts, {})
+
+    def test_no_cap(self):
+        limiter = WebServer.ConnectionLimiter(max_per_ip=0)
+        for port in range(100):
+            self.assertTrue(limiter.acquire(("10.0.0.1", port)))
+
+    def test_reject(self):
+        server_end, client_end = socketpair()
+        with client_end:
+            WebServer.ConnectionLimiter().reject(server_end)
+            self.assertEqual(client_end.recv(4096),
+                             WebServer.ConnectionLimiter.REJECTION)
+            self.assertEqual(client_end.recv(4096), b"")
+
+
+class SlowClientTest(ServerTestCase):
+    """Stall requests to a threaded server, with short timeouts."""
+
+    def setUp(self):
+        """Wait at most a fifth of a second for the rest of a request."""
+        for connection_class in (WebServer.ClientConnection,
+                                 WebServer.EventLoop):
+            timeout = patch.object(connection_class, "READ_TIMEOUT", 0.2)
+            timeout.start()
+            self.addCleanup(timeout.stop)
+        ServerTestCase.setUp(self)
+
+    def test_stalled_request_times_out(self):
+        for request in (b"GET /index.html HTTP/1.1\r\nHost: loc",
+                        HEAD + b"a" * 10):
+            with self.subTest(request=request):
+                client, responses = self.connect()
+                client.sendall(request)
+                status_code, headers, _ = self.read_response(responses)
+                self.assertEqual(status_code, 408)
+                self.assertEqual(headers["Connection"], "close")
+                self.assertIsNone(self.read_response(responses))
+
+    def test_connections_capped_per_ip(self):
+        with patch.object(WebServer.connection_limiter, "max_per_ip", 1):
+            self.connect()
+            _, responses = self.connect()
+            self.assertEqual(self.read_response(responses)[0], 429)
+
+
+class EventLoopSlowClientTest(SlowClientTest):
+    """Stall requests to an event-loop server, with short timeouts."""
+
+    MODE = "event-loop"
+
+
+class WorkerPoolSlowClientTest(SlowClientTest):
+    """Stall requests to a worker-pool server, with short timeouts."""
+
+    MODE = "worker-pool"
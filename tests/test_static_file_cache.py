@@ -0,0 +1,70 @@
+"""Tests that static files are cached, invalidated and evicted.
+
+Run from the repository root: python -m pytest tests
+"""
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from HTTPTools.StaticFileCache import StaticFileCache
+
+
+class StaticFileCacheTest(TestCase):
+    """Cache a directory of files, checked for changes on every request."""
+
+    def setUp(self):
+        """Create a directory with an index page and a stylesheet."""
+        self.root = mkdtemp()
+        self.write("index.html", b"<p>frog</p>")
+        self.write("style.css", b"p {}")
+        self.cache = StaticFileCache(self.root, check_interval=0,
+                                     index_interval=0)
+
+    def tearDown(self):
+        """Remove the directory."""
+        rmtree(self.root)
+
+    def write(self, name, data):
+        """Write a file in the directory."""
+        with open(path.join(self.root, name), "wb") as output_file:
+            output_file.write(data)
+
+    def test_repeated_requests_read_once(self):
+        for _ in range(3):
+            self.assertEqual(self.cache.get("/index.html").data,
+                             b"<p>frog</p>")
+        stats = self.cache.stats()
+        self.assertEqual((stats["reads"], stats["hits"], stats["misses"]),
+                         (1, 2, 1))
+
+    def test_directory_serves_its_index(self):
+        for uri in ("/", "/index.html"):
+            with self.subTest(uri=uri):
+                self.assertEqual(self.cache.get(uri).path,
+                                 path.join(self.root, "index.html"))
+
+    def test_changed_file_is_reloaded(self):
+        self.cache.get("/index.html")
+        self.write("index.html", b"<p>toad, not frog</p>")
+        self.assertEqual(self.cache.get("/index.html").data,
+                         b"<p>toad, not frog</p>")
+
+    def test_unchanged_until_check_interval(self):
+        self.cache.check_interval = 60
+        self.cache.get("/index.html")
+        self.write("index.html", b"<p>toad, not frog</p>")
+        self.assertEqual(self.cache.get("/index.html").data,
+                         b"<p>frog</p>")
+
+    def test_new_and_missing_files(self):
+        self.assertIsNone(self.cache.get("/new.css"))
+        self.write("new.css", b"a {}")
+        self.assertEqual(self.cache.get("/new.css").data, b"a {}")
+
+    def test_least_recently_used_evicted(self):
+        self.cache.max_bytes = 12
+        self.cache.get("/index.html")
+        self.cache.get("/style.css")
+        stats = self.cache.stats()
+        self.assertEqual((stats["files"], stats["evictions"]), (1, 1))
+        self.assertLessEqual(stats["bytes"], 12)
@@ -0,0 +1,100 @@
+"""Tests that one client IP cannot take over the worker pool's queue.
+
+Run from the repository root: python -m pytest tests
+"""
+from socket import socketpair
+from time import monotonic, sleep
+from unittest import TestCase
+from HTTPTools.RequestHandler import RequestHandler
+from WebServer import WebServer
+
+
+class WorkerPoolTest(TestCase):
+    """Submit connections from a slow IP, which never send a request."""
+
+    def setUp(self):
+        """Start a pool of two workers, with room for eight connections."""
+        self.pool = WebServer.WorkerPool(workers=2, queue_size=8)
+        self.peers = []
+        self.sample_rate = RequestHandler.access_log.sample_rate
+        RequestHandler.access_log.sample_rate = 0
+
+    def tearDown(self):
+        """Close every connection, so the workers finish with them."""
+        RequestHandler.access_log.sample_rate = self.sample_rate
+        for peer in self.peers:
+            peer.close()
+
+    def connect(self, ip):
+        """Submit a connection to the pool, as the connection loop does.
+
+        Returns:
+            socket: The client's end of the connection.
+        """
+        server_end, client_end = socketpair()
+        client_end.settimeout(5)
+        self.peers.append(client_end)
+        address = (ip, len(self.peers))
+        WebServer.connection_limiter.acquire(address)
+        self.pool.submit(server_end, address)
+        return client_end
+
+    def test_full_queue_is_refused(self):
+        self.pool = WebServer.WorkerPool(workers=1, queue_size=2)
+        clients = [self.connect("10.0.1.0")]
+        # the worker holds the first connection, waiting for its request
+        deadline = monotonic() + 5
+        while self.pool.stats()["busy"] < 1 and monotonic() < deadline:
+            sleep(0.01)
+        clients += [self.connect("10.0.1.{}".format(number))
+                    for number in range(1, 5)]
+        stats = self.pool.stats()
+        self.assertEqual(stats["accepted"], 3)
+        self.assertEqual(stats["rejected"], 2)
+        self.assertEqual(stats["queue_depth"], 2)
+        for client in clients[3:]:
+            response = client.recv(4096)
+            self.assertTrue(response.startswith(b"HTTP/1.1 503"))
+            self.assertIn(b"Retry-After: 1\r\n", response)
+
+    def test_one_ip_cannot_fill_queue(self):
+        slow = [self.connect("10.0.0.2") for _ in range(20)]
+        stats = self.pool.stats()
+        self.assertEqual(self.pool.max_waiting_per_ip, 2)
+        self.assertLessEqual(stats["accepted"], 3)
+        self.assertEqual(stats["rejected_per_ip"], 20 - stats["accepted"])
+        self.assertEqual(stats["rejected"], 0)
+        self.assertLessEqual(stats["queue_depth"] + stats["deferred"], 2)
+
+        # accepted connections wait for a worker, and are sent nothing
+        responses = []
+        for client in slow:
+            client.settimeout(0.2)
+            try:
+                responses.append(client.recv(4096))
+            except TimeoutError:
+                pass
+        self.assertEqual(len(responses), stats["rejected_per_ip"])
+        for response in responses:
+            self.assertTrue(response.startswith(b"HTTP/1.1 429"))
+
+        # another client is still queued, and served by the free worker
+        normal = self.connect("10.0.0.1")
+        normal.sendall(b"GET /missing.html HTTP/1.1\r\nHost: localhost\r\n"
+                       b"Connection: close\r\n\r\n")
+        self.assertTrue(normal.recv(4096).startswith(b"HTTP/1.1 404"))
+        self.assertEqual(self.pool.stats()["rejected_per_ip"],
+                         stats["rejected_per_ip"])
+
+    def test_saturation_exported(self):
+        for _ in range(6):
+            self.connect("10.0.0.2")
+        stats = self.pool.stats()
+        lines = RequestHandler.metrics.render().splitlines()
+        for name, key in (("worker_pool_workers", "workers"),
+                          ("worker_pool_queue_depth", "queue_depth"),
+                          ("worker_pool_deferred_connections", "deferred"),
+                          ("worker_pool_rejected_per_ip_total",
+                           "rejected_per_ip")):
+            with self.subTest(name=name):
+                self.assertIn("{} {}".format(name, stats[key]), lines)
@@ -0,0 +1,201 @@
+"""Shared helpers for the tests, which are run from the repository root."""
+from json import dumps, loads
+from os import path
+from shutil import copy, rmtree
+from socket import create_connection
+from tempfile import mkdtemp
+from threading import Thread
+from unittest import TestCase
+from HTTPTools.DeviceControllerPool import DeviceControllerPool
+from HTTPTools.DeviceRegistry import DeviceRegistry
+from HTTPTools.DeviceStateStore import DeviceStateStore
+from HTTPTools.HTTPRequest import HTTPRequest
+from HTTPTools.RequestHandler import RequestHandler
+from HTTPTools.SmartDeviceHandler import SmartDeviceHandler
+from HTTPTools.StaticFileCache import StaticFileCache
+from WebServer import WebServer
+
+FILES = {
+    "index.html": b"<html><body>" + b"<p>Hello, frog.</p>" * 200 +
+                  b"</body></html>",
+    "frog.png": bytes(range(256)) * 64
+}
+
+
+def make_request(method, uri, headers=None, body=b""):
+    """Build a HTTPRequest.
+
+    Returns:
+        HTTPRequest: The request.
+    """
+    lines = ["{} {} HTTP/1.1".format(method, uri), "Host: localhost"]
+    lines += ["{}: {}".format(name, value)
+              for name, value in (headers or {}).items()]
+    if body:
+        lines.append("Content-Length: {}".format(len(body)))
+    return HTTPRequest(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") +
+                       body)
+
+
+class StaticFilesTestCase(TestCase):
+    """Base class of tests serving a directory of static files."""
+
+    def setUp(self):
+        """Create a directory of static files and a handler serving it."""
+        self.root = mkdtemp()
+        for name, data in FILES.items():
+            with open(path.join(self.root, name), "wb") as output_file:
+                output_file.write(data)
+        self.handler = RequestHandler()
+        self.clear_cache()
+
+    def tearDown(self):
+        """Remove the static files."""
+        rmtree(self.root)
+
+    def clear_cache(self):
+        """Serve the files from a new, cold cache."""
+        self.handler.static_files = StaticFileCache(self.root)
+
+    def respond(self, method, uri, headers=None):
+        """Respond to a request, counting the files read for it.
+
+        Returns:
+            tuple: The response (HTTPResponse) and files read (int).
+        """
+        reads = self.handler.static_files.stats()["reads"]
+        response = self.handler.generate_response(
+            make_request(method, uri, headers))
+        return response, self.handler.static_files.stats()["reads"] - reads
+
+
+class ServerTestCase(TestCase):
+    """Base class of tests talking to a running WebServer over sockets."""
+
+    MODE = "threaded"  # serving mode of the server under test
+
+    def setUp(self):
+        """Start a server on a free port, serving www_root."""
+        self.sample_rate = RequestHandler.access_log.sample_rate
+        RequestHandler.access_log.sample_rate = 0
+        self.server = WebServer(port=0, mode=self.MODE,
+                                request_queue_size=64)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.clients = []
+
+    def tearDown(self):
+        """Close every connection, and stop the server."""
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        # closing the listening socket does not wake another thread's
+        # accept, but a connection does
+        try:
+            create_connection(("127.0.0.1", self.server.port), 1).close()
+        except OSError:
+            pass
+        self.thread.join(WebServer.SHUTDOWN_TIMEOUT + 1)
+        self.server.listen_socket.close()
+        RequestHandler.access_log.sample_rate = self.sample_rate
+
+    def connect(self):
+        """Open a connection to the server.
+
+        Returns:
+            tuple: The socket, and a file reading its responses.
+        """
+        client = create_connection(("127.0.0.1", self.server.port), 5)
+        self.clients.append(client)
+        return client, client.makefile("rb")
+
+    @staticmethod
+    def read_response(responses):
+        """Read a response, framed by its Content-Length.
+
+        Args:
+            responses (file): The file reading the connection's responses.
+
+        Returns:
+            tuple: The status code (int), header fields (dict) and body
+                (byte string), or None if the connection was closed.
+        """
+        status_line = responses.readline()
+        if not status_line:
+            return None
+        headers = {}
+        for line in iter(responses.readline, b"\r\n"):
+            field, _, value = line.decode("latin-1").partition(":")
+            headers[field] = value.strip()
+        body = responses.read(int(headers.get("Content-Length", 0)))
+        return int(status_line.split()[1]), headers, body
+
+
+class SmartHomeTestCase(TestCase):
+    """Base class of tests of the smart home API, on copies of its files."""
+
+    def setUp(self):
+        """Copy the devices and state files, and make a handler of them."""
+        self.directory = mkdtemp()
+        for name in ("Smart_Devices.json", "smart_blind_01.json"):
+            copy(path.join("Smart_Devices", name), self.directory)
+        devices_file = path.join(self.directory, "Smart_Devices.json")
+        self.handler = SmartDeviceHandler()
+        self.handler.device_registry = DeviceRegistry(devices_file, 0)
+        self.handler.device_state_store = DeviceStateStore(
+            self.directory, reserved_files=[devices_file])
+        self.handler.device_controllers = DeviceControllerPool(
+            controller_factory=DeviceControllerPool.FakeController)
+
+    def tearDown(self):
+        """Remove the copied files."""
+        self.handler.batch_executor.shutdown()
+        rmtree(self.directory)
+
+    def request(self, method, command, body=b"", headers=None):
+        """Send a request to the smart home API.
+
+        Returns:
+            HTTPResponse: The response.
+        """
+        return self.handler.handle_request(make_request(
+            method, SmartDeviceHandler.SMART_HOME_KEY + command, headers,
+            body))
+
+    def post(self, command, body):
+        """Post a JSON body to the smart home API.
+
+        Returns:
+            tuple: The response's status code (int), and its parsed body, or
+                its text if it is not JSON.
+        """
+        response = self.request("POST", command, dumps(body).encode("utf-8"))
+        try:
+            return response.status_code, loads(response.content)
+        except ValueError:
+            return response.status_code, response.content.decode("utf-8")
+
+    @staticmethod
+    def directive(name, payload, endpoint_id="smart_blind_01",
+                  instance="Blind.Position"):
+        """Build a RangeController directive.
+
+        Returns:
+            dict: The directive.
+        """
+        return {"directive": {
+            "header": {"namespace": "Alexa.RangeController", "name": name,
+                       "instance": instance, "payloadVersion": "3",
+                       "messageId": "1"},
+            "endpoint": {"endpointId": endpoint_id},
+            "payload": payload
+        }}
+
+    def position(self):
+        """Find the blind's stored position.
+
+        Returns:
+            int: The position.
+        """
+        state = self.handler.device_state_store.get_state("smart_blind_01")
+        return state["properties"][0]["value"]["current"]